@@ -17,9 +17,46 @@ export type JobStatus =
   | "deferred"
   | "finished"
   | "failed"
+  | "canceled"
   | string;
 
-export type Job = { id: string; status: JobStatus };
+// progresso da etapa corrente (job em execução), gravado pelo worker a cada ~2 s
+export type JobProgresso = {
+  etapa: string | null;   // ex.: "carga_sinapi", "consolidacao"
+  feitos: number;         // linhas/itens processados na etapa
+  total: number | null;   // null quando o tamanho não é conhecido
+  pct?: number;
+  eta_s?: number;
+  decorrido_s: number;
+  lote?: number;          // streaming: lote corrente
+  linhas?: number;        // streaming: linhas do orçamento já lidas
+  atualizado_em: string;
+};
+
+export type Job = {
+  id: string;
+  status: JobStatus;
+  progresso?: JobProgresso;
+  posicao?: number | null; // na fila: posição (0 = próximo)
+  prioridade?: Prioridade;
+  lane?: Lane; // fila escolhida pela API (op + tamanho das entradas)
+  cancelamento?: "solicitado"; // DELETE /jobs/{id} em job em execução, ainda não atendido
+  encerramento?: "canceled" | "deadline"; // por que o job parou antes de terminar
+  error?: string;
+};
+
+// prazo por grupo de etapa, em segundos (ex.: { carga: 300, consolidacao: 600 })
+export type Prazos = Partial<Record<"carga" | "consolidacao" | "export" | string, number>>;
+
+export type ColunarFormato = "parquet" | "arrow";
+
+// "alta" entra na frente da fila (exige papel posto pelo gateway; sem ele → 403); fila cheia/cota esgotada → 429 com Retry-After
+export type Prioridade = "alta" | "normal" | "baixa";
+
+export type Lane = "interativa" | "lote" | "ingestao";
+
+// tabela colunar de um artefato (ex.: "<artefato>.cruzado.parquet")
+export type ColunarEntry = { name: string; size: number | null; url: string };
 
 export type FileEntry = {
   name: string;
@@ -29,6 +66,8 @@ export type FileEntry = {
   // campos extras que a API agora devolve
   size_human?: string;
   mtime_iso?: string;
+  gzip?: boolean; // artefato gravado como .json.gz (servido com Content-Encoding: gzip)
+  colunar?: ColunarEntry[];
 };
 
 export type FilesResponse = {
@@ -46,7 +85,22 @@ export type PrecosAutoPayload = {
   secid?: string;     // ex.: "data/secid.xlsx"
   tol_rel?: number;  // ex.: 0.05
   comparar_desc?: boolean; // default = true
+  desc_sim_min?: number; // 0–1; default 1.0 (descrição exata)
+  sugestoes_k?: number; // códigos sugeridos por CODIGO_NAO_ENCONTRADO (default 5; 0 desativa)
+  detalhe?: "completo" | "divergencias"; // "divergencias": cruzado só com itens divergentes (artefato menor)
+  uf?: string;       // SINAPI: UF da coluna de custo (default "PR")
+  cidade?: string;   // SINAPI: cidade (default "CURITIBA"; opcional se a UF tem uma só)
+  regime?: "CCD" | "CSD"; // SINAPI: desonerado (CCD, default) ou não desonerado (CSD)
+  localidades?: (string | { uf: string; cidade?: string; regime?: "CCD" | "CSD" })[]; // ex.: ["SP", "CSD:PR/CURITIBA"]
+  data_base?: string; // "AAAA-MM" ou "auto" (cabeçalho do orçamento): compara com a release vigente no histórico
+  bancos?: ("SINAPI" | "SUDECAP" | "SECID")[]; // com data_base: bancos lidos só do histórico
+  streaming?: boolean; // orçamentos muito grandes: lê/compara em lotes com memória limitada
+  chunk_rows?: number; // linhas por lote no streaming (default 20000)
+  colunar?: ColunarFormato; // tabelas também em Parquet/Arrow ao lado do JSON
   out_dir?: string;  // ex.: "output"
+  profile?: boolean; // grava cProfile ao lado do artefato
+  prazos?: Prazos;   // falha a etapa que passar do prazo
+  prioridade?: Prioridade; // default "normal"
 };
 
 export type EstruturaAutoPayload = {
@@ -56,9 +110,21 @@ export type EstruturaAutoPayload = {
   sinapi?: string;
   secid?: string;
   out_dir?: string;  // ex.: "output"
+  desc_sim_min?: number; // 0–1; default 1.0 (descrição exata)
+  profundo?: boolean; // explode composições até os insumos (default = false)
+  colunar?: ColunarFormato;
+  profile?: boolean; // grava cProfile ao lado do artefato
+  prazos?: Prazos;
+  prioridade?: Prioridade;
 };
 
-export type CreateJobPayload = PrecosAutoPayload | EstruturaAutoPayload;
+// preços + estrutura + consistência (Σ coeficiente × preço dos filhos) num só job
+export type CompletoAutoPayload = Omit<PrecosAutoPayload, "op" | "localidades" | "data_base" | "bancos" | "streaming" | "chunk_rows"> & {
+  op: "completo_auto";
+  profundo?: boolean;
+};
+
+export type CreateJobPayload = PrecosAutoPayload | EstruturaAutoPayload | CompletoAutoPayload;
 
 // tipos para upload
 export type UploadResponse = {
@@ -79,6 +145,43 @@ export type DataListEntry = {
 };
 export type DataListResponse = { dir: string; files: DataListEntry[] };
 
+// Histórico de preços (releases gravadas pelos jobs, por banco/mês)
+export type HistoricoLinha = {
+  mes: string;          // AAAA-MM
+  codigo: string;
+  localidade: string;   // SINAPI: "CCD:PR/CURITIBA"; demais bancos: ""
+  valor_unit: number | null;
+  descricao?: string;
+};
+export type HistoricoVariacao = HistoricoLinha & {
+  mes_anterior: string | null;
+  dif_abs: number | null;
+  dif_rel: number | null;
+};
+export type HistoricoFiltro = { localidade?: string; desde?: string; ate?: string };
+
+// Retenção (última passada do worker: GET /retencao)
+export type RetencaoAlvo = { bytes: number };
+export type RetencaoRelatorio = {
+  executado_em: string;
+  duracao_s: number;
+  dry_run: boolean;
+  politica: Record<string, number>;
+  jobs_vivos: number;
+  artefatos: RetencaoAlvo & {
+    removidos: { nome: string; motivo: "keep_last" | "max_age" | "max_bytes"; bytes: number }[];
+    arquivos: number;
+    mantidos: number;
+    protegidos: number;
+  };
+  compactados: RetencaoAlvo & { arquivos: number };
+  uploads: RetencaoAlvo & { removidos: string[]; protegidos: number };
+  temporarios: RetencaoAlvo & { removidos: number };
+  bytes_recuperados: number;
+  mb_recuperados: number;
+  erros: string[];
+};
+
 // --------------------
 // Helper de fetch
 // --------------------
@@ -142,10 +245,28 @@ export async function getJob(id: string): Promise<Job> {
   return request<Job>(`/jobs/${encodeURIComponent(id)}`);
 }
 
+// cancela o job (na fila: na hora; em execução: no próximo checkpoint; `forcar` para o work-horse já)
+export async function cancelJob(id: string, forcar = false) {
+  return request<{ id: string; status: "canceled" | "cancel_requested" | "stopping" }>(
+    `/jobs/${encodeURIComponent(id)}${forcar ? "?forcar=true" : ""}`,
+    { method: "DELETE" },
+  );
+}
+
 export async function getJobResult<T = unknown>(id: string): Promise<T> {
   return request<T>(`/jobs/${encodeURIComponent(id)}/result`);
 }
 
+// tabelas Parquet/Arrow do job (payload com `colunar`)
+export async function getJobColunar(id: string) {
+  return request<{ id: string; tabelas: Record<string, ColunarEntry> }>(`/jobs/${encodeURIComponent(id)}/colunar`);
+}
+
+// URL de download (para <a href> / fetch com Range); `url` vem de ColunarEntry
+export function downloadUrl(url: string): string {
+  return `${API_BASE_URL}${url}`;
+}
+
 // ========== UPLOAD ==========
 export async function uploadFile(
   file: File,
@@ -171,6 +292,34 @@ export async function listData(subdir?: string): Promise<DataListResponse> {
   return request<DataListResponse>(`/data/list${qs}`);
 }
 
+// ========== HISTÓRICO DE PREÇOS ==========
+function qs(params: Record<string, string | undefined>): string {
+  const q = new URLSearchParams();
+  for (const [k, v] of Object.entries(params)) if (v) q.set(k, v);
+  const txt = q.toString();
+  return txt ? `?${txt}` : "";
+}
+
+export async function getHistoricoMeses(banco?: string) {
+  return request<{ dir: string; bancos: Record<string, string[]> }>(`/historico${qs({ banco })}`);
+}
+
+export async function getHistorico(banco: string, codigo: string, filtro: HistoricoFiltro & { em?: string } = {}) {
+  return request<{ banco: string; codigo: string; historico: HistoricoLinha[]; em?: string; vigente?: HistoricoLinha[] }>(
+    `/historico/${encodeURIComponent(banco)}/${encodeURIComponent(codigo)}${qs(filtro)}`
+  );
+}
+
+export async function getHistoricoVariacoes(banco: string, codigos: string[], filtro: HistoricoFiltro = {}) {
+  return request<{ banco: string; codigos: string[]; variacoes: HistoricoVariacao[] }>(
+    `/historico/${encodeURIComponent(banco)}/variacoes${qs({ ...filtro, codigos: codigos.join(",") })}`
+  );
+}
+
+export async function getRetencao() {
+  return request<RetencaoRelatorio>(`/retencao`);
+}
+
 // ========== LEGADO (se ainda existir uso no front) ==========
 export async function getPrecos() {
   return request(`/precos`);
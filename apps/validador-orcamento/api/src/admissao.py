@@ -0,0 +1,261 @@
+# apps/validador-orcamento/api/src/admissao.py
+from __future__ import annotations
+
+import ipaddress
+import math
+import os
+import socket
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from fastapi import HTTPException, Request
+from redis import Redis
+from rq import Queue, Worker
+from rq.job import Job
+from rq.registry import StartedJobRegistry
+
+from src import metrics
+
+# ---------------------------------------------------------------------
+# Controle de admissão do POST /jobs
+# ---------------------------------------------------------------------
+# Antes de enfileirar, o job é comparado com três limites (0 = desligado):
+#   - profundidade da fila da lane (jobs aguardando), com teto por prioridade;
+#   - trabalho estimado na fila da lane (bytes somados dos arquivos de entrada);
+#   - cota por usuário (jobs na fila + em execução, somando todas as lanes).
+# Acima do limite: 429 com Retry-After estimado pela duração média observada
+# dos jobs (histograma do worker) e pelo número de workers ouvindo a fila.
+# Os limites são verificados sem lock: rajadas simultâneas podem passar
+# alguns jobs do teto, nunca muitos.
+#
+# Identidade: headers só valem quando a conexão vem de um proxy confiável
+# (ADMISSAO_PROXIES_CONFIAVEIS: IPs, redes CIDR ou nomes, como o `gateway` do
+# compose), que os sobrescreve. Aí o usuário é o header ADMISSAO_HEADER_USUARIO
+# (posto por uma camada de autenticação no gateway) ou, sem ele, o X-Real-IP
+# do cliente; fora disso, o IP da conexão — X-User/X-Real-IP mandados pelo
+# próprio cliente são ignorados. Prioridade "alta" exige que o proxy confiável
+# mande um papel de ADMISSAO_PAPEIS_ALTA no header ADMISSAO_HEADER_PAPEL.
+
+ADMISSAO_MAX_FILA = int(os.getenv("ADMISSAO_MAX_FILA", "50") or 0)
+ADMISSAO_MAX_MB_FILA = int(os.getenv("ADMISSAO_MAX_MB_FILA", "0") or 0)
+# cota por usuário: só faz sentido com identidade confiável (ver acima); default desligada
+ADMISSAO_QUOTA_USUARIO = int(os.getenv("ADMISSAO_QUOTA_USUARIO", "0") or 0)
+# vagas além de ADMISSAO_MAX_FILA só para prioridade "alta"
+ADMISSAO_RESERVA_ALTA = int(os.getenv("ADMISSAO_RESERVA_ALTA", "10") or 0)
+# quem é o usuário: header posto pelo proxy confiável; sem ele, X-Real-IP do proxy ou o IP da conexão
+ADMISSAO_HEADER_USUARIO = os.getenv("ADMISSAO_HEADER_USUARIO", "X-User")
+ADMISSAO_PROXIES_CONFIAVEIS = [
+    x.strip() for x in os.getenv("ADMISSAO_PROXIES_CONFIAVEIS", "").split(",") if x.strip()
+]
+# papel (posto pelo proxy confiável) que autoriza prioridade "alta"; vazio = ninguém
+ADMISSAO_HEADER_PAPEL = os.getenv("ADMISSAO_HEADER_PAPEL", "X-Role")
+ADMISSAO_PAPEIS_ALTA = {
+    x.strip().lower() for x in os.getenv("ADMISSAO_PAPEIS_ALTA", "admin").split(",") if x.strip()
+}
+# duração assumida por job enquanto o worker ainda não registrou nenhuma (s)
+ADMISSAO_DURACAO_PADRAO_S = float(os.getenv("ADMISSAO_DURACAO_PADRAO_S", "120") or 120)
+
+PRIORIDADES = ("alta", "normal", "baixa")
+
+_MB = 1024 * 1024
+
+
+def norm_prioridade(v: Any) -> str:
+    p = str(v or "normal").strip().lower()
+    if p not in PRIORIDADES:
+        raise HTTPException(400, detail="prioridade deve ser 'alta', 'normal' ou 'baixa'.")
+    return p
+
+
+_DNS_TTL_S = 60.0
+_dns_cache: Dict[str, tuple] = {}  # nome -> (expira_em, [ips])
+
+
+def _resolver(nome: str) -> List[str]:
+    agora = time.monotonic()
+    hit = _dns_cache.get(nome)
+    if hit and hit[0] > agora:
+        return hit[1]
+    try:
+        ips = socket.gethostbyname_ex(nome)[2]
+    except OSError:
+        ips = []
+    _dns_cache[nome] = (agora + _DNS_TTL_S, ips)
+    return ips
+
+
+def proxy_confiavel(host: Optional[str]) -> bool:
+    """A conexão vem de um proxy de ADMISSAO_PROXIES_CONFIAVEIS (IP, CIDR ou nome resolvido)?"""
+    if not host or not ADMISSAO_PROXIES_CONFIAVEIS:
+        return False
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    for item in ADMISSAO_PROXIES_CONFIAVEIS:
+        try:
+            if ip in ipaddress.ip_network(item, strict=False):
+                return True
+        except ValueError:
+            if host in _resolver(item):
+                return True
+    return False
+
+
+def _via_proxy(request: Request, header: str) -> str:
+    """Header só quando a conexão vem de proxy confiável (que o sobrescreve); senão ''."""
+    if not proxy_confiavel(request.client.host if request.client else None):
+        return ""
+    return (request.headers.get(header) or "").strip()
+
+
+def usuario(request: Request) -> str:
+    u = _via_proxy(request, ADMISSAO_HEADER_USUARIO) or _via_proxy(request, "X-Real-IP")
+    if u:
+        return u[:128]
+    return request.client.host if request.client else "anonimo"
+
+
+def autorizar_prioridade(request: Request, prioridade: str) -> str:
+    """Prioridade "alta" só com papel autorizado vindo do proxy confiável; senão 403."""
+    if prioridade == "alta":
+        papel = _via_proxy(request, ADMISSAO_HEADER_PAPEL).lower()
+        if not papel or papel not in ADMISSAO_PAPEIS_ALTA:
+            raise HTTPException(403, detail="prioridade 'alta' não autorizada para este usuário.")
+    return prioridade
+
+
+def custo_bytes(app_root: Path, caminhos: Iterable[Optional[str]]) -> int:
+    """Tamanho somado dos arquivos de entrada (relativos a /app); ausentes contam 0."""
+    total = 0
+    for c in caminhos:
+        if not c:
+            continue
+        p = Path(c)
+        p = p if p.is_absolute() else app_root / p
+        try:
+            total += p.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+def limite_fila(prioridade: str) -> int:
+    """Teto de jobs aguardando para a prioridade (0 = sem limite)."""
+    if ADMISSAO_MAX_FILA <= 0:
+        return 0
+    if prioridade == "alta":
+        return ADMISSAO_MAX_FILA + ADMISSAO_RESERVA_ALTA
+    if prioridade == "baixa":
+        return max(1, ADMISSAO_MAX_FILA // 2)
+    return ADMISSAO_MAX_FILA
+
+
+def duracao_media(conn: Redis, op: Optional[str] = None) -> float:
+    """Duração média (s) dos jobs da op, pelo histograma do worker; sem dados, de todas as ops."""
+    key = f"{metrics.KEY_PREFIX}:hist:validador_job_duration_seconds"
+    soma = n = 0.0
+    try:
+        for field, v in conn.hgetall(key).items():
+            lk, _, suffix = field.decode().rpartition("|")
+            if '"stage":"total"' not in lk or (op and f'"op":"{op}"' not in lk):
+                continue
+            if suffix == "sum":
+                soma += float(v)
+            elif suffix == "count":
+                n += float(v)
+    except Exception:
+        return ADMISSAO_DURACAO_PADRAO_S
+    if n:
+        return soma / n
+    return duracao_media(conn) if op else ADMISSAO_DURACAO_PADRAO_S
+
+
+def retry_after(q: Queue, op: str, jobs_a_escoar: int) -> int:
+    """Segundos até `jobs_a_escoar` jobs terminarem, na vazão observada (workers / duração média)."""
+    try:
+        workers = Worker.count(queue=q)
+    except Exception:
+        workers = 0
+    s = max(1, jobs_a_escoar) * duracao_media(q.connection, op) / max(1, workers)
+    return int(min(3600, max(1, math.ceil(s))))
+
+
+def _rejeitar(q: Queue, op: str, motivo: str, detalhe: str, jobs_a_escoar: int) -> None:
+    ra = retry_after(q, op, jobs_a_escoar)
+    metrics.inc(q.connection, "validador_admissao_rejeicoes_total", op=op, motivo=motivo)
+    raise HTTPException(
+        429,
+        detail=f"{detalhe} Tente novamente em ~{ra}s.",
+        headers={"Retry-After": str(ra)},
+    )
+
+
+def admitir(
+    q: Queue,
+    *,
+    op: str,
+    usuario: str,
+    prioridade: str,
+    custo: int,
+    filas: Optional[Sequence[Queue]] = None,
+) -> Dict[str, Any]:
+    """
+    Levanta HTTPException(429, Retry-After) se o job não cabe agora em `q`;
+    senão devolve o meta de admissão gravado no job (usuario, prioridade,
+    custo_bytes). A cota do usuário conta os jobs de todas as `filas` (default: só `q`).
+    """
+    meta = {"usuario": usuario, "prioridade": prioridade, "custo_bytes": custo}
+    if not (ADMISSAO_MAX_FILA > 0 or ADMISSAO_MAX_MB_FILA > 0 or ADMISSAO_QUOTA_USUARIO > 0):
+        return meta
+
+    aguardando = q.get_job_ids()
+    limite = limite_fila(prioridade)
+    if limite and len(aguardando) >= limite:
+        _rejeitar(
+            q, op, "fila",
+            f"Fila cheia: {len(aguardando)} jobs aguardando (limite {limite} para prioridade {prioridade}).",
+            len(aguardando) - limite + 1,
+        )
+
+    if not (ADMISSAO_MAX_MB_FILA > 0 or ADMISSAO_QUOTA_USUARIO > 0):
+        return meta
+
+    def _metas(ids):
+        return [j.meta or {} for j in Job.fetch_many(ids, connection=q.connection) if j is not None]
+
+    fila = _metas(aguardando)
+
+    if ADMISSAO_QUOTA_USUARIO > 0:
+        metas = list(fila)
+        for f in filas or [q]:
+            if f.name != q.name:
+                metas += _metas(f.get_job_ids())
+            metas += _metas(StartedJobRegistry(queue=f).get_job_ids())
+        ativos = sum(1 for m in metas if m.get("usuario") == usuario)
+        if ativos >= ADMISSAO_QUOTA_USUARIO:
+            _rejeitar(
+                q, op, "quota",
+                f"Cota por usuário: {ativos} jobs ativos de '{usuario}' (limite {ADMISSAO_QUOTA_USUARIO}).",
+                ativos - ADMISSAO_QUOTA_USUARIO + 1,
+            )
+
+    if ADMISSAO_MAX_MB_FILA > 0 and prioridade != "alta":
+        na_fila = [int(m.get("custo_bytes") or 0) for m in fila]
+        total = sum(na_fila) + custo
+        teto = ADMISSAO_MAX_MB_FILA * _MB
+        if na_fila and total > teto:
+            # quantos jobs (os mais antigos primeiro) precisam sair para caber
+            excesso, n = total - teto, 0
+            for b in na_fila:
+                excesso -= b
+                n += 1
+                if excesso <= 0:
+                    break
+            _rejeitar(
+                q, op, "bytes",
+                f"Trabalho na fila: {round(total / _MB, 2)} MB de entradas (limite {ADMISSAO_MAX_MB_FILA} MB).",
+                n,
+            )
+    return meta
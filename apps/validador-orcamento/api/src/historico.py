@@ -0,0 +1,148 @@
+# apps/validador-orcamento/api/src/historico.py
+from __future__ import annotations
+
+import re
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+# ---------------------------------------------------------------------
+# Consulta ao histórico de preços gravado pelo worker
+# ---------------------------------------------------------------------
+# Contrato (ver worker: cruzar_orcamento/core/historico.py):
+#   <raiz>/banco=<BANCO>/mes=<AAAA-MM>/<parte>.parquet
+#   colunas: codigo (canônico), descricao, unidade, valor_unit, localidade
+# A API só lê: filtro de banco/mês poda partições (diretórios) e a projeção
+# de colunas evita ler `descricao`/`unidade` quando não são pedidas.
+
+PARTICOES = ds.partitioning(pa.schema([("banco", pa.string()), ("mes", pa.string())]), flavor="hive")
+
+# Espelhos exatos do worker (mesmas entradas → mesmas chaves; conferidos por
+# worker/scripts/test_historico_api.py): a API roda em outra imagem e não
+# importa o pacote do worker.
+_MES_RE = re.compile(r"(?<!\d)(20\d{2})[-_./]?(0[1-9]|1[0-2])(?!\d)")
+_MES_INV_RE = re.compile(r"(?<!\d)(0[1-9]|1[0-2])[-_./](20\d{2})(?!\d)")
+_BANCO_RE = re.compile(r"^[A-Z0-9_]+$")
+
+
+def norm_mes(x: Any) -> str:
+    """Igual a core.historico.norm_mes: '2025-06', '2025_06', '202506', '06/2025', date → '2025-06'."""
+    if isinstance(x, (date, datetime)):
+        return f"{x.year:04d}-{x.month:02d}"
+    s = str(x or "").strip()
+    m = _MES_RE.fullmatch(s) or _MES_RE.match(s)
+    if m:
+        return f"{m.group(1)}-{m.group(2)}"
+    m = _MES_INV_RE.fullmatch(s)
+    if m:
+        return f"{m.group(2)}-{m.group(1)}"
+    raise ValueError(f"Mês inválido: {x!r} (use AAAA-MM).")
+
+
+def norm_banco(x: Any) -> str:
+    b = str(x or "").strip().upper()
+    if not _BANCO_RE.fullmatch(b):
+        raise ValueError(f"Banco inválido: {x!r}")
+    return b
+
+
+def norm_codigo(x: Any) -> str:
+    """Igual a utils_code.norm_code_canonical do worker (a chave `codigo` gravada no histórico)."""
+    if x is None:
+        return ""
+    s = str(x).strip()
+    if s == "" or s.lower() in ("nan", "none"):
+        return ""
+    # dígitos com possível sufixo .0, .00 etc.
+    m = re.fullmatch(r"(\d+)(?:\.0+)?", s)
+    if m:
+        return m.group(1).lstrip("0") or "0"
+    # segmentado por pontos: só segmentos numéricos perdem zeros à esquerda
+    if "." in s:
+        return ".".join((p.lstrip("0") or "0") if p.isdigit() else p for p in (q.strip() for q in s.split(".")))
+    if s.isdigit():
+        return s.lstrip("0") or "0"
+    # numérico genérico (ex.: "1e3")
+    try:
+        f = float(s)
+        if f.is_integer():
+            return str(int(f))
+    except Exception:
+        pass
+    return s
+
+
+def meses(raiz: Path, banco: Optional[str] = None) -> Dict[str, List[str]]:
+    """{banco: [meses]} a partir dos diretórios (não abre nenhum arquivo)."""
+    out: Dict[str, List[str]] = {}
+    if not raiz.exists():
+        return out
+    alvo = norm_banco(banco) if banco else None
+    for b in sorted(raiz.glob("banco=*")):
+        nome = b.name.split("=", 1)[1]
+        if alvo and nome != alvo:
+            continue
+        ms = sorted(m.name.split("=", 1)[1] for m in b.glob("mes=*") if any(m.glob("*.parquet")))
+        if ms:
+            out[nome] = ms
+    return out
+
+
+def historico(
+    raiz: Path,
+    banco: str,
+    codigos: Iterable[Any],
+    *,
+    localidade: Optional[str] = None,
+    desde: Optional[Any] = None,
+    ate: Optional[Any] = None,
+    colunas: Sequence[str] = ("mes", "codigo", "localidade", "valor_unit", "descricao"),
+) -> List[Dict[str, Any]]:
+    banco = norm_banco(banco)
+    codes = sorted({c for c in (norm_codigo(x) for x in codigos) if c})
+    if not codes:
+        raise ValueError("Informe ao menos um código.")
+    if not meses(raiz, banco):
+        return []
+    f = (ds.field("banco") == banco) & ds.field("codigo").isin(codes)
+    if desde:
+        f &= ds.field("mes") >= norm_mes(desde)
+    if ate:
+        f &= ds.field("mes") <= norm_mes(ate)
+    if localidade is not None:
+        loc = str(localidade).strip().upper()
+        # "CCD:PR" (sem cidade) casa pelo prefixo "CCD:PR/", como no worker
+        f &= (ds.field("localidade") == loc) if "/" in loc or not loc else pc.starts_with(ds.field("localidade"), pattern=loc + "/")
+    tab = ds.dataset(raiz, format="parquet", partitioning=PARTICOES).to_table(columns=list(colunas), filter=f)
+    return tab.sort_by([("codigo", "ascending"), ("localidade", "ascending"), ("mes", "ascending")]).to_pylist()
+
+
+def vigente(linhas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Última release de cada localidade (linhas já ordenadas por mês)."""
+    ultimo: Dict[str, Dict[str, Any]] = {}
+    for r in linhas:
+        ultimo[r["localidade"]] = r
+    return [ultimo[k] for k in sorted(ultimo)]
+
+
+def variacoes(linhas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Variação de cada release em relação à anterior do mesmo (codigo, localidade)."""
+    out: List[Dict[str, Any]] = []
+    prev: Optional[Dict[str, Any]] = None
+    for r in linhas:
+        mesma = prev is not None and prev["codigo"] == r["codigo"] and prev["localidade"] == r["localidade"]
+        a = prev["valor_unit"] if mesma else None
+        b = r["valor_unit"]
+        dif = round(b - a, 6) if a is not None and b is not None else None
+        out.append({
+            **r,
+            "mes_anterior": prev["mes"] if mesma else None,
+            "dif_abs": dif,
+            "dif_rel": round(dif / abs(a), 6) if dif is not None and a else None,
+        })
+        prev = r
+    return out
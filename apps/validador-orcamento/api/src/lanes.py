@@ -0,0 +1,59 @@
+# apps/validador-orcamento/api/src/lanes.py
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List, Optional
+
+from redis import Redis
+from rq import Queue
+
+# ---------------------------------------------------------------------
+# Lanes: em qual fila RQ cada job entra
+# ---------------------------------------------------------------------
+# Os nomes das filas são os mesmos do worker (worker: src/lanes.py):
+#   - interativa → QUEUE_NAME (a fila de sempre): conferência de um orçamento
+#     pequeno, preços ou estrutura, sem streaming nem explosão profunda;
+#   - lote → QUEUE_NAME-lote: orçamentos grandes, streaming, completo, profundo;
+#   - ingestao → QUEUE_NAME-ingestao: bancos de entrada muito grandes (carga de
+#     uma release inteira), além da manutenção agendada pelo worker.
+# Assim uma conferência rápida não espera atrás de um lote de 50 orçamentos
+# ou de uma carga do SINAPI; os workers escolhem como dividir a capacidade
+# entre as lanes (RQ_LANES / RQ_LANE_MODE no worker).
+
+# QUEUE_NAME no formato antigo ("a,b"): o 1º nome é a base das lanes; os demais
+# são filas avulsas que só o worker consome (worker: src/lanes.py)
+QUEUE_NAME = (os.getenv("QUEUE_NAME", "validador").split(",")[0].strip() or "validador")
+LANES = ("interativa", "lote", "ingestao")
+
+# orçamento (arquivo `orc`) acima disto sai da interativa (MB)
+LANE_INTERATIVA_MAX_MB = float(os.getenv("LANE_INTERATIVA_MAX_MB", "2") or 0)
+# bancos de entrada (sinapi + sudecap + secid) acima disto vão para a ingestão (MB; 0 = nunca)
+LANE_INGESTAO_MIN_MB = float(os.getenv("LANE_INGESTAO_MIN_MB", "100") or 0)
+
+_MB = 1024 * 1024
+
+
+def fila(lane: str) -> str:
+    return QUEUE_NAME if lane == "interativa" else f"{QUEUE_NAME}-{lane}"
+
+
+def queues(conn: Redis) -> List[Queue]:
+    return [Queue(name=fila(l), connection=conn) for l in LANES]
+
+
+def lane_de(nome_fila: Optional[str]) -> Optional[str]:
+    for l in LANES:
+        if fila(l) == nome_fila:
+            return l
+    return None
+
+
+def escolher(op: str, kwargs: Dict[str, Any], bytes_orc: int, bytes_bancos: int) -> str:
+    """Lane do job pela op e pelo tamanho estimado das entradas."""
+    if LANE_INGESTAO_MIN_MB > 0 and bytes_bancos > LANE_INGESTAO_MIN_MB * _MB:
+        return "ingestao"
+    if op == "completo_auto" or kwargs.get("streaming") or kwargs.get("profundo"):
+        return "lote"
+    if bytes_orc > LANE_INTERATIVA_MAX_MB * _MB:
+        return "lote"
+    return "interativa"
@@ -1,32 +1,59 @@
 # apps/validador-orcamento/api/src/main.py
 from __future__ import annotations
 
-import json
+import gzip
 import os
 import re
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
+from time import perf_counter
 from typing import Any, Dict, List, Optional
 from datetime import datetime, timezone
 
-from fastapi import FastAPI, HTTPException, Body, UploadFile, File, Form, Query
+from fastapi import FastAPI, HTTPException, Body, UploadFile, File, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 
 # RQ / Redis
 from redis import Redis
 from rq import Queue
+from rq.command import send_stop_job_command
 from rq.job import Job
 
+from src import admissao as adm, lanes, metrics, historico as hist
+
 # ---------------------------------------------------------------------
 # Config
 # ---------------------------------------------------------------------
 APP_ROOT = Path("/app")
 OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR") or (APP_ROOT / "output"))
 DATA_DIR = Path(os.getenv("DATA_DIR") or (APP_ROOT / "data"))
+# histórico de preços gravado pelo worker (Parquet por banco/mês)
+HISTORY_DIR = Path(os.getenv("HISTORY_DIR") or (OUTPUT_DIR / "historico"))
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/1")
 QUEUE_NAME = os.getenv("QUEUE_NAME", "validador")
 
+# downloads de artefatos: JSON e tabelas colunares gravadas pelo worker
+# ('<artefato>.<tabela>.parquet|.arrow', ver worker: exporters/colunar.py)
+MEDIA_TYPES = {
+    ".json": "application/json",
+    ".parquet": "application/vnd.apache.parquet",
+    ".arrow": "application/vnd.apache.arrow.file",
+    ".gz": "application/gzip",
+}
+COLUNAR_FORMATOS = ("parquet", "arrow")
+
+# retenção (worker: src/retention.py): uploads registrados aqui podem ser
+# removidos depois de RETENTION_UPLOAD_MAX_AGE_DAYS; o relatório da última
+# passada fica em RETENCAO_REPORT_KEY
+UPLOADS_KEY = "uploads:registro"
+RETENCAO_REPORT_KEY = "retencao:ultimo"
+
+# pedido de cancelamento lido pelo worker (src/control.py); expira junto com o job_timeout
+CANCEL_KEY = "cancel:{job_id}"
+CANCEL_TTL_S = 60 * 60
+
 # limite opcional para upload (MB)
 MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "200"))
 
@@ -45,32 +72,116 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def _request_latency(request: Request, call_next):
+    """
+    Latência por rota (template, ex.: /jobs/{job_id}) → validador_http_request_duration_seconds.
+    Só acumula em memória (`_METRICAS`); o Redis é escrito fora do event loop.
+    """
+    t0 = perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "<nao_roteado>"
+        if path != "/metrics":
+            _METRICAS.observe(
+                "validador_http_request_duration_seconds", perf_counter() - t0,
+                metrics.LATENCY_BUCKETS, method=request.method, route=path, status=status,
+            )
+
 # ---------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------
-def _read_json(path: Path):
-    if not path.exists():
-        raise HTTPException(status_code=404, detail=f"{path.name} não encontrado")
+def _etag(st: os.stat_result, variante: str = "") -> str:
+    # artefatos não mudam depois do rename atômico do worker: tamanho + mtime bastam
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}{variante}"'
+
+def _nao_modificado(request: Request, etag: str, mtime: float) -> bool:
+    """If-None-Match (prioridade) ou If-Modified-Since → 304."""
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = [t.strip().removeprefix("W/") for t in inm.split(",")]
+        return "*" in tags or etag in tags
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(mtime) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _aceita_gzip(request: Request) -> bool:
+    for parte in request.headers.get("accept-encoding", "").split(","):
+        nome, _, params = parte.strip().partition(";")
+        if nome.strip().lower() in ("gzip", "*"):
+            q = params.strip().removeprefix("q=")
+            return not params or q not in ("0", "0.0", "0.00", "0.000")
+    return False
+
+def _gunzip(path: Path, bloco: int = 1 << 16):
+    with gzip.open(path, "rb") as f:
+        while chunk := f.read(bloco):
+            yield chunk
+
+def _json_artifact(request: Request, path: Path) -> Response:
+    """
+    Artefato JSON como está no disco. '.json.gz' sai com Content-Encoding: gzip,
+    sem descompactar; só um cliente que não aceita gzip (ex.: curl sem
+    --compressed) recebe o JSON descompactado em streaming. ETag/Last-Modified
+    com If-None-Match/If-Modified-Since → 304.
+    """
     try:
-        with path.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Falha ao ler {path.name}: {e}")
-
-def _queue() -> Queue:
+        st = path.stat()
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"{path.name} não encontrado")
+    gz = path.suffix == ".gz"
+    passthrough = gz and _aceita_gzip(request)
+    etag = _etag(st, "-gz" if passthrough else "")
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if gz:
+        headers["Vary"] = "Accept-Encoding"
+    if _nao_modificado(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+    if passthrough:
+        return FileResponse(path, media_type="application/json", headers={**headers, "Content-Encoding": "gzip"})
+    if gz:
+        return StreamingResponse(_gunzip(path), media_type="application/json", headers=headers)
+    return FileResponse(path, media_type="application/json", headers=headers)
+
+def _queue(lane: str = "interativa") -> Queue:
+    """Fila RQ da lane (ver src/lanes.py); a interativa é QUEUE_NAME."""
     conn = Redis.from_url(
         REDIS_URL,
         socket_timeout=5,
         health_check_interval=30,
         retry_on_timeout=True,
     )
-    return Queue(name=QUEUE_NAME, connection=conn)
+    return Queue(name=lanes.fila(lane), connection=conn)
+
+_REDIS: Optional[Redis] = None
+def _redis() -> Redis:
+    """Conexão compartilhada (pool) para métricas; evita abrir uma por requisição."""
+    global _REDIS
+    if _REDIS is None:
+        _REDIS = Redis.from_url(REDIS_URL, socket_timeout=2, health_check_interval=30)
+    return _REDIS
+
+# histogramas do caminho das requisições (latência, uploads): buffer + flush em thread
+_METRICAS = metrics.Buffer(_redis)
 
 def _latest_by_prefix(prefix: str) -> Optional[Path]:
     if not OUTPUT_DIR.exists():
         return None
     cands = sorted(
-        OUTPUT_DIR.glob(f"{prefix}_*.json"),
+        [*OUTPUT_DIR.glob(f"{prefix}_*.json"), *OUTPUT_DIR.glob(f"{prefix}_*.json.gz")],
         key=lambda p: p.stat().st_mtime if p.exists() else 0,
         reverse=True,
     )
@@ -96,6 +207,94 @@ def _ensure_under(base: Path, p: Path) -> None:
     except Exception:
         raise HTTPException(400, detail="Destino inválido (fora da área permitida).")
     
+_RANGE_RE = re.compile(r"^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$", re.IGNORECASE)
+_RANGE_CHUNK = 256 * 1024
+
+def _faixa(request: Request, tamanho: int, etag: str, mtime: float) -> Optional[tuple]:
+    """
+    Range de um único intervalo de bytes → (início, fim) inclusivo; None = arquivo
+    inteiro (sem Range, If-Range que não bate, vários intervalos ou cabeçalho
+    malformado: RFC 9110 manda ignorar). Intervalo fora do arquivo → 416.
+    """
+    rng = request.headers.get("range")
+    if not rng:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range:
+        if_range = if_range.strip()
+        if if_range.startswith(("\"", "W/")):
+            if if_range != etag:  # comparação forte: ETag fraca nunca casa
+                return None
+        else:
+            try:
+                if int(mtime) > parsedate_to_datetime(if_range).timestamp():
+                    return None
+            except (TypeError, ValueError):
+                return None
+    m = _RANGE_RE.match(rng)
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    ini_s, fim_s = m.group(1), m.group(2)
+    if ini_s:
+        ini = int(ini_s)
+        fim = min(int(fim_s), tamanho - 1) if fim_s else tamanho - 1
+        if fim_s and int(fim_s) < ini:
+            return None
+    else:  # sufixo: últimos N bytes
+        n = int(fim_s)
+        if n == 0:
+            ini, fim = tamanho, tamanho - 1  # insatisfazível
+        else:
+            ini, fim = max(0, tamanho - n), tamanho - 1
+    if ini >= tamanho or ini > fim:
+        raise HTTPException(
+            416, detail="Range fora do arquivo.", headers={"Content-Range": f"bytes */{tamanho}"},
+        )
+    return ini, fim
+
+def _ler_faixa(p: Path, ini: int, fim: int):
+    with open(p, "rb") as f:
+        f.seek(ini)
+        falta = fim - ini + 1
+        while falta > 0:
+            bloco = f.read(min(_RANGE_CHUNK, falta))
+            if not bloco:
+                break
+            falta -= len(bloco)
+            yield bloco
+
+def _download(request: Request, p: Path) -> Response:
+    """
+    Arquivo de OUTPUT_DIR como download, byte a byte como está no disco ('.json.gz'
+    sai como application/gzip). Range de um intervalo (com If-Range) responde 206
+    só com a fatia pedida, ou 416 se o intervalo cai fora do arquivo; feito aqui
+    porque o FileResponse do starlette fixado (0.38) não trata Range.
+    """
+    _ensure_under(OUTPUT_DIR, p)
+    media_type = MEDIA_TYPES.get(p.suffix.lower())
+    if media_type is None:
+        raise HTTPException(400, detail="Tipo de arquivo não servido.")
+    if not p.is_file():
+        raise HTTPException(404, detail=f"{p.name} não encontrado")
+    st = p.stat()
+    headers = {
+        "ETag": _etag(st),
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+    if _nao_modificado(request, headers["ETag"], st.st_mtime):
+        return Response(status_code=304, headers=headers)
+    faixa = _faixa(request, st.st_size, headers["ETag"], st.st_mtime)
+    if faixa is None:
+        return FileResponse(p, media_type=media_type, filename=p.name, headers=headers)
+    ini, fim = faixa
+    headers.update({
+        "Content-Range": f"bytes {ini}-{fim}/{st.st_size}",
+        "Content-Length": str(fim - ini + 1),
+        "Content-Disposition": f'attachment; filename="{p.name}"',
+    })
+    return StreamingResponse(_ler_faixa(p, ini, fim), status_code=206, media_type=media_type, headers=headers)
+
 def _resolve_subdir(subdir: Optional[str]) -> Path:
     """
     Constrói DATA_DIR/<subdir-sanitizada-preservando-subpastas>.
@@ -127,6 +326,7 @@ def health():
         "output_dir": str(OUTPUT_DIR),
         "data_dir": str(DATA_DIR),
         "queue": QUEUE_NAME,
+        "filas": {l: lanes.fila(l) for l in lanes.LANES},
         "max_upload_mb": MAX_UPLOAD_MB,
     }
     try:
@@ -138,9 +338,25 @@ def health():
         info["ok"] = False
     return info
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Métricas no formato texto do Prometheus: profundidade/espera das filas,
+    duração dos jobs por op/etapa, vazão dos adapters, tamanho de artefatos e
+    uploads, latência da API por rota. As métricas do worker chegam via Redis,
+    já agregadas entre todos os work-horses.
+    """
+    conn = _redis()
+    _METRICAS.flush()
+    try:
+        body = metrics.render(conn, lanes.queues(conn))
+    except Exception as e:
+        raise HTTPException(503, detail=f"Falha ao coletar métricas: {e}")
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/files")
 def list_files():
-    """Lista os JSONs gerados em OUTPUT_DIR, mais recentes primeiro."""
+    """Lista os JSONs gerados em OUTPUT_DIR (.json e .json.gz), mais recentes primeiro."""
     def _size_human(n: int) -> str:
         units = ["B", "KB", "MB", "GB", "TB"]
         f = float(n)
@@ -150,12 +366,24 @@ def list_files():
             f /= 1024.0
 
     files: List[dict] = []
+    # tabelas colunares de cada artefato: '<artefato>.<tabela>.parquet|.arrow'
+    colunares: Dict[str, List[dict]] = {}
     if OUTPUT_DIR.exists():
-        for p in OUTPUT_DIR.glob("*.json"):
+        for ext in (".parquet", ".arrow"):
+            for p in OUTPUT_DIR.glob(f"*{ext}"):
+                try:
+                    size = p.stat().st_size
+                except FileNotFoundError:
+                    continue
+                colunares.setdefault(p.name.split(".", 1)[0], []).append(
+                    {"name": p.name, "size": size, "url": f"/files/{p.name}"}
+                )
+        for p in [*OUTPUT_DIR.glob("*.json"), *OUTPUT_DIR.glob("*.json.gz")]:
             try:
                 st = p.stat()
             except FileNotFoundError:
                 continue
+            stem = p.name.split(".", 1)[0]
             files.append({
                 "name": p.name,
                 "path": str(p),
@@ -163,25 +391,107 @@ def list_files():
                 "size_human": _size_human(st.st_size),
                 "mtime": st.st_mtime,
                 "mtime_iso": datetime.fromtimestamp(st.st_mtime, tz=timezone.utc).isoformat(),
+                "gzip": p.suffix == ".gz",
+                **({"colunar": sorted(colunares[stem], key=lambda c: c["name"])} if stem in colunares else {}),
             })
 
     files.sort(key=lambda f: f["mtime"], reverse=True)
     return {"output_dir": str(OUTPUT_DIR), "count": len(files), "files": files}
 
+@app.get("/retencao")
+def get_retencao():
+    """Relatório da última passada de retenção do worker (o que foi removido/compactado e quanto foi recuperado)."""
+    try:
+        raw = _redis().get(RETENCAO_REPORT_KEY)
+    except Exception as e:
+        raise HTTPException(503, detail=f"Redis indisponível: {e}")
+    if not raw:
+        raise HTTPException(404, detail="Nenhuma passada de retenção registrada ainda.")
+    return Response(raw, media_type="application/json")
+
+@app.get("/files/{name}")
+def download_file(name: str, request: Request):
+    """Baixa um artefato de OUTPUT_DIR (JSON, JSON gzip, Parquet ou Arrow), com suporte a Range."""
+    if _safe_filename(name) != name or name.startswith("."):
+        raise HTTPException(400, detail="Nome de arquivo inválido.")
+    return _download(request, OUTPUT_DIR / name)
+
 # --- Legado/compat: devolvem o artefato mais recente do tipo ---
 @app.get("/precos")
-def get_precos():
+def get_precos(request: Request):
     p = _latest_by_prefix("precos")
     if not p:
         raise HTTPException(404, detail="Nenhum arquivo de preços encontrado.")
-    return _read_json(p)
+    return _json_artifact(request, p)
 
 @app.get("/estrutura")
-def get_estrutura():
+def get_estrutura(request: Request):
     p = _latest_by_prefix("estrutura")
     if not p:
         raise HTTPException(404, detail="Nenhum arquivo de estrutura encontrado.")
-    return _read_json(p)
+    return _json_artifact(request, p)
+
+@app.get("/completo")
+def get_completo(request: Request):
+    p = _latest_by_prefix("completo")
+    if not p:
+        raise HTTPException(404, detail="Nenhum arquivo completo encontrado.")
+    return _json_artifact(request, p)
+
+# ---------------------------------------------------------------------
+# Histórico de preços dos bancos (releases gravadas pelos jobs)
+# ---------------------------------------------------------------------
+def _historico(banco: str, codigos: List[str], localidade: Optional[str],
+               desde: Optional[str], ate: Optional[str], colunas=None) -> List[Dict[str, Any]]:
+    kw = {"colunas": colunas} if colunas else {}
+    try:
+        return hist.historico(HISTORY_DIR, banco, codigos, localidade=localidade, desde=desde, ate=ate, **kw)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(500, detail=f"Falha ao ler o histórico: {e}")
+
+@app.get("/historico")
+def historico_meses(banco: Optional[str] = Query(None, description="SINAPI, SUDECAP ou SECID")):
+    """Releases registradas: {banco: [AAAA-MM, ...]}."""
+    try:
+        return {"dir": str(HISTORY_DIR), "bancos": hist.meses(HISTORY_DIR, banco)}
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+
+@app.get("/historico/{banco}/variacoes")
+def historico_variacoes(
+    banco: str,
+    codigos: str = Query(..., description="Códigos separados por vírgula"),
+    localidade: Optional[str] = Query(None, description='SINAPI: ex. "CCD:PR/CURITIBA"'),
+    desde: Optional[str] = Query(None, description="AAAA-MM"),
+    ate: Optional[str] = Query(None, description="AAAA-MM"),
+):
+    """Variação mês a mês (dif_abs/dif_rel contra a release anterior) de cada código."""
+    lista = [c for c in codigos.split(",") if c.strip()]
+    linhas = _historico(banco, lista, localidade, desde, ate, colunas=("mes", "codigo", "localidade", "valor_unit"))
+    return {"banco": banco.upper(), "codigos": lista, "variacoes": hist.variacoes(linhas)}
+
+@app.get("/historico/{banco}/{codigo}")
+def historico_codigo(
+    banco: str,
+    codigo: str,
+    localidade: Optional[str] = Query(None, description='SINAPI: ex. "CCD:PR/CURITIBA"'),
+    desde: Optional[str] = Query(None, description="AAAA-MM"),
+    ate: Optional[str] = Query(None, description="AAAA-MM"),
+    em: Optional[str] = Query(None, description="Data-base AAAA-MM: devolve também o preço vigente nela"),
+):
+    """Preço do código em cada release registrada (e, com `em`, o vigente naquela data-base)."""
+    linhas = _historico(banco, [codigo], localidade, desde, ate)
+    out: Dict[str, Any] = {"banco": banco.upper(), "codigo": codigo, "historico": linhas}
+    if em:
+        try:
+            alvo = hist.norm_mes(em)
+        except ValueError as e:
+            raise HTTPException(400, detail=str(e))
+        out["em"] = alvo
+        out["vigente"] = hist.vigente([r for r in linhas if r["mes"] <= alvo])
+    return out
 
 # ---------------------------------------------------------------------
 # UPLOADS para shared/data
@@ -242,6 +552,11 @@ async def upload_file(
     rel_for_jobs = str(dest_path.relative_to(APP_ROOT))
 
     await file.close()  # boa prática: fecha explicitamente o UploadFile
+    _METRICAS.observe("validador_upload_bytes", written, metrics.BYTES_BUCKETS)
+    try:
+        _redis().zadd(UPLOADS_KEY, {rel_for_jobs: datetime.now(timezone.utc).timestamp()})
+    except Exception:
+        pass  # sem registro o upload só não entra na retenção
 
     return JSONResponse(
         status_code=201,
@@ -280,23 +595,90 @@ def list_data(subdir: Optional[str] = Query(None, description="Subpasta em /app/
 # JOBS (via Redis/RQ)
 # ---------------------------------------------------------------------
 
+def _enfileirar(
+    func: str,
+    kwargs: Dict[str, Any],
+    *,
+    op: str,
+    usuario: str,
+    prioridade: str,
+    bytes_orc: int,
+    bytes_bancos: int,
+) -> JSONResponse:
+    """
+    Escolhe a lane do job (op + tamanho das entradas), passa pelo controle de
+    admissão daquela fila (429 se não couber) e enfileira; prioridade alta
+    entra na frente da fila.
+    """
+    lane = lanes.escolher(op, kwargs, bytes_orc, bytes_bancos)
+    q = _queue(lane)
+    meta = adm.admitir(
+        q,
+        op=op.removesuffix("_auto"),
+        usuario=usuario,
+        prioridade=prioridade,
+        custo=bytes_orc + bytes_bancos,
+        filas=lanes.queues(q.connection),
+    )
+    meta["lane"] = lane
+    job = q.enqueue(
+        func,
+        kwargs=kwargs,
+        job_timeout=60 * 60,        # 1h
+        result_ttl=60 * 60 * 24,    # 1d
+        failure_ttl=60 * 60 * 24,   # 1d
+        at_front=meta["prioridade"] == "alta",
+        meta=meta,
+    )
+    return JSONResponse(
+        status_code=201,
+        content={"id": job.id, "status": job.get_status()},
+        headers={"Location": f"/jobs/{job.id}"},
+    )
+
 @app.post("/jobs")
-def create_job(payload: Dict[str, Any] = Body(...)):
+def create_job(request: Request, payload: Dict[str, Any] = Body(...)):
     """
     Cria um job (RQ) para o worker processar e gerar JSONs em `out_dir`.
 
     Operações suportadas:
       - "precos_auto"
       - "estrutura_auto"
+      - "completo_auto" (preços + estrutura + consistência de preços num só job e artefato)
 
     Observações:
       - Caminhos podem ser relativos ao /app do worker (ex.: "data/...", "output")
         ou absolutos ("/app/...").
       - Agora apenas 'orc' é obrigatório; SINAPI/SUDECAP/SECID são opcionais,
         mas é necessário informar **ao menos um** deles.
+      - `profile: true` ativa o cProfile no worker para este job.
+      - `mem_budget_mb` define o orçamento de memória do job (falha com erro claro se estourar).
+      - `desc_sim_min` (0–1, default 1.0 = comparação exata) aceita descrições parecidas.
+      - `sugestoes_k` (preços, default 5) códigos sugeridos por código não encontrado.
+      - `uf`/`cidade`/`regime` (preços) escolhem a coluna SINAPI; `localidades` compara
+        com outras colunas (ex.: ["SP", "CSD:PR/CURITIBA"]) sem reler a planilha.
+      - `profundo: true` (estrutura) compara as composições explodidas até os insumos.
+      - `data_base` (preços; "AAAA-MM" ou "auto") compara com a release vigente no histórico
+        de preços; `bancos` (ex.: ["SINAPI"]) dispensa os arquivos dos bancos.
+      - `streaming: true` (preços) lê o orçamento em lotes de `chunk_rows` linhas
+        (default 20000) com memória limitada; o artefato sai igual.
+      - `colunar: "parquet" | "arrow"` grava também as tabelas (cruzado, divergencias, ...)
+        em arquivos colunares, baixados por `GET /jobs/{id}/colunar/{tabela}`.
+      - `detalhe: "divergencias"` (preços/completo) deixa em `cruzado` só os itens divergentes
+        (sem itens ok nem blocos nao_aplicavel); o `resumo` continua exato.
+      - `prazos` (ex.: {"carga": 300, "consolidacao": 600}, em segundos) falha a etapa que
+        passar do prazo do seu grupo (`carga_*`, `consolidacao_*`, `export_*`, ...).
+      - `prioridade: "alta" | "normal" | "baixa"` (default normal): alta entra na frente da
+        fila e tem vagas reservadas, e exige papel autorizado posto pelo gateway (403 sem
+        ele); baixa só ocupa metade da fila (ver src/admissao.py).
+
+    Lane: o job vai para a fila interativa, de lote ou de ingestão conforme a op e o
+    tamanho das entradas (ver src/lanes.py).
+
+    Controle de admissão (por lane): fila cheia, trabalho na fila (MB de entradas) acima do limite
+    ou cota do usuário esgotada → 429 com `Retry-After`.
     """
     op = (payload.get("op") or "").strip().lower()
-    q = _queue()
 
     # obrigatório
     orc = payload.get("orc")
@@ -308,7 +690,14 @@ def create_job(payload: Dict[str, Any] = Body(...)):
     sudecap  = payload.get("sudecap") or None
     secid    = payload.get("secid") or None
     bancos_informados = [b for b in (sinapi, sudecap, secid) if b]
-    if not bancos_informados:
+    # com data_base (preços), os bancos podem vir só do histórico: "bancos": ["SINAPI", ...]
+    bancos_hist = payload.get("bancos") if op == "precos_auto" and payload.get("data_base") else None
+    if bancos_hist is not None:
+        if not isinstance(bancos_hist, list) or not all(
+            str(b).strip().upper() in ("SINAPI", "SUDECAP", "SECID") for b in bancos_hist
+        ):
+            raise HTTPException(400, detail='bancos deve ser lista com SINAPI, SUDECAP e/ou SECID.')
+    if not bancos_informados and not bancos_hist:
         raise HTTPException(400, detail="Informe ao menos um banco: sinapi, sudecap ou secid.")
 
     # base kwargs comuns
@@ -322,6 +711,48 @@ def create_job(payload: Dict[str, Any] = Body(...)):
         base_kwargs["sudecap"] = sudecap
     if secid:
         base_kwargs["secid"] = secid
+    # profiler opcional (grava '<tipo>_<job>_<ts>.prof' ao lado do JSON)
+    if payload.get("profile"):
+        base_kwargs["profile"] = True
+    # orçamento de memória por job (MB); sem isso vale JOB_MEM_BUDGET_MB do worker
+    if payload.get("mem_budget_mb") is not None:
+        try:
+            base_kwargs["mem_budget_mb"] = int(payload["mem_budget_mb"])
+        except (TypeError, ValueError):
+            raise HTTPException(400, detail="mem_budget_mb deve ser inteiro (MB).")
+    # prazo por grupo de etapa (segundos); sem isso vale JOB_STAGE_DEADLINES do worker
+    if payload.get("prazos") is not None:
+        prazos = payload["prazos"]
+        try:
+            if not isinstance(prazos, dict):
+                raise TypeError
+            base_kwargs["prazos"] = {str(k).strip().lower(): float(v) for k, v in prazos.items()}
+        except (TypeError, ValueError):
+            raise HTTPException(400, detail='prazos deve ser um objeto {"grupo": segundos}, ex.: {"carga": 300}.')
+        if any(v < 0 for v in base_kwargs["prazos"].values()):
+            raise HTTPException(400, detail="prazos devem ser >= 0 (0 = sem prazo).")
+    # limiar de similaridade de descrições (1.0 = comparação exata)
+    if payload.get("desc_sim_min") is not None:
+        try:
+            base_kwargs["desc_sim_min"] = float(payload["desc_sim_min"])
+        except (TypeError, ValueError):
+            raise HTTPException(400, detail="desc_sim_min deve ser numérico (0 a 1).")
+        if not 0.0 <= base_kwargs["desc_sim_min"] <= 1.0:
+            raise HTTPException(400, detail="desc_sim_min deve estar entre 0 e 1.")
+    # tabelas também em Parquet/Arrow ao lado do JSON
+    if payload.get("colunar"):
+        colunar = str(payload["colunar"]).strip().lower()
+        if colunar not in COLUNAR_FORMATOS:
+            raise HTTPException(400, detail="colunar deve ser 'parquet' ou 'arrow'.")
+        base_kwargs["colunar"] = colunar
+    # lane e controle de admissão (aplicados no enfileiramento, depois de validar o payload)
+    entrada = dict(
+        op=op,
+        usuario=adm.usuario(request),
+        prioridade=adm.autorizar_prioridade(request, adm.norm_prioridade(payload.get("prioridade"))),
+        bytes_orc=adm.custo_bytes(APP_ROOT, (orc,)),
+        bytes_bancos=adm.custo_bytes(APP_ROOT, (sinapi, sudecap, secid)),
+    )
 
     if op == "precos_auto":
         kwargs = dict(
@@ -329,36 +760,78 @@ def create_job(payload: Dict[str, Any] = Body(...)):
             tol_rel=float(payload.get("tol_rel", 0.0)),
             comparar_desc=bool(payload.get("comparar_desc", True)),
         )
-        job = q.enqueue(
-            "src.tasks.run_precos_auto",
-            kwargs=kwargs,
-            job_timeout=60 * 60,        # 1h
-            result_ttl=60 * 60 * 24,    # 1d
-            failure_ttl=60 * 60 * 24,   # 1d
-        )
-        return JSONResponse(
-            status_code=201,
-            content={"id": job.id, "status": job.get_status()},
-            headers={"Location": f"/jobs/{job.id}"},
-        )
+        if payload.get("sugestoes_k") is not None:
+            try:
+                kwargs["sugestoes_k"] = max(0, int(payload["sugestoes_k"]))
+            except (TypeError, ValueError):
+                raise HTTPException(400, detail="sugestoes_k deve ser inteiro.")
+        # artefato só com as divergências (`cruzado` enxuto, resumo exato)
+        if payload.get("detalhe"):
+            kwargs["detalhe"] = str(payload["detalhe"]).strip().lower()
+            if kwargs["detalhe"] not in ("completo", "divergencias"):
+                raise HTTPException(400, detail="detalhe deve ser 'completo' ou 'divergencias'.")
+        # localidade SINAPI (default PR/CURITIBA, CCD) e localidades extras
+        for k in ("uf", "cidade", "regime"):
+            if payload.get(k):
+                kwargs[k] = str(payload[k])
+        if payload.get("localidades") is not None:
+            if not isinstance(payload["localidades"], list):
+                raise HTTPException(400, detail='localidades deve ser lista (ex.: ["SP", "CSD:PR/CURITIBA"]).')
+            kwargs["localidades"] = payload["localidades"]
+        # data-base: compara com a release vigente no histórico ("auto" = cabeçalho do orçamento)
+        if payload.get("data_base"):
+            db = str(payload["data_base"]).strip()
+            if db.lower() != "auto":
+                try:
+                    db = hist.norm_mes(db)
+                except ValueError as e:
+                    raise HTTPException(400, detail=f"data_base: {e}")
+            kwargs["data_base"] = db
+            if bancos_hist:
+                kwargs["bancos"] = [str(b).strip().upper() for b in bancos_hist]
+        # orçamentos muito grandes: leitura/comparação em lotes, exportação por merge
+        if payload.get("streaming"):
+            kwargs["streaming"] = True
+            if payload.get("chunk_rows") is not None:
+                try:
+                    kwargs["chunk_rows"] = int(payload["chunk_rows"])
+                except (TypeError, ValueError):
+                    raise HTTPException(400, detail="chunk_rows deve ser inteiro.")
+                if kwargs["chunk_rows"] < 1:
+                    raise HTTPException(400, detail="chunk_rows deve ser positivo.")
+        return _enfileirar("src.tasks.run_precos_auto", kwargs, **entrada)
 
     elif op == "estrutura_auto":
         kwargs = dict(**base_kwargs)
-        job = q.enqueue(
-            "src.tasks.run_estrutura_auto",
-            kwargs=kwargs,
-            job_timeout=60 * 60,
-            result_ttl=60 * 60 * 24,
-            failure_ttl=60 * 60 * 24,
-        )
-        return JSONResponse(
-            status_code=201,
-            content={"id": job.id, "status": job.get_status()},
-            headers={"Location": f"/jobs/{job.id}"},
+        if payload.get("profundo"):
+            kwargs["profundo"] = True
+        return _enfileirar("src.tasks.run_estrutura_auto", kwargs, **entrada)
+
+    elif op == "completo_auto":
+        kwargs = dict(
+            **base_kwargs,
+            tol_rel=float(payload.get("tol_rel", 0.0)),
+            comparar_desc=bool(payload.get("comparar_desc", True)),
         )
+        if payload.get("sugestoes_k") is not None:
+            try:
+                kwargs["sugestoes_k"] = max(0, int(payload["sugestoes_k"]))
+            except (TypeError, ValueError):
+                raise HTTPException(400, detail="sugestoes_k deve ser inteiro.")
+        # artefato só com as divergências (`cruzado` enxuto, resumo exato)
+        if payload.get("detalhe"):
+            kwargs["detalhe"] = str(payload["detalhe"]).strip().lower()
+            if kwargs["detalhe"] not in ("completo", "divergencias"):
+                raise HTTPException(400, detail="detalhe deve ser 'completo' ou 'divergencias'.")
+        for k in ("uf", "cidade", "regime"):
+            if payload.get(k):
+                kwargs[k] = str(payload[k])
+        if payload.get("profundo"):
+            kwargs["profundo"] = True
+        return _enfileirar("src.tasks.run_completo_auto", kwargs, **entrada)
 
     else:
-        raise HTTPException(400, detail="op inválida. Use: precos_auto ou estrutura_auto")
+        raise HTTPException(400, detail="op inválida. Use: precos_auto, estrutura_auto ou completo_auto")
 
 
 @app.get("/jobs/{job_id}")
@@ -368,10 +841,59 @@ def get_job(job_id: str):
         job = Job.fetch(job_id, connection=q.connection)
     except Exception:
         raise HTTPException(404, detail="Job não encontrado")
-    return {"id": job.id, "status": job.get_status()}
+    status = job.get_status()
+    meta = job.meta or {}
+    out: Dict[str, Any] = {"id": job.id, "status": status}
+    out["lane"] = meta.get("lane") or lanes.lane_de(job.origin)
+    if meta.get("prioridade"):
+        out["prioridade"] = meta["prioridade"]
+    # cancelado em execução: o RQ registra como failed; o worker marca o motivo no meta
+    if status == "failed" and meta.get("encerramento") in ("canceled", "deadline"):
+        if meta["encerramento"] == "canceled":
+            out["status"] = "canceled"
+        out["encerramento"] = meta["encerramento"]
+        out["error"] = meta.get("error")
+    elif status == "started":
+        # etapa, itens feitos/total, % e ETA, gravados pelo worker (src/control.py)
+        if meta.get("progresso"):
+            out["progresso"] = meta["progresso"]
+        if q.connection.exists(CANCEL_KEY.format(job_id=job.id)):
+            out["cancelamento"] = "solicitado"
+    elif status == "queued":
+        out["posicao"] = job.get_position()
+    return out
+
+@app.delete("/jobs/{job_id}", status_code=202)
+def cancel_job(job_id: str, forcar: bool = Query(False, description="Interrompe o work-horse já (sem esperar o checkpoint)")):
+    """
+    Cancela o job. Na fila/agendado: sai da fila na hora (status `canceled`).
+    Em execução: grava o pedido no Redis e o worker interrompe no próximo
+    checkpoint dos loaders/consolidadores ou na próxima troca de etapa; com
+    `forcar=true`, o work-horse é parado imediatamente (status `stopped`).
+    """
+    q = _queue()
+    try:
+        job = Job.fetch(job_id, connection=q.connection)
+    except Exception:
+        raise HTTPException(404, detail="Job não encontrado")
 
-@app.get("/jobs/{job_id}/result")
-def get_job_result(job_id: str):
+    status = job.get_status()
+    if status in ("queued", "scheduled", "deferred"):
+        job.cancel()
+        return {"id": job.id, "status": "canceled"}
+    if status != "started":
+        raise HTTPException(409, detail=f"Job já encerrado (status={status})")
+
+    q.connection.set(CANCEL_KEY.format(job_id=job.id), "1", ex=CANCEL_TTL_S)
+    if forcar:
+        try:
+            send_stop_job_command(q.connection, job.id)
+        except Exception as e:
+            raise HTTPException(409, detail=f"Não foi possível parar o job: {e}")
+        return {"id": job.id, "status": "stopping"}
+    return {"id": job.id, "status": "cancel_requested"}
+
+def _finished_job(job_id: str) -> Job:
     q = _queue()
     try:
         job = Job.fetch(job_id, connection=q.connection)
@@ -381,24 +903,52 @@ def get_job_result(job_id: str):
     status = job.get_status()
     if status != "finished":
         raise HTTPException(409, detail=f"Job ainda não finalizado (status={status})")
+    return job
 
-    artifact = (job.meta or {}).get("artifact")
-    if not artifact:
-        raise HTTPException(500, detail="Job finalizado mas sem 'artifact' nos metadados")
-
-    artifact_path = Path(artifact)
-    if not artifact_path.is_absolute():
-        artifact_path = (APP_ROOT / artifact_path).resolve()
+def _output_path(p: str, label: str) -> Path:
+    path = Path(p)
+    if not path.is_absolute():
+        path = (APP_ROOT / path).resolve()
 
     try:
-        artifact_path.resolve().relative_to(OUTPUT_DIR.resolve())
+        path.resolve().relative_to(OUTPUT_DIR.resolve())
     except Exception:
-        raise HTTPException(400, detail="Artifact fora do OUTPUT_DIR")
+        raise HTTPException(400, detail=f"{label} fora do OUTPUT_DIR")
+    return path
 
-    try:
-        with artifact_path.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str, request: Request):
+    """JSON do artefato do job, servido como está no disco (gzip passthrough, ETag/304)."""
+    job = _finished_job(job_id)
+
+    artifact = (job.meta or {}).get("artifact")
+    if not artifact:
+        raise HTTPException(500, detail="Job finalizado mas sem 'artifact' nos metadados")
+
+    artifact_path = _output_path(artifact, "Artifact")
+    if not artifact_path.is_file():
         raise HTTPException(404, detail=f"Arquivo de resultado não encontrado: {artifact_path}")
-    except Exception as e:
-        raise HTTPException(500, detail=f"Falha lendo resultado: {e}")
+    return _json_artifact(request, artifact_path)
+
+@app.get("/jobs/{job_id}/colunar")
+def get_job_colunar(job_id: str):
+    """Tabelas colunares (Parquet/Arrow) gravadas pelo job com `colunar`."""
+    job = _finished_job(job_id)
+    out: Dict[str, Any] = {}
+    for tabela, p in sorted(((job.meta or {}).get("colunar") or {}).items()):
+        path = _output_path(p, "Tabela")
+        out[tabela] = {
+            "name": path.name,
+            "size": path.stat().st_size if path.exists() else None,
+            "url": f"/jobs/{job.id}/colunar/{tabela}",
+        }
+    return {"id": job.id, "tabelas": out}
+
+@app.get("/jobs/{job_id}/colunar/{tabela}")
+def download_job_colunar(job_id: str, tabela: str, request: Request):
+    """Baixa uma tabela colunar do job (ex.: cruzado, divergencias), com suporte a Range."""
+    job = _finished_job(job_id)
+    p = ((job.meta or {}).get("colunar") or {}).get(tabela)
+    if not p:
+        raise HTTPException(404, detail=f"Tabela '{tabela}' não gerada por este job (use colunar no payload).")
+    return _download(request, _output_path(p, "Tabela"))
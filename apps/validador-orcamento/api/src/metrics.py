@@ -0,0 +1,243 @@
+# apps/validador-orcamento/api/src/metrics.py
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from redis import Redis
+from rq import Queue
+from rq.registry import StartedJobRegistry, FailedJobRegistry, DeferredJobRegistry, ScheduledJobRegistry
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------
+# Métricas no formato texto do Prometheus
+# ---------------------------------------------------------------------
+# Mesmo esquema de chaves do worker (worker/src/metrics.py):
+#   metrics:counter:<nome>  → hash { <labels_json>: valor }
+#   metrics:hist:<nome>     → hash { <labels_json>|<le>: n, ...|sum, ...|count }
+# A API grava as próprias métricas (latência por rota, bytes de upload) no
+# mesmo lugar, e `render()` junta tudo + profundidade das filas lida na hora.
+
+KEY_PREFIX = "metrics"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (
+    10_000, 100_000, 1_000_000, 5_000_000, 10_000_000,
+    50_000_000, 100_000_000, 500_000_000, 1_000_000_000,
+)
+
+_HELP = {
+    "validador_jobs_total": ("counter", "Jobs encerrados por op e status."),
+    "validador_job_wait_seconds": ("histogram", "Espera na fila (enqueued → started)."),
+    "validador_job_duration_seconds": ("histogram", "Duração dos jobs por op e etapa."),
+    "validador_adapter_rows_total": ("counter", "Linhas lidas por adapter."),
+    "validador_adapter_seconds_total": ("counter", "Tempo gasto por adapter."),
+    "validador_adapter_rows_per_second": ("histogram", "Vazão (linhas/s) por adapter."),
+    "validador_artifact_bytes": ("histogram", "Tamanho dos artefatos gerados."),
+    "validador_upload_bytes": ("histogram", "Tamanho dos uploads recebidos."),
+    "validador_retencao_bytes_total": ("counter", "Bytes recuperados pela retenção, por alvo."),
+    "validador_admissao_rejeicoes_total": ("counter", "POST /jobs recusados (429) pelo controle de admissão, por op e motivo."),
+    "validador_http_request_duration_seconds": ("histogram", "Latência da API por rota."),
+}
+
+
+# Formato das chaves/campos: idêntico em api/src/metrics.py e worker/src/metrics.py
+# (as duas imagens não compartilham código; worker/scripts/test_metrics_chaves.py
+# confere que os dois lados gravam os mesmos campos e que /metrics os lê).
+def _labels_key(labels: Dict[str, Any]) -> str:
+    return json.dumps({k: str(v) for k, v in sorted(labels.items())}, separators=(",", ":"))
+
+
+def _le(buckets: Sequence[float], value: float) -> str:
+    """Primeiro `le` >= valor (bucket não cumulativo)."""
+    i = bisect_left(buckets, value)
+    return str(buckets[i]) if i < len(buckets) else "+Inf"
+
+
+def _chave_contador(name: str) -> str:
+    return f"{KEY_PREFIX}:counter:{name}"
+
+
+def _campos_hist(name: str, value: float, buckets: Sequence[float], labels: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    """(chave, campo do bucket, campo da soma, campo da contagem) de uma observação."""
+    lk = _labels_key(labels)
+    return f"{KEY_PREFIX}:hist:{name}", f"{lk}|{_le(buckets, value)}", f"{lk}|sum", f"{lk}|count"
+
+
+def inc(conn: Redis, name: str, value: float = 1.0, **labels: Any) -> None:
+    try:
+        conn.hincrbyfloat(_chave_contador(name), _labels_key(labels), float(value))
+    except Exception as e:  # métricas nunca derrubam a requisição
+        logger.debug("[metrics] falha ao incrementar %s: %s", name, e)
+
+
+def observe(conn: Redis, name: str, value: float, buckets: Sequence[float], **labels: Any) -> None:
+    key, bucket, soma, contagem = _campos_hist(name, value, buckets, labels)
+    try:
+        pipe = conn.pipeline(transaction=False)
+        pipe.hincrby(key, bucket, 1)
+        pipe.hincrbyfloat(key, soma, float(value))
+        pipe.hincrby(key, contagem, 1)
+        pipe.execute()
+    except Exception as e:
+        logger.debug("[metrics] falha ao observar %s: %s", name, e)
+
+
+# ---------------------------------------------------------------------
+# Observações em buffer (caminho das requisições)
+# ---------------------------------------------------------------------
+# Middleware e rotas async rodam no event loop: gravar no Redis ali travaria
+# todas as requisições enquanto o Redis responde (ou até o socket_timeout).
+# `Buffer.observe` só soma em memória; uma thread daemon descarrega os
+# incrementos acumulados num pipeline a cada METRICS_FLUSH_S. Se o Redis
+# falhar, o lote é descartado: métricas nunca atrasam nem derrubam a resposta.
+
+METRICS_FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "1.0") or 1.0)
+
+
+class Buffer:
+    """Histogramas acumulados em memória e gravados no Redis em segundo plano."""
+
+    def __init__(self, conn: Callable[[], Redis], flush_s: float = METRICS_FLUSH_S) -> None:
+        self._conn = conn
+        self.flush_s = max(0.05, float(flush_s))
+        self._lock = threading.Lock()
+        self._contagens: Dict[Tuple[str, str], int] = {}
+        self._somas: Dict[Tuple[str, str], float] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def observe(self, name: str, value: float, buckets: Sequence[float], **labels: Any) -> None:
+        key, bucket, soma, contagem = _campos_hist(name, value, buckets, labels)
+        with self._lock:
+            for campo in (bucket, contagem):
+                self._contagens[(key, campo)] = self._contagens.get((key, campo), 0) + 1
+            self._somas[(key, soma)] = self._somas.get((key, soma), 0.0) + float(value)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="metrics-flush", daemon=True)
+                self._thread.start()
+
+    def flush(self) -> None:
+        """Grava o acumulado (também chamado pelo /metrics, para o scrape ver tudo)."""
+        with self._lock:
+            contagens, self._contagens = self._contagens, {}
+            somas, self._somas = self._somas, {}
+        if not contagens and not somas:
+            return
+        try:
+            pipe = self._conn().pipeline(transaction=False)
+            for (key, campo), n in contagens.items():
+                pipe.hincrby(key, campo, n)
+            for (key, campo), v in somas.items():
+                pipe.hincrbyfloat(key, campo, v)
+            pipe.execute()
+        except Exception as e:
+            logger.debug("[metrics] falha ao descarregar buffer (%d campos): %s", len(contagens) + len(somas), e)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_s)
+            self.flush()
+
+
+# ---------------------------------------------------------------------
+# Renderização
+# ---------------------------------------------------------------------
+def _esc(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: Dict[str, str], extra: Iterable[Tuple[str, str]] = ()) -> str:
+    items = list(labels.items()) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in items) + "}"
+
+
+def _fmt_num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def _header(lines: List[str], name: str, default_type: str) -> None:
+    mtype, help_ = _HELP.get(name, (default_type, name))
+    lines.append(f"# HELP {name} {help_}")
+    lines.append(f"# TYPE {name} {mtype}")
+
+
+def _render_counters(conn: Redis, lines: List[str]) -> None:
+    for key in sorted(k.decode() for k in conn.scan_iter(f"{KEY_PREFIX}:counter:*")):
+        name = key.split(":", 2)[2]
+        _header(lines, name, "counter")
+        for lk, v in sorted(conn.hgetall(key).items()):
+            lines.append(f"{name}{_fmt_labels(json.loads(lk))} {_fmt_num(float(v))}")
+
+
+def _render_histograms(conn: Redis, lines: List[str]) -> None:
+    for key in sorted(k.decode() for k in conn.scan_iter(f"{KEY_PREFIX}:hist:*")):
+        name = key.split(":", 2)[2]
+        series: Dict[str, Dict[str, float]] = {}
+        for field, v in conn.hgetall(key).items():
+            lk, _, suffix = field.decode().rpartition("|")
+            series.setdefault(lk, {})[suffix] = float(v)
+        # mesmo conjunto de buckets em todas as séries do histograma
+        bounds = sorted({
+            (float(b), b) for data in series.values() for b in data if b not in ("sum", "count", "+Inf")
+        })
+        _header(lines, name, "histogram")
+        for lk in sorted(series):
+            labels = json.loads(lk)
+            data = series[lk]
+            acc = 0.0
+            for _, b in bounds:
+                acc += data.get(b, 0.0)
+                lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', b)])} {_fmt_num(acc)}")
+            total = data.get("count", acc + data.get("+Inf", 0.0))
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {_fmt_num(total)}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_num(data.get('sum', 0.0))}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {_fmt_num(total)}")
+
+
+def _render_queues(queues: Sequence[Queue], lines: List[str]) -> None:
+    now = datetime.now(timezone.utc).replace(tzinfo=None)  # RQ grava datas em UTC "naive"
+    gauges = {
+        "validador_queue_depth": "Jobs aguardando na fila.",
+        "validador_queue_started": "Jobs em execução.",
+        "validador_queue_deferred": "Jobs aguardando dependências.",
+        "validador_queue_scheduled": "Jobs agendados.",
+        "validador_queue_failed": "Jobs no registro de falhas.",
+        "validador_queue_oldest_wait_seconds": "Espera do job mais antigo ainda na fila.",
+    }
+    values: Dict[str, List[Tuple[str, float]]] = {k: [] for k in gauges}
+    for q in queues:
+        values["validador_queue_depth"].append((q.name, q.count))
+        values["validador_queue_started"].append((q.name, StartedJobRegistry(queue=q).count))
+        values["validador_queue_deferred"].append((q.name, DeferredJobRegistry(queue=q).count))
+        values["validador_queue_scheduled"].append((q.name, ScheduledJobRegistry(queue=q).count))
+        values["validador_queue_failed"].append((q.name, FailedJobRegistry(queue=q).count))
+        oldest = 0.0
+        head = q.get_job_ids(0, 1)
+        if head:
+            job = q.fetch_job(head[0])
+            if job is not None and job.enqueued_at:
+                oldest = max(0.0, (now - job.enqueued_at.replace(tzinfo=None)).total_seconds())
+        values["validador_queue_oldest_wait_seconds"].append((q.name, oldest))
+
+    for name, help_ in gauges.items():
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} gauge")
+        for qname, v in values[name]:
+            lines.append(f"{name}{_fmt_labels({'queue': qname})} {_fmt_num(v)}")
+
+
+def render(conn: Redis, queues: Sequence[Queue]) -> str:
+    lines: List[str] = []
+    _render_queues(queues, lines)
+    _render_counters(conn, lines)
+    _render_histograms(conn, lines)
+    return "\n".join(lines) + "\n"
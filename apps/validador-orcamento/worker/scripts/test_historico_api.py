@@ -0,0 +1,94 @@
+# scripts/test_historico_api.py
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+# API e worker são imagens separadas (ambos com pacote "src"): a consulta da API
+# (api/src/historico.py) espelha a do worker e é carregada aqui pelo caminho.
+ROOT = Path(__file__).resolve().parents[1]  # .../worker
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src.cruzar_orcamento.core import historico as worker_hist  # type: ignore
+from src.cruzar_orcamento.utils.utils_code import norm_code_canonical  # type: ignore
+
+API_HISTORICO = ROOT.parent / "api" / "src" / "historico.py"
+
+CODIGOS = [
+    None, "", "  ", "nan", "NaN", "None", "0", "000", "37370", "37370.0", "00037370", "88316.000",
+    88316.0, 88316, 0.0, "01.02.003", "B.01.000.010116", "1. 02 .003", "1..2", ".5", "5.",
+    "1e3", "1E3", "1.5", "-12", "+7", "1_000", " 00042 ", "ABC-001", "C-0042.00", "٣٤",
+    "12.0.0", "1.0", "07.10", "SINAPI 123",
+]
+MESES = [
+    "2025-06", "2025_06", "2025.06", "202506", "06/2025", "06-2025", "2025-06-15",
+    "2025061", "12025-06", "2025-13", "13/2025", "SINAPI_2025_06", date(2025, 6, 1), "", None,
+]
+
+
+def _api():
+    spec = importlib.util.spec_from_file_location("api_historico", API_HISTORICO)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)  # type: ignore[union-attr]
+    return mod
+
+
+def _chamar(fn, x):
+    try:
+        return fn(x)
+    except ValueError:
+        return ValueError
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Confere a consulta ao histórico da API contra a do worker.")
+    ap.add_argument("codigos", nargs="*", help="Códigos extras para comparar (além da lista fixa)")
+    args = ap.parse_args()
+
+    api = _api()
+    falhas = 0
+
+    for x in [*CODIGOS, *args.codigos]:
+        a, w = api.norm_codigo(x), norm_code_canonical(x)
+        if a != w:
+            falhas += 1
+            print(f"codigo {x!r}: api={a!r} worker={w!r}")
+
+    for x in MESES:
+        a, w = _chamar(api.norm_mes, x), _chamar(worker_hist.norm_mes, x)
+        if a != w:
+            falhas += 1
+            print(f"mes {x!r}: api={a!r} worker={w!r}")
+
+    # mesmo dataset gravado pelo worker, mesma consulta dos dois lados
+    with tempfile.TemporaryDirectory() as tmp:
+        raiz = Path(tmp)
+        for mes, fator in (("2025-04", 1.0), ("2025-05", 1.1), ("2025-06", 1.2)):
+            itens = {
+                c: {"codigo": c, "descricao": f"ITEM {c}", "unidade": "M2", "valor_unit": round(10 * i * fator, 2)}
+                for i, c in enumerate(("37370", "1.2.3", "B.1.0.10116", "1000"), start=1)
+            }
+            worker_hist.registrar_canon(raiz, "SUDECAP", mes, itens)
+        consultas = [
+            (["00037370", "01.02.003"], {}),
+            (["B.01.000.010116", "1e3"], {"desde": "2025_05"}),
+            (["37370.0"], {"ate": "05/2025", "localidade": ""}),
+        ]
+        for codigos, kw in consultas:
+            a, w = api.historico(raiz, "sudecap", codigos, **kw), worker_hist.historico(raiz, "SUDECAP", codigos, **kw)
+            if a != w:
+                falhas += 1
+                print(f"historico {codigos} {kw}: api={len(a)} linhas, worker={len(w)} linhas")
+
+    total = len(CODIGOS) + len(args.codigos) + len(MESES) + 3
+    print(f"{total - falhas}/{total} iguais")
+    raise SystemExit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()
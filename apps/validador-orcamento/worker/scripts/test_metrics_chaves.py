@@ -0,0 +1,92 @@
+# scripts/test_metrics_chaves.py
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import sys
+from pathlib import Path
+
+import fakeredis
+
+# Worker grava as métricas no Redis e a API as lê em /metrics: os dois lados têm
+# o mesmo formato de chaves/campos (api/src/metrics.py é carregado pelo caminho —
+# as duas imagens têm um pacote "src").
+ROOT = Path(__file__).resolve().parents[1]  # .../worker
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from src import metrics as worker_metrics  # type: ignore
+
+API_METRICS = ROOT.parent / "api" / "src" / "metrics.py"
+
+LABELS = [{}, {"op": "precos"}, {"stage": "total", "op": "completo"}, {"rota": "/jobs/{id}", "metodo": "GET", "status": 200}]
+VALORES = [0, 0.004, 0.05, 0.0500001, 1, 2.5, 29.9, 3600, 3601, 1e12]
+BUCKETS = [worker_metrics.DURATION_BUCKETS, worker_metrics.BYTES_BUCKETS, (0.005, 0.01, 1, 30)]
+
+
+def _api():
+    spec = importlib.util.spec_from_file_location("api_metrics", API_METRICS)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)  # type: ignore[union-attr]
+    return mod
+
+
+def _dump(conn) -> dict:
+    return {k: conn.hgetall(k) for k in sorted(conn.scan_iter("metrics:*"))}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Confere o formato das métricas do worker contra o da API.")
+    ap.parse_args()
+
+    api = _api()
+    falhas = 0
+    total = 0
+
+    for labels in LABELS:
+        for buckets in BUCKETS:
+            for v in VALORES:
+                total += 1
+                a = api._campos_hist("m", v, buckets, labels)
+                w = worker_metrics._campos_hist("m", v, buckets, labels)
+                if a != w:
+                    falhas += 1
+                    print(f"campos {labels} {v}: api={a} worker={w}")
+        total += 1
+        if api._chave_contador("c") != worker_metrics._chave_contador("c"):
+            falhas += 1
+            print(f"contador: api={api._chave_contador('c')} worker={worker_metrics._chave_contador('c')}")
+
+    # gravação pelos dois lados (worker direto, API direto e via Buffer): mesmos hashes no Redis
+    r_worker, r_api, r_buffer = (fakeredis.FakeRedis() for _ in range(3))
+    worker_metrics._conn = lambda: r_worker
+    buf = api.Buffer(lambda: r_buffer)
+    for labels in LABELS:
+        for v in VALORES:
+            worker_metrics.observe("validador_job_duration_seconds", v, worker_metrics.DURATION_BUCKETS, **labels)
+            api.observe(r_api, "validador_job_duration_seconds", v, worker_metrics.DURATION_BUCKETS, **labels)
+            buf.observe("validador_job_duration_seconds", v, worker_metrics.DURATION_BUCKETS, **labels)
+        worker_metrics.inc("validador_jobs_total", 2, **labels)
+        api.inc(r_api, "validador_jobs_total", 2, **labels)
+        api.inc(r_buffer, "validador_jobs_total", 2, **labels)
+    buf.flush()
+    total += 2
+    for nome, r in (("api", r_api), ("buffer", r_buffer)):
+        if _dump(r) != _dump(r_worker):
+            falhas += 1
+            print(f"redis: {nome} grava campos diferentes do worker")
+
+    # e a renderização da API lê o que o worker gravou
+    texto = api.render(r_worker, [])
+    total += 1
+    esperado = f'validador_job_duration_seconds_count{{op="precos"}} {len(VALORES)}'
+    if esperado not in texto:
+        falhas += 1
+        print(f"render: falta {esperado!r}")
+
+    print(f"{total - falhas}/{total} iguais")
+    raise SystemExit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,30 @@
 # src/cli.py
-import typer
+import json
+import os
 from pathlib import Path
+from typing import List, Optional
+
+import typer
 
 from .cruzar_orcamento.adapters.orcamento import load_orcamento as load_orc_precos
 from .cruzar_orcamento.adapters.sinapi import load_sinapi_ccd_pr as load_sinapi_precos
 from .cruzar_orcamento.adapters.sudecap import load_sudecap as load_sudecap_precos
+from .cruzar_orcamento.adapters.secid import load_secid_precos
+from .cruzar_orcamento.adapters.sinapi import load_sinapi_matriz
 
 from .cruzar_orcamento.adapters.estrutura_orcamento import load_estrutura_orcamento as load_orc_estr
 from .cruzar_orcamento.adapters.estrutura_sinapi import load_estrutura_sinapi_analitico as load_sinapi_estr
 from .cruzar_orcamento.adapters.estrutura_sudecap import load_estrutura_sudecap as load_sud_estr
 
 from .cruzar_orcamento.core.aggregate import consolidar_precos, consolidar_estrutura
+from .cruzar_orcamento.core import historico as hist
+from .cruzar_orcamento.exporters.colunar import export_colunar
 from .cruzar_orcamento.exporters.json_compacto import export_json
 
 app = typer.Typer(no_args_is_help=True)
 
+HISTORY_DIR = Path(os.getenv("HISTORY_DIR", "output/historico"))
+
 @app.command("precos-auto")
 def precos_auto(
     orc: Path = typer.Option(..., "--orc", help="Arquivo do Orçamento"),
@@ -27,6 +37,7 @@ def precos_auto(
         help="Compara descrições entre orçamento e referência"
     ),
     out_dir: Path = typer.Option(Path("output"), "--out-dir", help="Pasta de saída"),
+    colunar: Optional[str] = typer.Option(None, "--colunar", help="Também grava as tabelas em parquet ou arrow"),
 ):
     out_dir.mkdir(parents=True, exist_ok=True)
 
@@ -46,6 +57,9 @@ def precos_auto(
     )
     path = export_json(payload, out_dir / "precos.json")
     typer.secho(f"OK: {path}", fg=typer.colors.GREEN)
+    if colunar:
+        for p in export_colunar(payload, path, colunar).values():
+            typer.secho(f"OK: {p}", fg=typer.colors.GREEN)
 
 
 @app.command("estrutura-auto")
@@ -54,6 +68,7 @@ def estrutura_auto(
     sudecap: Path = typer.Option(..., "--sudecap", help="Arquivo de composições SUDECAP"),
     sinapi: Path = typer.Option(..., "--sinapi", help="Arquivo de composições SINAPI"),
     out_dir: Path = typer.Option(Path("output"), "--out-dir", help="Pasta de saída"),
+    colunar: Optional[str] = typer.Option(None, "--colunar", help="Também grava as tabelas em parquet ou arrow"),
 ):
     out_dir.mkdir(parents=True, exist_ok=True)
 
@@ -69,6 +84,52 @@ def estrutura_auto(
     payload = consolidar_estrutura(a, b_sin, b_sud)
     path = export_json(payload, out_dir / "estrutura.json")
     typer.secho(f"OK: {path}", fg=typer.colors.GREEN)
+    if colunar:
+        for p in export_colunar(payload, path, colunar).values():
+            typer.secho(f"OK: {p}", fg=typer.colors.GREEN)
+
+
+@app.command("historico-registrar")
+def historico_registrar(
+    banco: str = typer.Option(..., "--banco", help="SINAPI, SUDECAP ou SECID"),
+    arquivo: Path = typer.Option(..., "--arquivo", help="Planilha de preços da release"),
+    mes: Optional[str] = typer.Option(None, "--mes", help="Mês de referência AAAA-MM (default: pelo nome do arquivo)"),
+    raiz: Path = typer.Option(HISTORY_DIR, "--raiz", help="Pasta do histórico (HISTORY_DIR)"),
+):
+    """Grava uma release (ex.: planilha arquivada) no histórico de preços."""
+    banco = banco.strip().upper()
+    mes = mes or hist.mes_do_arquivo(arquivo)
+    if not mes:
+        raise typer.BadParameter("Mês não identificado no nome do arquivo; informe --mes AAAA-MM.")
+
+    typer.echo(f">> Lendo {banco} ({arquivo.name})…")
+    if banco == "SINAPI":
+        res = hist.registrar_sinapi(raiz, mes, load_sinapi_matriz(str(arquivo)), fonte=arquivo)
+    elif banco == "SUDECAP":
+        res = [hist.registrar_canon(raiz, banco, mes, load_sudecap_precos(arquivo), fonte=arquivo)]
+    elif banco == "SECID":
+        res = [hist.registrar_canon(raiz, banco, mes, load_secid_precos(arquivo), fonte=arquivo)]
+    else:
+        raise typer.BadParameter("Banco inválido. Use SINAPI, SUDECAP ou SECID.")
+    for r in res:
+        status = "gravado" if r["gravado"] else "já registrado"
+        typer.secho(f"OK: {r['arquivo']} ({r['linhas']} linhas, {status})", fg=typer.colors.GREEN)
+
+
+@app.command("historico")
+def historico_consulta(
+    banco: str = typer.Option(..., "--banco", help="SINAPI, SUDECAP ou SECID"),
+    codigo: List[str] = typer.Option(..., "--codigo", help="Código (repita para vários)"),
+    localidade: Optional[str] = typer.Option(None, "--localidade", help='SINAPI: ex. "CCD:PR/CURITIBA"'),
+    desde: Optional[str] = typer.Option(None, "--desde", help="Mês inicial AAAA-MM"),
+    ate: Optional[str] = typer.Option(None, "--ate", help="Mês final AAAA-MM"),
+    variacao: bool = typer.Option(False, "--variacao", help="Variação mês a mês em vez das linhas"),
+    raiz: Path = typer.Option(HISTORY_DIR, "--raiz", help="Pasta do histórico (HISTORY_DIR)"),
+):
+    """Histórico de preços (ou variação mês a mês) de um ou mais códigos, em JSON."""
+    fn = hist.variacoes if variacao else hist.historico
+    linhas = fn(raiz, banco, codigo, localidade=localidade, desde=desde, ate=ate)
+    typer.echo(json.dumps(linhas, ensure_ascii=False, indent=2))
 
 
 if __name__ == "__main__":
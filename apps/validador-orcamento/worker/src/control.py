@@ -0,0 +1,190 @@
+# apps/validador-orcamento/worker/src/control.py
+from __future__ import annotations
+
+import logging
+import os
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Any, Dict, Optional
+
+from rq import get_current_job
+
+from src.cruzar_orcamento.utils import checkpoint
+
+logger = logging.getLogger(__name__)
+
+# Pedido de cancelamento gravado pela API (DELETE /jobs/{id}); o job o consulta
+# nos checkpoints dos loaders/consolidadores e entre etapas.
+CANCEL_KEY = "cancel:{job_id}"
+# Intervalo mínimo entre consultas ao Redis (segundos)
+CANCEL_POLL_S = float(os.getenv("CANCEL_POLL_S", "1.0") or 1.0)
+# Intervalo mínimo entre gravações do progresso em job.meta (segundos)
+PROGRESS_INTERVAL_S = float(os.getenv("PROGRESS_INTERVAL_S", "2.0") or 2.0)
+
+
+def _parse_prazos(raw: str) -> Dict[str, float]:
+    """'carga=600,consolidacao=900' → {'carga': 600.0, 'consolidacao': 900.0}."""
+    out: Dict[str, float] = {}
+    for parte in (raw or "").split(","):
+        if "=" not in parte:
+            continue
+        k, v = parte.split("=", 1)
+        try:
+            out[k.strip().lower()] = float(v)
+        except ValueError:
+            logger.warning("[control] prazo inválido em JOB_STAGE_DEADLINES: %r", parte)
+    return out
+
+
+# Prazo por grupo de etapa, em segundos (grupo = nome da etapa até o 1º '_':
+# carga_sinapi → carga, consolidacao_stream → consolidacao). Ausente/0 = sem prazo.
+JOB_STAGE_DEADLINES = _parse_prazos(os.getenv("JOB_STAGE_DEADLINES", ""))
+
+
+class JobCancelled(RuntimeError):
+    """Cancelamento pedido pela API (DELETE /jobs/{id})."""
+
+
+class StageDeadlineExceeded(TimeoutError):
+    """Uma etapa passou do prazo configurado para o seu grupo."""
+
+
+def grupo_etapa(nome: str) -> str:
+    return nome.split("_", 1)[0].lower()
+
+
+class JobControl:
+    """
+    Cancelamento cooperativo, prazos por etapa e progresso do job corrente.
+
+    `start()` instala `check` como hook de `utils.checkpoint`: os laços dos
+    loaders e consolidadores o chamam periodicamente, e ele levanta
+    `StageDeadlineExceeded` (prazo da etapa estourado) ou `JobCancelled`
+    (chave CANCEL_KEY presente no Redis, consultada no máximo a cada
+    CANCEL_POLL_S). O StageRecorder chama `begin_stage` / `check(force=True)`
+    nas bordas de cada etapa, o que cobre também trechos sem checkpoint
+    (leitura da planilha pelo pandas, exportação).
+
+    No mesmo hook, o progresso da etapa (itens feitos, total quando o laço
+    tem tamanho conhecido, % e ETA pela vazão até aqui) vai para
+    `job.meta["progresso"]`, no máximo a cada PROGRESS_INTERVAL_S.
+    """
+
+    def __init__(
+        self,
+        prazos: Optional[Dict[str, Any]] = None,
+        poll_s: float = CANCEL_POLL_S,
+        progress_s: float = PROGRESS_INTERVAL_S,
+    ) -> None:
+        job = get_current_job()
+        self.job = job
+        self.job_id = job.id if job else None
+        self.conn = job.connection if job else None
+        self.prazos: Dict[str, float] = dict(JOB_STAGE_DEADLINES)
+        for k, v in (prazos or {}).items():
+            self.prazos[str(k).strip().lower()] = float(v or 0)
+        self.poll_s = max(0.0, float(poll_s))
+        self.progress_s = max(0.0, float(progress_s))
+        self.stage: Optional[str] = None
+        self._prazo: Optional[float] = None
+        self._deadline: Optional[float] = None
+        self._inicio = 0.0
+        self._t_prog = 0.0
+        self._info: Dict[str, Any] = {}
+        self._next_poll = 0.0
+        self._next_pub = 0.0
+
+    # ---- ciclo de vida
+    def start(self) -> "JobControl":
+        checkpoint.instalar(self.check)
+        return self
+
+    def stop(self) -> None:
+        checkpoint.instalar(None)
+
+    # ---- etapas
+    def begin_stage(self, nome: str) -> None:
+        self.check(force=True)
+        self.stage = nome
+        self._inicio = perf_counter()
+        prazo = self.prazos.get(grupo_etapa(nome)) or 0
+        self._prazo = prazo if prazo > 0 else None
+        self._deadline = self._inicio + prazo if prazo > 0 else None
+        self._info = {}
+        self._t_prog = self._inicio
+        checkpoint.zerar()
+        self.publicar()
+
+    def subetapa(self, **info: Any) -> None:
+        """
+        Recomeça a contagem dentro da etapa (ex.: cada lote do streaming, cujo
+        total só se conhece lote a lote): `pct`/`eta_s` passam a valer para a
+        subetapa e `info` (lote, linhas lidas...) vai junto no progresso.
+        """
+        self._info = info
+        self._t_prog = perf_counter()
+        checkpoint.zerar()
+        self.publicar()
+
+    def end_stage(self) -> None:
+        self.check(force=True)
+        self.stage = None
+        self._prazo = self._deadline = None
+
+    # ---- verificação
+    def check(self, force: bool = False) -> None:
+        agora = perf_counter()
+        if self._deadline is not None and agora > self._deadline:
+            raise StageDeadlineExceeded(
+                f"Etapa '{self.stage}' excedeu o prazo de {self._prazo:g}s "
+                f"(grupo '{grupo_etapa(self.stage or '')}'; {agora - self._inicio:.1f}s decorridos)."
+            )
+        if not force and agora >= self._next_pub:
+            self.publicar()
+        if self.conn is None or (not force and agora < self._next_poll):
+            return
+        self._next_poll = agora + self.poll_s
+        try:
+            pedido = self.conn.exists(CANCEL_KEY.format(job_id=self.job_id))
+        except Exception as e:  # Redis instável não derruba o job
+            logger.debug("[control] falha ao consultar cancelamento: %s", e)
+            return
+        if pedido:
+            etapa = f" na etapa '{self.stage}'" if self.stage else ""
+            raise JobCancelled(f"Job cancelado a pedido{etapa}.")
+
+    # ---- progresso
+    def progresso(self) -> Dict[str, Any]:
+        feitos, total, t_laco = checkpoint.progresso()
+        agora = perf_counter()
+        out: Dict[str, Any] = {"etapa": self.stage, **self._info, "feitos": feitos, "total": total}
+        if total:
+            out["pct"] = round(min(100.0, 100.0 * feitos / total), 1)
+            # vazão medida desde o início do laço (a leitura da planilha antes dele não conta)
+            gasto = agora - (t_laco or self._t_prog)
+            if feitos and gasto > 0:
+                out["eta_s"] = round(max(0, total - feitos) * gasto / feitos, 1)
+        out["decorrido_s"] = round(agora - self._inicio, 1)
+        out["atualizado_em"] = datetime.now(timezone.utc).isoformat()
+        return out
+
+    def publicar(self) -> None:
+        """Grava o progresso em job.meta (o meta inteiro: o worker é o único que o escreve)."""
+        self._next_pub = perf_counter() + self.progress_s
+        if self.job is None:
+            return
+        self.job.meta = self.job.meta or {}
+        self.job.meta["progresso"] = self.progresso()
+        try:
+            self.job.save_meta()
+        except Exception as e:  # progresso nunca derruba o job
+            logger.debug("[control] falha ao gravar progresso: %s", e)
+
+
+def status_falha(e: BaseException) -> str:
+    """Status do job para métricas/meta a partir da exceção que o encerrou."""
+    if isinstance(e, JobCancelled):
+        return "canceled"
+    if isinstance(e, StageDeadlineExceeded):
+        return "deadline"
+    return "failed"
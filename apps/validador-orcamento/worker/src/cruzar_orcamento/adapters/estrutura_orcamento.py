@@ -8,6 +8,8 @@ import pandas as pd
 
 from ..models import EstruturaDict, CompEstrutura, ChildSpec
 from ..utils.utils_code import norm_code_canonical  # normalizador de códigos
+from ..utils.checkpoint import checkpoint, total as progresso_total
+from ..utils.planilha import abrir, cabecalho, detectar_coluna_tipo, ler, ler_colunas, sondar
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,20 @@ def _norm(s: str) -> str:
     s = _strip_accents(s).lower().strip()
     return s
 
+def _to_float(x: object) -> Optional[float]:
+    """Converte número pt-BR/EN; vazio/inválido → None."""
+    if x is None or (isinstance(x, float) and pd.isna(x)):
+        return None
+    if isinstance(x, (int, float)):
+        return float(x)
+    s = str(x).strip()
+    if "," in s:
+        s = s.replace(".", "").replace(",", ".")
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
 def _looks_like_composicoes(name: str) -> bool:
     n = _norm(name)
     return "compos" in n  # "Composições", "Composicoes", etc.
@@ -47,6 +63,11 @@ _COL_CANDIDATES = {
         "referencia", "referência",
         "base de referencia", "base de referência",
     ),  # coluna opcional para filtro por banco
+    "coeficiente": ("coeficiente", "coef", "quant"),  # opcional (explosão profunda)
+    "valor_unit": (
+        "valor unit", "valor unitario", "valor unitário",
+        "vlr unit", "val unit", "unitario",
+    ),  # opcional (consistência de preços)
 }
 
 def _build_lookup(columns: Iterable[str]) -> dict[str, str]:
@@ -66,26 +87,59 @@ def _pick_col(lookup: dict[str, str], candidates: Iterable[str], required: bool
 
 def _detect_tipo_column(df: pd.DataFrame) -> Optional[str]:
     """
-    Encontra a coluna que contém marcadores 'Composição', 'Composição Auxiliar' ou 'Insumo'.
-    1) tenta a coluna 'Tipo'
-    2) varre demais colunas procurando esses marcadores
+    Encontra a coluna que contém marcadores 'Composição', 'Composição Auxiliar' ou 'Insumo'
+    (amostragem por blocos, preferindo 'Tipo'; ver utils.planilha.detectar_coluna_tipo).
     """
-    # 1) tenta 'Tipo'
-    if "Tipo" in df.columns:
-        vals = df["Tipo"].astype(str).map(_norm)
-        if vals.str.contains(r"compos|insumo", regex=True, na=False).any():
-            return "Tipo"
-    # 2) varre colunas
-    for c in df.columns:
-        vals = df[c].astype(str).map(_norm)
-        if vals.str.contains(r"compos|insumo", regex=True, na=False).any():
-            return c
-    return None
+    return detectar_coluna_tipo(df, _norm, preferida="Tipo")
+
+def _mapear_colunas(
+    df: pd.DataFrame,
+    sheet: str | int,
+    amostra: bool = False,
+) -> tuple[list[str], list[str]] | None:
+    """
+    Colunas de origem e nomes internos (CODIGO, DESCRICAO, TIPO, ...); None se a
+    aba não serve. Com `amostra` (linhas da sonda), sem coluna de tipo volta o
+    mapa sem TIPO e sem log: quem chama lê a aba inteira e procura de novo.
+    """
+    lookup = _build_lookup(df.columns)
+    try:
+        col_codigo = _pick_col(lookup, _COL_CANDIDATES["codigo"])
+        col_desc   = _pick_col(lookup, _COL_CANDIDATES["descricao"])
+        col_banco  = _pick_col(lookup, _COL_CANDIDATES["banco"], required=False)  # opcional
+        col_coef   = _pick_col(lookup, _COL_CANDIDATES["coeficiente"], required=False)  # opcional
+        col_valor  = _pick_col(lookup, _COL_CANDIDATES["valor_unit"], required=False)   # opcional
+    except KeyError as e:
+        logger.warning(f"[{sheet}] {e}; pulando aba.")
+        return None
+
+    col_tipo = _detect_tipo_column(df)
+    if col_tipo:
+        logger.info(f"[{sheet}] Coluna de tipo detectada: {col_tipo!r}")
+    elif not amostra:
+        logger.error(f"[{sheet}] Não encontrei coluna de tipo; não é possível montar a estrutura.")
+        return None
+
+    cols = [col_codigo, col_desc]
+    newcols = ["CODIGO", "DESCRICAO"]
+    if col_tipo:
+        cols.append(col_tipo)
+        newcols.append("TIPO")
+    if col_banco:
+        cols.append(col_banco)
+        newcols.append("BANCO")
+    if col_coef:
+        cols.append(col_coef)
+        newcols.append("COEF")
+    if col_valor:
+        cols.append(col_valor)
+        newcols.append("VALOR")
+    return cols, newcols
 
 # ---------- Loader de estrutura (pai + filhos 1º nível) ----------
 
 def load_estrutura_orcamento(
-    path: str,
+    path: str | pd.ExcelFile,
     sheets: List[str | int] | None = None,
     banco: str | None = None,   # <-- filtro opcional por banco (aplicado no PAI)
 ) -> EstruturaDict:
@@ -99,7 +153,7 @@ def load_estrutura_orcamento(
 
     Retorna um EstruturaDict: {codigo_pai: {codigo, descricao, unidade, filhos[], fonte="ORCAMENTO", banco?}}
     """
-    xls = pd.ExcelFile(path)
+    xls = abrir(path)
 
     # escolher abas
     if sheets is None:
@@ -118,38 +172,29 @@ def load_estrutura_orcamento(
     alvo_banco_norm = _norm(banco) if banco else None
 
     for sheet in sheets:
-        # localizar header
-        df_raw = pd.read_excel(path, sheet_name=sheet, header=None)
-        header_row = _find_header_row(df_raw)
+        # localizar header (só nas primeiras linhas)
+        topo = sondar(xls, sheet)
+        header_row = _find_header_row(topo)
         if header_row is None:
             header_row = 4
             logger.warning(f"[{sheet}] Cabeçalho não detectado; usando header=4 (linha 5).")
 
-        df = pd.read_excel(path, sheet_name=sheet, header=header_row)
-        lookup = _build_lookup(df.columns)
-
-        try:
-            col_codigo = _pick_col(lookup, _COL_CANDIDATES["codigo"])
-            col_desc   = _pick_col(lookup, _COL_CANDIDATES["descricao"])
-            col_banco  = _pick_col(lookup, _COL_CANDIDATES["banco"], required=False)  # opcional
-        except KeyError as e:
-            logger.warning(f"[{sheet}] {e}; pulando aba.")
-            continue
-
-        col_tipo = _detect_tipo_column(df)
-        if col_tipo:
-            logger.info(f"[{sheet}] Coluna de tipo detectada: {col_tipo!r}")
+        # colunas resolvidas na sonda: a leitura principal só converte essas
+        sonda = cabecalho(topo, header_row)
+        mapa = _mapear_colunas(sonda[1], sheet, amostra=True) if sonda else None
+        if sonda and mapa is None:
+            continue  # faltam colunas obrigatórias no cabeçalho
+        if mapa is not None and "TIPO" in mapa[1]:
+            df = ler_colunas(xls, sheet, header_row, sonda[0], mapa[0])
         else:
-            logger.error(f"[{sheet}] Não encontrei coluna de tipo; não é possível montar a estrutura.")
-            continue
+            # tipo não aparece nas primeiras linhas: procura na aba inteira
+            df = ler(xls, sheet, header=header_row)
+            mapa = _mapear_colunas(df, sheet)
+            if mapa is None:
+                continue
+        cols, newcols = mapa
 
         # projeção e limpeza base
-        cols = [col_codigo, col_desc, col_tipo]
-        newcols = ["CODIGO", "DESCRICAO", "TIPO"]
-        if col_banco:
-            cols.append(col_banco)
-            newcols.append("BANCO")
-
         proj = df[cols].copy()
         proj.columns = newcols
 
@@ -169,7 +214,9 @@ def load_estrutura_orcamento(
         # varredura sequencial: ao achar PAI, começa grupo; filhos acumulam até próximo PAI
         current_pai: Optional[CompEstrutura] = None
 
+        progresso_total(len(proj))
         for idx, row in proj.iterrows():
+            checkpoint()
             codigo = row["CODIGO"]
             desc   = row["DESCRICAO"]
 
@@ -208,6 +255,8 @@ def load_estrutura_orcamento(
                     fonte="ORCAMENTO",
                     banco=banco_val,
                 )
+                if "VALOR" in proj.columns:
+                    current_pai["valor_unit"] = _to_float(row["VALOR"])
                 pais_detectados += 1
                 continue
 
@@ -218,6 +267,10 @@ def load_estrutura_orcamento(
                         "codigo": norm_code_canonical(codigo),  # normaliza também o filho
                         "descricao": str(desc) if pd.notna(desc) else "",
                     }
+                    if "COEF" in proj.columns:
+                        filho["coeficiente"] = _to_float(row["COEF"])
+                    if "VALOR" in proj.columns:
+                        filho["valor_unit"] = _to_float(row["VALOR"])
                     current_pai["filhos"].append(filho)
                     filhos_detectados += 1
                 continue
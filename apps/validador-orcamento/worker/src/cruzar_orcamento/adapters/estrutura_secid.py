@@ -9,6 +9,8 @@ import pandas as pd
 
 from ..models import EstruturaDict, CompEstrutura, ChildSpec
 from ..utils.utils_code import norm_code_canonical as _norm_code
+from ..utils.checkpoint import checkpoint, total as progresso_total
+from ..utils.planilha import abrir, ler, sondar
 
 
 def _norm_text(x: object) -> str:
@@ -63,7 +65,7 @@ def _find_header(df: pd.DataFrame) -> Tuple[int, Dict[str, int]]:
     raise ValueError("Cabeçalho da planilha SECID (estrutura) não encontrado.")
 
 
-def load_estrutura_secid(path: Path | str) -> EstruturaDict:
+def load_estrutura_secid(path: Path | str | pd.ExcelFile) -> EstruturaDict:
     """
     Monta:
       { codigo_canon: CompEstrutura(codigo, descricao, unidade, filhos=[ChildSpec(...)]) }
@@ -72,19 +74,24 @@ def load_estrutura_secid(path: Path | str) -> EstruturaDict:
       - Linha com TIPO vazio abre um novo pai.
       - Linhas com TIPO em {"composicao","composição","insumo"} viram filhos do pai corrente.
     """
-    path = Path(path)
-    xls = pd.ExcelFile(path)
-    df = pd.read_excel(xls, sheet_name=xls.sheet_names[0], header=None)
-
-    row0, cols = _find_header(df)
+    xls = abrir(path)
+    sheet = xls.sheet_names[0]
+    topo = sondar(xls, sheet, nrows=51)
+    row0, cols = _find_header(topo)
 
     # auto-skip de uma possível linha de custos logo abaixo do cabeçalho
     start = row0 + 1
-    if row0 + 1 < len(df):
-        sub = " ".join(_norm_text(v) for v in df.iloc[row0 + 1].tolist())
+    if row0 + 1 < len(topo):
+        sub = " ".join(_norm_text(v) for v in topo.iloc[row0 + 1].tolist())
         if any(tok in sub for tok in ("material", "mão", "mao", "total")):
             start = row0 + 2
 
+    # leitura principal já depois do cabeçalho e só das colunas mapeadas
+    # (dtype=object: células como na leitura com header=None)
+    usadas = sorted(c for c in cols.values() if c >= 0)
+    df = ler(xls, sheet, header=None, skiprows=start, usecols=usadas, dtype=object)
+    df = df.reindex(columns=range(topo.shape[1]))  # posições do cabeçalho (não usadas ficam vazias)
+
     out: EstruturaDict = {}
     current: Optional[CompEstrutura] = None
 
@@ -95,7 +102,9 @@ def load_estrutura_secid(path: Path | str) -> EstruturaDict:
         out[_norm_code(current["codigo"])] = current
         current = None
 
-    for i in range(start, len(df)):
+    progresso_total(len(df))
+    for i in range(len(df)):
+        checkpoint()
         row = df.iloc[i]
 
         tipo = _norm_text(row.iloc[cols["tipo"]]) if cols["tipo"] >= 0 else ""
@@ -8,6 +8,8 @@ import pandas as pd
 
 from ..models import CompEstrutura, ChildSpec, EstruturaDict
 from ..utils.utils_code import norm_code_canonical
+from ..utils.checkpoint import checkpoint, total as progresso_total
+from ..utils.planilha import abrir, ler, ler_colunas, nomes_colunas, sondar
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +32,7 @@ def _find_header_row(df_raw: pd.DataFrame, max_scan: int = 25) -> Optional[int]:
     return None
 
 
-def load_estrutura_sinapi_analitico(path: str, sheet_name: str = "Analítico") -> EstruturaDict:
+def load_estrutura_sinapi_analitico(path: str | pd.ExcelFile, sheet_name: str = "Analítico") -> EstruturaDict:
     """
     Lê a aba 'Analítico' do SINAPI e constrói:
       { codigo_pai: {codigo, descricao, filhos:[{codigo, descricao}], fonte:'SINAPI'} }
@@ -41,31 +43,54 @@ def load_estrutura_sinapi_analitico(path: str, sheet_name: str = "Analítico") -
       - Código do FILHO  → coluna D (índice 3)
       - Descrição        → procurar coluna 'Descrição' pelo cabeçalho; se não houver,
                            usar a coluna E (índice 4) como fallback para descrição da linha.
+      - Coeficiente      → coluna 'Coeficiente' pelo cabeçalho; fallback coluna G (índice 6).
 
     Observações:
       - O arquivo pode conter valores numéricos que viram 'xxxxx.0'; usamos `norm_code_canonical`.
-      - Não “explode” composições auxiliares: apenas registra filhos de 1º nível.
+      - Não “explode” composições auxiliares: apenas registra filhos de 1º nível
+        (a explosão completa fica em core.explosao, sobre o EstruturaDict).
     """
     # 1) Detecta header (se houver) para pegar 'Descrição' com nome, mas sem depender dele pros códigos
-    df_raw = pd.read_excel(path, sheet_name=sheet_name, header=None)
-    header_row = _find_header_row(df_raw)
+    xls = abrir(path)
+    topo = sondar(xls, sheet_name, nrows=25)
+    header_row = _find_header_row(topo)
 
     desc_col = None
+    coef_col = None
     if header_row is not None:
-        df = pd.read_excel(path, sheet_name=sheet_name, header=header_row)
-        cols_lower = {str(c).strip().lower(): c for c in df.columns}
+        nomes = nomes_colunas(topo.iloc[header_row].tolist())
+        cols_lower = {c.strip().lower(): c for c in nomes}
         # tenta achar alguma coluna de descrição
         for k, real in cols_lower.items():
             if "descri" in k:
                 desc_col = real
                 break
+        for k, real in cols_lower.items():
+            if "coef" in k:
+                coef_col = real
+                break
         # se não achou, volta para leitura sem header e usa posicional
         if desc_col is None:
             logger.warning("[SINAPI Analítico] Coluna de descrição não localizada pelo header; usando posicional.")
-            df = df_raw.copy()
             header_row = None
+            coef_col = None
+
+    # Só as colunas usadas (B, C, D, descrição e coeficiente) são convertidas; as
+    # demais voltam como colunas vazias, para as posições B/C/D/E/G não mudarem.
+    if header_row is not None:
+        posicoes = {1, 2, 3, nomes.index(desc_col), nomes.index(coef_col) if coef_col is not None else 6}
+        if max(posicoes) < len(nomes):
+            df = ler_colunas(xls, sheet_name, header_row, nomes, [nomes[i] for i in posicoes])
+            df = df.reindex(columns=nomes)
+        else:
+            # cabeçalho mais curto que as posições usadas: aba inteira, com os nomes da sonda
+            df = ler(xls, sheet_name, header=header_row)
+            df.columns = nomes_colunas(topo.iloc[header_row].tolist() + [None] * (df.shape[1] - len(nomes)))
+    elif topo.shape[1] > 6:
+        df = ler(xls, sheet_name, header=None, usecols=[1, 2, 3, 4, 6])
+        df = df.reindex(columns=range(topo.shape[1]))
     else:
-        df = df_raw.copy()
+        df = ler(xls, sheet_name, header=None)
 
     # 2) Função auxiliar para descrever a linha atual
     def get_desc(row) -> str:
@@ -77,12 +102,26 @@ def load_estrutura_sinapi_analitico(path: str, sheet_name: str = "Analítico") -
         except Exception:
             return ""
 
+    def get_coef(row) -> Optional[float]:
+        try:
+            v = row.get(coef_col) if coef_col is not None else row.iloc[6]
+        except Exception:
+            return None
+        if v is None or pd.isna(v):
+            return None
+        try:
+            return float(str(v).replace(",", ".")) if isinstance(v, str) else float(v)
+        except ValueError:
+            return None
+
     out: EstruturaDict = {}
     pai_atual: Optional[CompEstrutura] = None
     total_filhos = 0
 
     # 3) Varre linhas
+    progresso_total(len(df))
     for _, row in df.iterrows():
+        checkpoint()
         # B, C, D por índice (garantido mesmo sem header)
         try:
             cod_pai_raw = _strip(row.iloc[1])  # B
@@ -123,7 +162,7 @@ def load_estrutura_sinapi_analitico(path: str, sheet_name: str = "Analítico") -
         # registra filho quando tipo for INSUMO/COMPOSICAO
         if pai_atual and cod_filho and (("insumo" in tipo) or ("composicao" in tipo) or ("composição" in tipo)):
             filho_desc = get_desc(row)
-            filho: ChildSpec = {"codigo": cod_filho, "descricao": filho_desc}
+            filho: ChildSpec = {"codigo": cod_filho, "descricao": filho_desc, "coeficiente": get_coef(row)}
             pai_atual["filhos"].append(filho)
             total_filhos += 1
 
@@ -8,6 +8,8 @@ import pandas as pd
 
 from ..models import EstruturaDict, CompEstrutura, ChildSpec
 from ..utils.utils_code import norm_code_canonical
+from ..utils.checkpoint import checkpoint, total as progresso_total
+from ..utils.planilha import abrir, ler, sondar
 
 logger = logging.getLogger(__name__)
 
@@ -51,7 +53,7 @@ def _join_desc(parts: list[str]) -> str:
 # Loader principal
 # --------------------------------------------------------------------
 
-def load_estrutura_sudecap(path: str, sheets: List[str | int] | None = None) -> EstruturaDict:
+def load_estrutura_sudecap(path: str | pd.ExcelFile, sheets: List[str | int] | None = None) -> EstruturaDict:
     """
     Lê XLS do SUDECAP (Relatório de Composições).
 
@@ -66,7 +68,7 @@ def load_estrutura_sudecap(path: str, sheets: List[str | int] | None = None) ->
     Não “explode” composições auxiliares: registra somente filhos 1º nível.
     Retorna: {codigo_pai: {codigo, descricao, filhos:[{codigo,descricao}], fonte:"SUDECAP"}}
     """
-    xls = pd.ExcelFile(path)
+    xls = abrir(path)
     if sheets is None:
         sheets = xls.sheet_names  # varre todas as abas
 
@@ -76,15 +78,17 @@ def load_estrutura_sudecap(path: str, sheets: List[str | int] | None = None) ->
     pais_duplicados = 0
 
     for sheet in sheets:
-        # 1) detectar header
-        df_raw = pd.read_excel(path, sheet_name=sheet, header=None)
-        header_row = _find_header_row(df_raw)
+        # 1) detectar header (só nas primeiras linhas)
+        topo = sondar(xls, sheet, nrows=40)
+        header_row = _find_header_row(topo)
         if header_row is None:
             # Palpite razoável (linha 5 visivelmente comum), mas tentaremos mesmo assim
             header_row = 4
             logger.warning(f"[SUDECAP/{sheet}] Cabeçalho não detectado; usando header=4 (linha 5).")
 
-        df = pd.read_excel(path, sheet_name=sheet, header=header_row)
+        # só as colunas A..G são usadas (quando a sonda garante que existem)
+        usecols = list(range(7)) if topo.shape[1] >= 7 else None
+        df = ler(xls, sheet, header=header_row, usecols=usecols)
         if df.empty:
             logger.warning(f"[SUDECAP/{sheet}] Aba vazia; pulando.")
             continue
@@ -110,7 +114,9 @@ def load_estrutura_sudecap(path: str, sheets: List[str | int] | None = None) ->
         current_pai: Optional[CompEstrutura] = None
         filhos_detectados_sheet = 0
 
+        progresso_total(len(df))
         for i in range(len(df)):
+            checkpoint()
             valA = _strip(colA.iloc[i]) if i < len(colA) else ""
             valB = _strip(colB.iloc[i]) if i < len(colB) else ""
             extra_parts = [series.iloc[i] if i < len(series) else "" for series in cols_C_to_G]
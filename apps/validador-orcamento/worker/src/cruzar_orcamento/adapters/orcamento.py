@@ -1,13 +1,20 @@
 # apps/validador-orcamento/worker/src/cruzar_orcamento/adapters/orcamento.py
 from __future__ import annotations
 
+import itertools
 import logging
-from typing import Iterable
+import math
+import re
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator
 import unicodedata
 import pandas as pd
+from openpyxl import load_workbook
 
 from ..models import Item, CanonDict
 from ..utils.utils_text import norm_code
+from ..utils.checkpoint import checkpoint, total as progresso_total
+from ..utils.planilha import abrir, cabecalho, detectar_coluna_tipo, ler, ler_colunas, nomes_colunas, sondar
 
 logger = logging.getLogger(__name__)
 
@@ -69,119 +76,165 @@ def _pick_col(lookup: dict[str, str], candidates: Iterable[str], required: bool
 
 def _detect_tipo_column(df: pd.DataFrame) -> str | None:
     """
-    Encontra a coluna que contém marcadores 'Composição', 'Composição Auxiliar' ou 'Insumo'.
-    1) tenta a coluna 'Tipo'
-    2) varre demais colunas procurando esses marcadores
+    Encontra a coluna que contém marcadores 'Composição', 'Composição Auxiliar' ou 'Insumo'
+    (amostragem por blocos, preferindo 'Tipo'; ver utils.planilha.detectar_coluna_tipo).
     """
-    # 1) tenta 'Tipo'
-    if "Tipo" in df.columns:
-        vals = df["Tipo"].astype(str).map(_norm)
-        if vals.str.contains(r"compos|insumo", regex=True, na=False).any():
-            return "Tipo"
-    # 2) varre colunas
-    for c in df.columns:
-        vals = df[c].astype(str).map(_norm)
-        if vals.str.contains(r"compos|insumo", regex=True, na=False).any():
-            return c
+    return detectar_coluna_tipo(df, _norm, preferida="Tipo")
+
+# ---------- Data-base (mês de referência) no cabeçalho ----------
+
+_DATA_BASE_LABEL_RE = re.compile(r"data[\s\-_]*base|mes\s+de\s+referencia|data\s+de\s+referencia")
+_MESES_PT = {
+    "jan": 1, "fev": 2, "mar": 3, "abr": 4, "mai": 5, "jun": 6,
+    "jul": 7, "ago": 8, "set": 9, "out": 10, "nov": 11, "dez": 12,
+}
+_MES_NUM_RE = re.compile(r"(?<!\d)(0?[1-9]|1[0-2])\s*[/\-.]\s*(20\d{2})(?!\d)")
+_MES_ISO_RE = re.compile(r"(?<!\d)(20\d{2})[/\-.](0[1-9]|1[0-2])(?!\d)")
+_MES_NOME_RE = re.compile(r"\b(jan|fev|mar|abr|mai|jun|jul|ago|set|out|nov|dez)[a-z]*\.?\s*(?:/|-|de)?\s*(20\d{2})\b")
+
+
+def _parse_mes_ref(v: Any) -> str | None:
+    """Célula → 'AAAA-MM' (data, '06/2025', '2025-06', 'JUN/2025', 'junho de 2025')."""
+    if isinstance(v, (datetime, date, pd.Timestamp)):
+        return f"{v.year:04d}-{v.month:02d}"
+    txt = _norm(v)
+    m = _MES_ISO_RE.search(txt)
+    if m:
+        return f"{m.group(1)}-{m.group(2)}"
+    m = _MES_NUM_RE.search(txt)
+    if m:
+        return f"{m.group(2)}-{int(m.group(1)):02d}"
+    m = _MES_NOME_RE.search(txt)
+    if m:
+        return f"{m.group(2)}-{_MESES_PT[m.group(1)]:02d}"
     return None
 
-# ---------- Loader principal ----------
 
-def load_orcamento(
-    path: str,
-    sheets: list[str | int] | None = None,  # se None, tenta "Composições"
-    banco: str | None = None,               # se existir coluna
-    valor_scale: float = 1.0,
-) -> CanonDict:
+def detectar_data_base(path: str | pd.ExcelFile, max_rows: int = 15) -> str | None:
     """
-    Lê a(s) aba(s) **Composições** e retorna Dict[codigo, Item] no esquema canônico,
-    **filtrando apenas 'Composição' e 'Composição Auxiliar'** (usando a coluna real de tipo).
+    Procura a data-base do orçamento no cabeçalho das abas ("Data-base: 06/2025",
+    "DATA BASE | JUN/2025", "Mês de referência" + data na célula ao lado/abaixo).
+    Lê só as primeiras `max_rows` linhas de cada aba. Retorna 'AAAA-MM' ou None.
     """
-    xls = pd.ExcelFile(path)
-
-    if sheets is None:
-        candidates = [s for s in xls.sheet_names if _looks_like_composicoes(s)]
-        if not candidates:
-            logger.warning("Nenhuma aba 'Composições' detectada; usando a primeira como fallback.")
-            candidates = [xls.sheet_names[0]]
-        sheets = candidates
-        logger.info(f"Abas detectadas para Composições: {sheets}")
-
-    frames: list[pd.DataFrame] = []
-
-    for sheet in sheets:
-        df_raw = pd.read_excel(path, sheet_name=sheet, header=None)
-        header_row = _find_header_row(df_raw)
-        if header_row is None:
-            header_row = 4
-            logger.warning(f"[{sheet}] Cabeçalho não detectado; usando header=4 (linha 5).")
-
-        df = pd.read_excel(path, sheet_name=sheet, header=header_row)
-        lookup = _build_lookup(df.columns)
-
-        try:
-            col_codigo   = _pick_col(lookup, _COL_CANDIDATES["codigo"])
-            col_desc     = _pick_col(lookup, _COL_CANDIDATES["descricao"])
-            col_val_unit = _pick_col(lookup, _COL_CANDIDATES["valor_unit"])
-            col_banco    = _pick_col(lookup, _COL_CANDIDATES["banco"], required=False)
-        except KeyError as e:
-            logger.warning(f"[{sheet}] {e}; pulando aba.")
-            continue
-
-        # descobre a coluna real de tipo (pode ser 'Tipo' ou a primeira coluna sem nome)
-        col_tipo = _detect_tipo_column(df)
-        if col_tipo:
-            logger.info(f"[{sheet}] Coluna de tipo detectada: {col_tipo!r}")
-        else:
-            logger.warning(f"[{sheet}] Não encontrei coluna de tipo; seguindo sem filtro por tipo.")
-
-        cols = [col_codigo, col_desc, col_val_unit]
-        new_names = ["CODIGO_ORC", "DESCRICAO_ORC", "VALOR_ORC"]
-        if col_banco:
-            cols.append(col_banco)
-            new_names.append("BANCO")
-        if col_tipo:
-            cols.append(col_tipo)
-            new_names.append("TIPO_REAL")
-
-        proj = df[cols].copy()
-        proj.columns = new_names
-
-        # FILTRO: somente Composição / Composição Auxiliar (usando a coluna real)
-        if "TIPO_REAL" in proj.columns:
-            tipo_norm = proj["TIPO_REAL"].map(_norm)
-            keep = tipo_norm.str.contains(r"\bcomposicao\b", regex=True, na=False)
-            keep |= tipo_norm.str.contains(r"composicao\s+aux", regex=True, na=False)
-            drop = (~keep).sum()
-            logger.info(f"[{sheet}] Selecionando {keep.sum()} linhas de 'composição'; descartando {drop}.")
-            proj = proj[keep]
-
-        # limpeza
-        proj["CODIGO_ORC"] = proj["CODIGO_ORC"].map(norm_code)
-        proj["DESCRICAO_ORC"] = proj["DESCRICAO_ORC"].astype(str).str.strip()
-
-        # garantir numérico e aplicar escala (ex.: 0.01 se vier 100x)
-        proj["VALOR_ORC"] = pd.to_numeric(proj["VALOR_ORC"], errors="coerce")
-        if valor_scale != 1.0:
-            proj["VALOR_ORC"] = proj["VALOR_ORC"] * float(valor_scale)
-
-        if banco and "BANCO" in proj.columns:
-            alvo = _norm(banco)
-            proj = proj[proj["BANCO"].map(_norm).eq(alvo)]
-
-        proj = proj.dropna(subset=["CODIGO_ORC", "DESCRICAO_ORC"])
-        frames.append(proj)
-
-    if not frames:
-        raise RuntimeError("Nenhuma aba de 'Composições' válida foi encontrada.")
+    xls = abrir(path)
+    for sheet in xls.sheet_names:
+        head = ler(xls, sheet, header=None, nrows=max_rows)
+        vals = head.values
+        for i in range(vals.shape[0]):
+            for j in range(vals.shape[1]):
+                cell = vals[i, j]
+                if not isinstance(cell, str) or not _DATA_BASE_LABEL_RE.search(_norm(cell)):
+                    continue
+                # mesma célula (após o rótulo), depois à direita, depois abaixo
+                resto = _DATA_BASE_LABEL_RE.split(_norm(cell), maxsplit=1)[-1]
+                vizinhos = [resto, *vals[i, j + 1:j + 4]]
+                if i + 1 < vals.shape[0]:
+                    vizinhos.append(vals[i + 1, j])
+                for v in vizinhos:
+                    if v is None or (isinstance(v, float) and pd.isna(v)):
+                        continue
+                    mes = _parse_mes_ref(v)
+                    if mes:
+                        logger.info("[%s] Data-base do orçamento: %s", sheet, mes)
+                        return mes
+    return None
 
-    df_all = pd.concat(frames, ignore_index=True)
+# ---------- Loader principal ----------
 
-    # ---- construir Dict[chave_unica, Item] ----
+def _abas_composicoes(sheet_names: list[str], sheets: list[str | int] | None) -> list[str | int]:
+    if sheets is not None:
+        return sheets
+    candidates = [s for s in sheet_names if _looks_like_composicoes(s)]
+    if not candidates:
+        logger.warning("Nenhuma aba 'Composições' detectada; usando a primeira como fallback.")
+        candidates = [sheet_names[0]]
+    logger.info(f"Abas detectadas para Composições: {candidates}")
+    return candidates
+
+
+def _mapear_colunas(
+    df: pd.DataFrame,
+    sheet: str | int,
+    amostra: bool = False,
+) -> tuple[list[str], list[str]] | None:
+    """
+    Colunas de origem e nomes internos (CODIGO_ORC, ...); None se a aba não serve.
+    Com `amostra` (linhas da sonda), a falta da coluna de tipo não é logada: quem
+    chama lê a aba inteira e procura de novo.
+    """
+    lookup = _build_lookup(df.columns)
+    try:
+        col_codigo   = _pick_col(lookup, _COL_CANDIDATES["codigo"])
+        col_desc     = _pick_col(lookup, _COL_CANDIDATES["descricao"])
+        col_val_unit = _pick_col(lookup, _COL_CANDIDATES["valor_unit"])
+        col_banco    = _pick_col(lookup, _COL_CANDIDATES["banco"], required=False)
+    except KeyError as e:
+        logger.warning(f"[{sheet}] {e}; pulando aba.")
+        return None
+
+    # descobre a coluna real de tipo (pode ser 'Tipo' ou a primeira coluna sem nome)
+    col_tipo = _detect_tipo_column(df)
+    if col_tipo:
+        logger.info(f"[{sheet}] Coluna de tipo detectada: {col_tipo!r}")
+    elif not amostra:
+        logger.warning(f"[{sheet}] Não encontrei coluna de tipo; seguindo sem filtro por tipo.")
+
+    cols = [col_codigo, col_desc, col_val_unit]
+    new_names = ["CODIGO_ORC", "DESCRICAO_ORC", "VALOR_ORC"]
+    if col_banco:
+        cols.append(col_banco)
+        new_names.append("BANCO")
+    if col_tipo:
+        cols.append(col_tipo)
+        new_names.append("TIPO_REAL")
+    return cols, new_names
+
+
+def _projetar(
+    df: pd.DataFrame,
+    cols: list[str],
+    new_names: list[str],
+    banco: str | None,
+    valor_scale: float,
+) -> tuple[pd.DataFrame, int]:
+    """Projeção + filtro por tipo/banco + limpeza; devolve (linhas, descartadas pelo tipo)."""
+    proj = df[cols].copy()
+    proj.columns = new_names
+
+    # FILTRO: somente Composição / Composição Auxiliar (usando a coluna real)
+    drop = 0
+    if "TIPO_REAL" in proj.columns:
+        tipo_norm = proj["TIPO_REAL"].map(_norm)
+        keep = tipo_norm.str.contains(r"\bcomposicao\b", regex=True, na=False)
+        keep |= tipo_norm.str.contains(r"composicao\s+aux", regex=True, na=False)
+        drop = int((~keep).sum())
+        proj = proj[keep]
+
+    # limpeza
+    proj["CODIGO_ORC"] = proj["CODIGO_ORC"].map(norm_code)
+    proj["DESCRICAO_ORC"] = proj["DESCRICAO_ORC"].astype(str).str.strip()
+
+    # garantir numérico e aplicar escala (ex.: 0.01 se vier 100x)
+    proj["VALOR_ORC"] = pd.to_numeric(proj["VALOR_ORC"], errors="coerce")
+    if valor_scale != 1.0:
+        proj["VALOR_ORC"] = proj["VALOR_ORC"] * float(valor_scale)
+
+    if banco and "BANCO" in proj.columns:
+        alvo = _norm(banco)
+        proj = proj[proj["BANCO"].map(_norm).eq(alvo)]
+
+    proj = proj.dropna(subset=["CODIGO_ORC", "DESCRICAO_ORC"])
+    return proj, drop
+
+
+def _itens(df: pd.DataFrame, occ_counter: dict[str, int]) -> CanonDict:
+    """Dict[chave_unica, Item]; `occ_counter` segue entre chamadas (chaves __occN estáveis)."""
     out: CanonDict = {}
-    occ_counter: dict[str, int] = {}
+    tem_banco = "BANCO" in df.columns
 
-    for _, row in df_all.iterrows():
+    progresso_total(len(df))
+    for _, row in df.iterrows():
+        checkpoint()
         codigo_base = row["CODIGO_ORC"]
 
         # conta ocorrência deste código
@@ -200,14 +253,140 @@ def load_orcamento(
             "descricao": row["DESCRICAO_ORC"],
             "valor_unit": valor_unit,
             "fonte": "ORCAMENTO",
-            "banco": str(row["BANCO"]).strip() if "BANCO" in df_all.columns else None,
+            "banco": str(row["BANCO"]).strip() if tem_banco else None,
         }
 
         out[key] = item
+    return out
+
 
+def _log_duplicados(occ_counter: dict[str, int]) -> None:
     # log opcional: quantos duplicados de fato existem
     dup_total = sum(occ - 1 for occ in occ_counter.values() if occ > 1)
     if dup_total:
         logger.info("ORÇAMENTO: %d ocorrência(s) duplicada(s) mantidas como entradas distintas.", dup_total)
 
+
+def load_orcamento(
+    path: str | pd.ExcelFile,
+    sheets: list[str | int] | None = None,  # se None, tenta "Composições"
+    banco: str | None = None,               # se existir coluna
+    valor_scale: float = 1.0,
+) -> CanonDict:
+    """
+    Lê a(s) aba(s) **Composições** e retorna Dict[codigo, Item] no esquema canônico,
+    **filtrando apenas 'Composição' e 'Composição Auxiliar'** (usando a coluna real de tipo).
+    """
+    xls = abrir(path)
+    sheets = _abas_composicoes(xls.sheet_names, sheets)
+
+    frames: list[pd.DataFrame] = []
+
+    for sheet in sheets:
+        topo = sondar(xls, sheet)
+        header_row = _find_header_row(topo)
+        if header_row is None:
+            header_row = 4
+            logger.warning(f"[{sheet}] Cabeçalho não detectado; usando header=4 (linha 5).")
+
+        # colunas resolvidas na sonda: a leitura principal só converte essas
+        sonda = cabecalho(topo, header_row)
+        mapa = _mapear_colunas(sonda[1], sheet, amostra=True) if sonda else None
+        if sonda and mapa is None:
+            continue  # faltam colunas obrigatórias no cabeçalho
+        if mapa is not None and "TIPO_REAL" in mapa[1]:
+            df = ler_colunas(xls, sheet, header_row, sonda[0], mapa[0])
+        else:
+            # tipo não aparece nas primeiras linhas: procura na aba inteira
+            df = ler(xls, sheet, header=header_row)
+            mapa = _mapear_colunas(df, sheet)
+            if mapa is None:
+                continue
+
+        proj, drop = _projetar(df, *mapa, banco, valor_scale)
+        if "TIPO_REAL" in mapa[1]:
+            logger.info(f"[{sheet}] Selecionando {len(proj)} linhas de 'composição'; descartando {drop}.")
+        frames.append(proj)
+
+    if not frames:
+        raise RuntimeError("Nenhuma aba de 'Composições' válida foi encontrada.")
+
+    df_all = pd.concat(frames, ignore_index=True)
+
+    occ_counter: dict[str, int] = {}
+    out = _itens(df_all, occ_counter)
+    _log_duplicados(occ_counter)
     return out
+
+
+# ---------- Leitura em lotes (orçamentos muito grandes) ----------
+
+def iter_orcamento(
+    path: str,
+    sheets: list[str | int] | None = None,
+    banco: str | None = None,
+    valor_scale: float = 1.0,
+    chunk_rows: int = 20_000,
+) -> Iterator[CanonDict]:
+    """
+    Mesma leitura de `load_orcamento`, mas em lotes de até `chunk_rows` linhas da
+    planilha (openpyxl read-only): a memória não cresce com o tamanho do orçamento.
+    As chaves `__occN` continuam únicas no arquivo inteiro. Diferenças em relação
+    ao loader em bloco: o código mantém a forma da célula (sem o `.0` que o pandas
+    põe em colunas numéricas com vazios) e a coluna de tipo é detectada no 1º lote.
+    """
+    wb = load_workbook(path, data_only=True, read_only=True)
+    try:
+        sheets = _abas_composicoes(wb.sheetnames, sheets)
+        occ_counter: dict[str, int] = {}
+        validas = 0
+
+        for sheet in sheets:
+            ws = wb[sheet] if isinstance(sheet, str) else wb.worksheets[sheet]
+            # linhas em branco são puladas, como no read_excel
+            rows = (
+                [math.nan if v is None else v for v in r]
+                for r in ws.iter_rows(values_only=True)
+                if any(v is not None for v in r)
+            )
+
+            # cabeçalho: mesma regra de _find_header_row nas primeiras 50 linhas
+            topo = list(itertools.islice(rows, 50))
+            header_row = _find_header_row(pd.DataFrame(topo, dtype=object)) if topo else None
+            if header_row is None:
+                header_row = 4
+                logger.warning(f"[{sheet}] Cabeçalho não detectado; usando header=4 (linha 5).")
+            if header_row >= len(topo):
+                continue
+            header = tuple(None if isinstance(v, float) and math.isnan(v) else v for v in topo[header_row])
+            nomes = nomes_colunas(header)
+            n = len(nomes)
+            corpo = itertools.chain(topo[header_row + 1:], rows)
+
+            mapa = None
+            lidas = mantidas = descartadas = 0
+            while True:
+                bloco = [(r + [math.nan] * (n - len(r)))[:n] for r in itertools.islice(corpo, chunk_rows)]
+                if not bloco:
+                    break
+                df = pd.DataFrame(bloco, columns=nomes, dtype=object)
+                if mapa is None:
+                    mapa = _mapear_colunas(df, sheet)
+                    if mapa is None:
+                        break
+                    validas += 1
+                proj, drop = _projetar(df, *mapa, banco, valor_scale)
+                lidas += len(bloco)
+                mantidas += len(proj)
+                descartadas += drop
+                if len(proj):
+                    yield _itens(proj, occ_counter)
+
+            if mapa is not None:
+                logger.info(f"[{sheet}] {lidas} linhas lidas em lotes; {mantidas} de 'composição', {descartadas} descartadas.")
+
+        if not validas:
+            raise RuntimeError("Nenhuma aba de 'Composições' válida foi encontrada.")
+        _log_duplicados(occ_counter)
+    finally:
+        wb.close()
@@ -9,6 +9,8 @@ import pandas as pd
 
 from ..models import Item, CanonDict
 from ..utils.utils_code import norm_code_canonical as _norm_code
+from ..utils.checkpoint import checkpoint, total as progresso_total
+from ..utils.planilha import abrir, ler, sondar
 
 
 def _norm_text(x: object) -> str:
@@ -116,7 +118,7 @@ def _find_header(df: pd.DataFrame) -> Tuple[int, Dict[str, int], Dict[str, int]]
     raise ValueError("Cabeçalho da planilha SECID não encontrado.")
 
 
-def load_secid_precos(path: Path | str) -> CanonDict:
+def load_secid_precos(path: Path | str | pd.ExcelFile) -> CanonDict:
     """
     Lê planilha da SECID (Edificações) e retorna um CanonDict:
       { codigo_canon: Item(codigo, descricao, valor_unit, unidade, banco='SECID') }
@@ -126,17 +128,24 @@ def load_secid_precos(path: Path | str) -> CanonDict:
         e delas extraímos o preço unitário da composição (TOTAL ou MATERIAL+MÃO).
       - Linhas de insumos/filhos são ignoradas para efeito de preço unitário da composição.
     """
-    path = Path(path)
-    xls = pd.ExcelFile(path)
-    df = pd.read_excel(xls, sheet_name=xls.sheet_names[0], header=None)
-
-    row0, cols, cost = _find_header(df)
+    xls = abrir(path)
+    sheet = xls.sheet_names[0]
+    topo = sondar(xls, sheet, nrows=51)
+    row0, cols, cost = _find_header(topo)
     start = row0 + 2  # pula linha de subcabeçalho
 
+    # leitura principal já depois do cabeçalho e só das colunas mapeadas; dtype=object
+    # mantém as células como na leitura com header=None (códigos numéricos não viram float)
+    usadas = sorted({c for c in (*cols.values(), *cost.values()) if c >= 0})
+    df = ler(xls, sheet, header=None, skiprows=start, usecols=usadas, dtype=object)
+    df = df.reindex(columns=range(topo.shape[1]))  # posições do cabeçalho (não usadas ficam vazias)
+
     out: CanonDict = {}
     fonte = "SECID/Edificações (desonerado)"
 
-    for i in range(start, len(df)):
+    progresso_total(len(df))
+    for i in range(len(df)):
+        checkpoint()
         row = df.iloc[i]
 
         tipo = _norm_text(row.iloc[cols["tipo"]]) if cols["tipo"] >= 0 else ""
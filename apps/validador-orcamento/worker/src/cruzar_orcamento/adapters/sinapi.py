@@ -3,14 +3,16 @@ from __future__ import annotations
 
 import logging
 import re
-from typing import Optional, Dict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 import unicodedata
 
+import numpy as np
 import pandas as pd
 from openpyxl import load_workbook
 
 from ..models import Item, CanonDict
 from ..utils.utils_text import norm_code
+from ..utils.checkpoint import checkpoint, total as progresso_total
 
 logger = logging.getLogger(__name__)
 
@@ -55,114 +57,259 @@ def _smart_to_float(x) -> Optional[float]:
     except ValueError:
         return None
 
-# ----------------- loader principal -----------------
+# ----------------- matriz de preços (todas as localidades) -----------------
 
-def load_sinapi_ccd_pr(path: str, cidade: str = "CURITIBA") -> CanonDict:
+# Abas de custo de composições: CCD = com desoneração, CSD = sem desoneração
+REGIMES = ("CCD", "CSD")
+_REGIME_ALIASES = {
+    "ccd": "CCD", "desonerado": "CCD", "com_desoneracao": "CCD",
+    "csd": "CSD", "nao_desonerado": "CSD", "sem_desoneracao": "CSD",
+}
+
+# Layout da planilha (1-based, Excel): UF na linha 4, cidade na 5, rótulos na 10
+_UF_ROW, _CIDADE_ROW, _LABEL_ROW = 4, 5, 10
+_UF_RE = re.compile(r"^[A-Z]{2}$")
+
+Localidade = Tuple[str, str, str]  # (regime, UF, cidade)
+
+
+def norm_regime(regime: Optional[str]) -> str:
+    r = _REGIME_ALIASES.get(_norm(regime or "ccd").replace(" ", "_").replace("-", "_"))
+    if r is None:
+        raise ValueError(f"Regime SINAPI inválido: {regime!r}. Use CCD (desonerado) ou CSD (não desonerado).")
+    return r
+
+
+def _cell_code(v: Any) -> Optional[str]:
+    code = _extract_code_from_formula(v) if isinstance(v, str) and v.startswith("=") \
+           else (str(v).strip() if v is not None else None)
+    return code if isinstance(code, str) and _DIGIT_CODE_RE.fullmatch(code) else None
+
+
+def parse_localidade(x: Any) -> Tuple[str, str, Optional[str]]:
     """
-    Lê a aba CCD do SINAPI e retorna Dict[codigo, Item] usando a coluna ('PR', cidade) como CUSTO.
-    Extrai código da fórmula HYPERLINK; lê código/descrição/custo **da mesma linha** (openpyxl),
-    iniciando no primeiro código numérico para evitar deslocamentos de observações no topo.
+    Aceita {"uf", "cidade"?, "regime"?} ou texto "UF", "UF/CIDADE", "CSD:UF/CIDADE"
+    (mesmo formato de `SinapiMatriz.label`). Retorna (regime, UF, cidade|None).
     """
-    # 1) Use pandas só para detectar header e localizar índices de colunas
-    dfm = pd.read_excel(path, sheet_name="CCD", header=[3, 4])
-    header_row = 4                      # linha com rótulos "Grupo / Código / Descrição" (idx pandas)
-    probe = dfm.iloc[header_row]
-
-    def pick_first(*starts: str):
-        for col in dfm.columns:
-            if any(_norm(str(probe[col])).startswith(_norm(s)) for s in starts):
-                return col
-        return None
+    if isinstance(x, dict):
+        regime, uf, cidade = x.get("regime"), x.get("uf"), x.get("cidade")
+    else:
+        txt = str(x or "").strip()
+        regime, _, rest = txt.rpartition(":")
+        uf, _, cidade = rest.partition("/")
+    uf = str(uf or "").strip().upper()
+    if not _UF_RE.fullmatch(uf):
+        raise ValueError(f"Localidade SINAPI inválida: {x!r} (UF de 2 letras obrigatória).")
+    return norm_regime(regime or None), uf, (str(cidade).strip() or None) if cidade else None
 
-    col_grupo  = pick_first("grupo")
-    col_codigo = pick_first("codigo", "código")
-    col_desc   = pick_first("descricao", "descrição")
-    if not all([col_grupo, col_codigo, col_desc]):
-        raise RuntimeError(f"[SINAPI CCD] Não encontrei colunas básicas. "
-                           f"grupo={col_grupo}, codigo={col_codigo}, desc={col_desc}")
-
-    # custo do PR: ('PR', cidade) — a subcoluna .1 é %AS; evitamos ela
-    pr_custo_col = None
-    for a, b in dfm.columns:
-        if _norm(a) == "pr" and _norm(b) == _norm(cidade):
-            pr_custo_col = (a, b)
-            break
-    if pr_custo_col is None:
-        candidates = [c for c in dfm.columns
-                      if c[0] == "PR" and _norm(c[1]).startswith(_norm(cidade)) and not str(c[1]).endswith(".1")]
-        if not candidates:
-            raise RuntimeError(f"[SINAPI CCD] Coluna de custo PR/{cidade} não encontrada.")
-        pr_custo_col = candidates[0]
-
-    # Índices de coluna (1-based no Excel) conforme a ordem do pandas
-    x_col_codigo = list(dfm.columns).index(col_codigo) + 1
-    x_col_desc   = list(dfm.columns).index(col_desc)   + 1
-    x_col_custo  = list(dfm.columns).index(pr_custo_col) + 1
-
-    # 2) Leia diretamente do Excel (openpyxl) para manter as três colunas alinhadas por linha
-    wb = load_workbook(path, data_only=False, read_only=False)
-    ws = wb["CCD"]
-
-    # a primeira linha de dados (em Excel) é header_row+2
-    start_row_excel = (header_row + 1) + 1
-
-    # Avance até encontrar o primeiro código numérico (evita bloco de observações)
-    r = start_row_excel
-    max_r = ws.max_row
-    first_data_row = None
-    while r <= max_r:
-        v = ws.cell(row=r, column=x_col_codigo).value
-        code = _extract_code_from_formula(v) if isinstance(v, str) and v.startswith("=") \
-               else (str(v).strip() if v is not None else None)
-        if isinstance(code, str) and _DIGIT_CODE_RE.fullmatch(code):
-            first_data_row = r
+
+class SinapiMatriz:
+    """
+    Preços SINAPI de todas as localidades numa matriz colunar:
+      - `codigos[i]` / `descricoes[i]` → linha i
+      - `localidades[j]` = (regime, UF, cidade) → coluna j
+      - `precos[i, j]` (float64; NaN = célula de custo vazia)
+      - `presente[i, j]` (bool; o código consta da aba daquela coluna)
+
+    Lida uma única vez; `to_canon(uf, cidade, regime)` devolve o CanonDict de uma
+    localidade (mesmo formato de `load_sinapi_ccd_pr`) sem reabrir a planilha.
+    """
+
+    def __init__(
+        self,
+        codigos: List[str],
+        descricoes: List[str],
+        localidades: List[Localidade],
+        precos: np.ndarray,
+        presente: Optional[np.ndarray] = None,
+    ) -> None:
+        self.codigos = codigos
+        self.descricoes = descricoes
+        self.localidades = localidades
+        self.precos = precos
+        self.presente = presente if presente is not None else ~np.isnan(precos)
+        self.row = {c: i for i, c in enumerate(codigos)}
+        self.loc_idx = {loc: j for j, loc in enumerate(localidades)}
+
+    def __len__(self) -> int:
+        return len(self.codigos)
+
+    def localidade(self, uf: str, cidade: Optional[str] = None, regime: Optional[str] = "CCD") -> int:
+        """
+        Índice da coluna de (regime, UF, cidade). Sem cidade, aceita a única
+        cidade da UF (no SINAPI, a capital). Cidade casa por igualdade ou prefixo.
+        """
+        reg = norm_regime(regime)
+        uf_n = (uf or "").strip().upper()
+        cands = [(j, loc) for j, loc in enumerate(self.localidades) if loc[0] == reg and loc[1] == uf_n]
+        if cidade:
+            exact = [j for j, loc in cands if _norm(loc[2]) == _norm(cidade)]
+            prefix = [j for j, loc in cands if _norm(loc[2]).startswith(_norm(cidade))]
+            found = exact or prefix
+        else:
+            found = [j for j, _ in cands]
+        if len(found) == 1 or (cidade and found):
+            return found[0]
+        alvo = f"{uf_n}/{cidade}" if cidade else uf_n
+        if not found:
+            raise RuntimeError(f"[SINAPI {reg}] Coluna de custo {alvo} não encontrada.")
+        raise RuntimeError(f"[SINAPI {reg}] UF {uf_n} tem várias cidades; informe a cidade.")
+
+    def label(self, j: int) -> str:
+        reg, uf, cidade = self.localidades[j]
+        return f"{reg}:{uf}/{cidade}"
+
+    def to_canon(self, uf: str, cidade: Optional[str] = None, regime: Optional[str] = "CCD") -> CanonDict:
+        j = self.localidade(uf, cidade, regime)
+        col = self.precos[:, j]
+        out: CanonDict = {}
+        for i in np.flatnonzero(self.presente[:, j]):
+            v = col[i]
+            out[self.codigos[i]] = {
+                "codigo": self.codigos[i],
+                "descricao": self.descricoes[i],
+                # alguns finais de bloco trazem custo vazio; mantemos mas com 0.0
+                "valor_unit": 0.0 if np.isnan(v) else float(v),
+                "fonte": "SINAPI",
+            }
+        return out
+
+
+def _scan_sheet(ws) -> Tuple[List[Localidade], Dict[str, Tuple[str, List[Optional[float]]]]]:
+    """
+    Uma passada pela aba: localiza colunas de código/descrição pelos rótulos,
+    todas as colunas de custo (UF + cidade; ignora %AS) e coleta as linhas.
+    """
+    rows = ws.iter_rows(values_only=True)
+    uf_row: Sequence[Any] = ()
+    cidade_row: Sequence[Any] = ()
+    labels: Sequence[Any] = ()
+    for r, vals in enumerate(rows, start=1):
+        if r == _UF_ROW:
+            uf_row = vals
+        elif r == _CIDADE_ROW:
+            cidade_row = vals
+        elif r == _LABEL_ROW:
+            labels = vals
             break
-        r += 1
-    if first_data_row is None:
-        raise RuntimeError("[SINAPI CCD] Não encontrei nenhum código numérico na CCD.")
 
-    # 3) Varra da primeira linha válida até o fim, coletando código/descrição/custo
-    out: CanonDict = {}
-    dup = 0
-    for row in ws.iter_rows(min_row=first_data_row, max_row=max_r,
-                            min_col=min(x_col_codigo, x_col_desc, x_col_custo),
-                            max_col=max(x_col_codigo, x_col_desc, x_col_custo),
-                            values_only=False):
-        # A linha inteira veio; pegue só as 3 células relevantes
-        c_code  = row[x_col_codigo  - min(x_col_codigo, x_col_desc, x_col_custo)]
-        c_desc  = row[x_col_desc    - min(x_col_codigo, x_col_desc, x_col_custo)]
-        c_custo = row[x_col_custo   - min(x_col_codigo, x_col_desc, x_col_custo)]
-
-        # código
-        vcode = c_code.value
-        code = _extract_code_from_formula(vcode) if isinstance(vcode, str) and vcode.startswith("=") \
-               else (str(vcode).strip() if vcode is not None else None)
-        if not (isinstance(code, str) and _DIGIT_CODE_RE.fullmatch(code)):
-            # acabou a sequência de dados (normalmente após o último bloco)
+    def pick_first(*starts: str) -> Optional[int]:
+        for k, v in enumerate(labels):
+            if any(_norm(str(v)).startswith(_norm(s)) for s in starts):
+                return k
+        return None
+
+    x_codigo = pick_first("codigo", "código")
+    x_desc = pick_first("descricao", "descrição")
+    if x_codigo is None or x_desc is None:
+        raise RuntimeError(f"[SINAPI {ws.title}] Não encontrei colunas básicas. "
+                           f"codigo={x_codigo}, desc={x_desc}")
+
+    # UF vem mesclada sobre (custo, %AS): propaga para a direita
+    reg = ws.title.strip().upper()
+    cols: List[int] = []
+    locs: List[Localidade] = []
+    seen = set()
+    uf = None
+    for k in range(max(len(uf_row), len(cidade_row))):
+        u = uf_row[k] if k < len(uf_row) else None
+        if u is not None and str(u).strip():
+            uf = str(u).strip().upper() if _UF_RE.fullmatch(str(u).strip().upper()) else None
+        c = cidade_row[k] if k < len(cidade_row) else None
+        if uf is None or c is None or "%" in str(c):
             continue
+        cidade = re.sub(r"\.\d+$", "", str(c).strip())
+        if (uf, cidade) in seen:
+            continue  # 2ª subcoluna da mesma cidade (%AS)
+        seen.add((uf, cidade))
+        cols.append(k)
+        locs.append((reg, uf, cidade))
+    if not cols:
+        raise RuntimeError(f"[SINAPI {reg}] Nenhuma coluna de custo por UF/cidade encontrada.")
 
-        # descrição
-        desc = c_desc.value
+    # Dados: começam no primeiro código numérico (evita bloco de observações)
+    data: Dict[str, Tuple[str, List[Optional[float]]]] = {}
+    dup = 0
+    if ws.max_row:  # read-only: vem da dimensão gravada na planilha (pode faltar)
+        progresso_total(ws.max_row - _LABEL_ROW)
+    for vals in rows:
+        checkpoint()
+        if x_codigo >= len(vals):
+            continue
+        code = _cell_code(vals[x_codigo])
+        if code is None:
+            continue
+        desc = vals[x_desc] if x_desc < len(vals) else None
         desc = "" if desc is None else str(desc).strip()
+        custos = [_smart_to_float(vals[k]) if k < len(vals) else None for k in cols]
+        code = norm_code(code)
+        if code in data:
+            dup += 1
+        data[code] = (desc, custos)
+    if not data:
+        raise RuntimeError(f"[SINAPI {reg}] Não encontrei nenhum código numérico na {reg}.")
+    if dup:
+        logger.warning("SINAPI %s: %d código(s) duplicado(s); mantendo o último.", reg, dup)
+    return locs, data
 
-        # custo PR
-        custo = _smart_to_float(c_custo.value)
 
-        # alguns finais de bloco trazem custo vazio; mantemos mas com 0.0
-        if custo is None:
-            custo = 0.0
+def load_sinapi_matriz(path: str, regimes: Iterable[str] = REGIMES) -> SinapiMatriz:
+    """
+    Lê as abas de custo (CCD e/ou CSD) do SINAPI numa única abertura do arquivo
+    (openpyxl read-only, uma passada por aba) e monta a `SinapiMatriz` com todas
+    as colunas UF/cidade. Abas ausentes são ignoradas; ao menos uma é exigida.
+    """
+    wanted = [norm_regime(r) for r in regimes]
+    wb = load_workbook(path, data_only=False, read_only=True)
+    try:
+        sheets = {str(n).strip().upper(): n for n in wb.sheetnames}
+        scanned = []
+        for reg in wanted:
+            if reg in sheets:
+                scanned.append(_scan_sheet(wb[sheets[reg]]))
+        if not scanned:
+            raise RuntimeError(f"[SINAPI] Nenhuma aba de custo encontrada ({', '.join(wanted)}).")
+    finally:
+        wb.close()
 
-        item: Item = {
-            "codigo": norm_code(code),
-            "descricao": desc,
-            "valor_unit": float(custo),
-            "fonte": "SINAPI",
-        }
-        if item["codigo"] in out:
-            dup += 1
-        out[item["codigo"]] = item
+    # união dos códigos (descrição da primeira aba em que aparecem)
+    codigos: List[str] = []
+    descricoes: List[str] = []
+    row: Dict[str, int] = {}
+    for _, data in scanned:
+        for code, (desc, _) in data.items():
+            if code not in row:
+                row[code] = len(codigos)
+                codigos.append(code)
+                descricoes.append(desc)
 
-    if dup:
-        logger.warning("SINAPI CCD PR: %d código(s) duplicado(s); mantendo o último.", dup)
+    localidades: List[Localidade] = [loc for locs, _ in scanned for loc in locs]
+    precos = np.full((len(codigos), len(localidades)), np.nan, dtype=np.float64)
+    presente = np.zeros((len(codigos), len(localidades)), dtype=bool)
+    j0 = 0
+    for locs, data in scanned:
+        idx = np.fromiter((row[c] for c in data), dtype=np.intp, count=len(data))
+        vals = np.array(
+            [[np.nan if v is None else v for v in custos] for _, custos in data.values()],
+            dtype=np.float64,
+        ).reshape(len(data), len(locs))
+        precos[idx, j0:j0 + len(locs)] = vals
+        presente[idx, j0:j0 + len(locs)] = True
+        j0 += len(locs)
+
+    m = SinapiMatriz(codigos, descricoes, localidades, precos, presente)
+    logger.info("SINAPI: %d códigos x %d localidades (%s).", len(m), len(localidades),
+                ", ".join(sorted({loc[0] for loc in localidades})))
+    return m
+
+
+# ----------------- loader principal -----------------
 
-    return out
+def load_sinapi_ccd_pr(path: str, cidade: str = "CURITIBA") -> CanonDict:
+    """
+    Lê a aba CCD do SINAPI e retorna Dict[codigo, Item] usando a coluna ('PR', cidade) como CUSTO.
+    Extrai código da fórmula HYPERLINK; lê código/descrição/custo **da mesma linha**,
+    iniciando no primeiro código numérico para evitar deslocamentos de observações no topo.
+    Para outras UFs/cidades/regimes, use `load_sinapi_matriz(...).to_canon(...)`.
+    """
+    return load_sinapi_matriz(path, regimes=("CCD",)).to_canon("PR", cidade, "CCD")
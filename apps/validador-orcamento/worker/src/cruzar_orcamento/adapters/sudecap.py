@@ -8,6 +8,8 @@ import pandas as pd
 
 from ..models import Item, CanonDict
 from ..utils.utils_text import norm_code
+from ..utils.checkpoint import checkpoint, total as progresso_total
+from ..utils.planilha import abrir, cabecalho, ler, ler_colunas, sondar
 
 logger = logging.getLogger(__name__)
 
@@ -62,18 +64,18 @@ def _pick_col(lookup: dict[str, str], candidates: Iterable[str]) -> str:
 # ---------- Loader principal ----------
 
 def load_sudecap(
-    path: str,
+    path: str | pd.ExcelFile,
     sheet: str | int | None = None,
 ) -> CanonDict:
     """
     Lê planilha SUDECAP e retorna Dict[codigo, Item] no esquema canônico.
 
     - Usa a primeira aba por padrão (sheet=0), a menos que você especifique outra.
-    - Detecta cabeçalho automaticamente (scaneando as primeiras linhas; fallback header=4).
+    - Detecta cabeçalho automaticamente (sonda só as primeiras linhas; fallback header=4).
     - Mapeia nomes de colunas de forma flexível (aceita 'VALOR').
     - Converte vírgula decimal para ponto quando necessário.
     """
-    xls = pd.ExcelFile(path)
+    xls = abrir(path)
     sheet_names = list(xls.sheet_names)
 
     # Escolha robusta de UMA única aba
@@ -86,30 +88,33 @@ def load_sudecap(
     else:
         chosen = sheet_names[0]
 
-    # 1) Carrega sem header para detectar a linha de cabeçalho
-    df_raw = pd.read_excel(path, sheet_name=chosen, header=None)
-    if isinstance(df_raw, dict):  # segurança extra caso engine retorne dict
-        df_raw = next(iter(df_raw.values()))
-
-    header_row = _find_header_row(df_raw)
+    # 1) Sonda as primeiras linhas (sem header) para detectar a linha de cabeçalho
+    topo = sondar(xls, chosen, nrows=40)  # mesma sonda da estrutura (estrutura_sudecap)
+    header_row = _find_header_row(topo)
     if header_row is None:
         # fallback comum: linha 5 (index 4)
         header_row = 4
         logger.warning(f"[{chosen!r}] Cabeçalho não detectado; usando header=4 (linha 5).")
 
-    # 2) Recarrega com header correto
-    df = pd.read_excel(path, sheet_name=chosen, header=header_row)
-    if isinstance(df, dict):  # segurança extra
-        df = next(iter(df.values()))
+    # 2) Colunas pelo cabeçalho da sonda; a leitura principal só converte essas três
+    sonda = cabecalho(topo, header_row)
+    if sonda is None:
+        df = ler(xls, chosen, header=header_row)
+        colunas = list(df.columns)
+    else:
+        colunas = sonda[0]
 
-    lookup = _build_lookup(df.columns)
+    lookup = _build_lookup(colunas)
 
     try:
         col_codigo   = _pick_col(lookup, _COL_CANDIDATES["codigo"])
         col_desc     = _pick_col(lookup, _COL_CANDIDATES["descricao"])
         col_val_unit = _pick_col(lookup, _COL_CANDIDATES["valor_unit"])
     except KeyError as e:
-        raise KeyError(f"[{chosen!r}] {e}. Colunas disponíveis: {list(df.columns)}") from e
+        raise KeyError(f"[{chosen!r}] {e}. Colunas disponíveis: {colunas}") from e
+
+    if sonda is not None:
+        df = ler_colunas(xls, chosen, header_row, colunas, [col_codigo, col_desc, col_val_unit])
 
     proj = df[[col_codigo, col_desc, col_val_unit]].copy()
     proj.columns = ["CODIGO_SUDECAP", "DESCRICAO_SUDECAP", "VALOR_SUDECAP"]
@@ -134,7 +139,9 @@ def load_sudecap(
     # ---- construir Dict[codigo, Item] ----
     out: CanonDict = {}
     dup_count = 0
+    progresso_total(len(proj))
     for _, row in proj.iterrows():
+        checkpoint()
         codigo = row["CODIGO_SUDECAP"]
         item: Item = {
             "codigo": codigo,
@@ -3,10 +3,17 @@ from __future__ import annotations
 
 import re
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from ..utils.utils_code import norm_code_canonical
 from ..utils.utils_text import norm_text
+from ..utils.utils_num import to_float as _to_float
+from ..utils.checkpoint import checkpoint, total as progresso_total
+from .bank_index import BankIndex, ParentIndex
+from .code_index import SUGESTOES_K, CodeIndex
+from .explosao import Explosao, comparar_folhas
+from . import paralelo
+from .similarity import DescIndex, DescSignature, desc_equivalentes, signature, similarity
 
 
 # ============================================================
@@ -32,25 +39,6 @@ def _canon(code: Any) -> str:
     return norm_code_canonical(s)
 
 
-def _to_float(x: Any) -> Optional[float]:
-    """
-    Converte valores heterogêneos para float.
-
-    - Aceita int/float diretamente.
-    - Converte strings trocando vírgula por ponto.
-    - Retorna None em branco/None/conversão inválida.
-    """
-    if x is None or x == "":
-        return None
-    if isinstance(x, (int, float)):
-        return float(x)
-    s = str(x).strip().replace(",", ".")
-    try:
-        return float(s)
-    except ValueError:
-        return None
-
-
 def _dir(a_val: Optional[float], b_val: Optional[float]) -> str:
     """
     Direção da divergência considerando A=Orçamento e B=Referência.
@@ -70,7 +58,7 @@ def _dir(a_val: Optional[float], b_val: Optional[float]) -> str:
     return "IGUAL"
 
 
-def _bank_norm(banco: Any) -> Optional[str]:
+def bank_norm(banco: Any) -> Optional[str]:
     """
     Normaliza o campo 'banco' do item do Orçamento para as bases suportadas.
 
@@ -102,9 +90,16 @@ def _compare_precos(
     b_val: Optional[float],
     tol_rel: float,
     comparar_descricao: bool,
+    desc_sim_min: float = 1.0,
+    a_sig: Optional[DescSignature] = None,
+    b_sig: Optional[DescSignature] = None,
 ) -> Tuple[bool, Dict[str, Any]]:
     """
     Compara um item do Orçamento (a_desc/a_val) com o item da base (b_desc/b_val).
+
+    Descrições: com `desc_sim_min` < 1.0, textos não idênticos mas com nota de
+    similaridade >= limiar (e mesmos números) são aceitos; a nota vai em `desc_sim`.
+    `a_sig`/`b_sig` permitem reaproveitar assinaturas já calculadas.
     """
     motivos: List[str] = []
     extras: Dict[str, Any] = {}
@@ -135,11 +130,16 @@ def _compare_precos(
 
     # 3) descrição
     if comparar_descricao:
-        if norm_text(a_desc) != norm_text(b_desc or ""):
-            motivos.append("DESCRICAO_DIVERGENTE")
-            extras["a_desc"] = a_desc
+        sa = a_sig if a_sig is not None else signature(a_desc)
+        sb = b_sig if b_sig is not None else signature(b_desc or "")
+        if sa.norm != sb.norm:
             if b_desc is not None:
-                extras["b_desc"] = b_desc
+                extras["desc_sim"] = similarity(sa, sb)
+            if b_desc is None or not desc_equivalentes(sa, sb, desc_sim_min):
+                motivos.append("DESCRICAO_DIVERGENTE")
+                extras["a_desc"] = a_desc
+                if b_desc is not None:
+                    extras["b_desc"] = b_desc
 
     if motivos:
         extras["motivos"] = motivos
@@ -154,16 +154,57 @@ def _build_ref_block(
     ref_item: Optional[Dict[str, Any]],
     tol_rel: float,
     comparar_descricao: bool,
+    desc_sim_min: float = 1.0,
+    a_sig: Optional[DescSignature] = None,
+    desc_idx: Optional[DescIndex] = None,
 ) -> Dict[str, Any]:
     """
     Monta o bloco de comparação para uma referência (qualquer banco).
     """
     b_desc = ref_item.get("descricao") if ref_item else None
     b_val = ref_item.get("valor_unit") if ref_item else None
-    ok, extras = _compare_precos(a_desc, a_val, b_desc, b_val, tol_rel, comparar_descricao)
+    b_sig = desc_idx.get(b_desc) if (desc_idx is not None and b_desc is not None) else None
+    ok, extras = _compare_precos(
+        a_desc, a_val, b_desc, b_val, tol_rel, comparar_descricao,
+        desc_sim_min=desc_sim_min, a_sig=a_sig, b_sig=b_sig,
+    )
     out: Dict[str, Any] = {"valor": b_val, "ok": ok}
     if not ok:
         out.update(extras)
+    elif "desc_sim" in extras:
+        out["desc_sim"] = extras["desc_sim"]  # aceito por similaridade
+    return out
+
+
+def _build_ref_block_idx(
+    a_desc: str,
+    a_val: Optional[float],
+    idx: BankIndex,
+    row: Optional[int],
+    tol_rel: float,
+    comparar_descricao: bool,
+    desc_sim_min: float = 1.0,
+) -> Dict[str, Any]:
+    """
+    `_build_ref_block` sobre uma linha do BankIndex (valor já convertido e
+    assinatura da descrição guardada na própria linha).
+    """
+    if row is None:
+        b_desc, b_val, b_sig = None, None, None
+        valor = None
+    else:
+        b_desc, b_val = idx.descricoes[row], idx.valores[row]
+        b_sig = idx.assinatura(row) if (comparar_descricao and b_desc is not None) else None
+        valor = idx.itens[row].get("valor_unit")
+    ok, extras = _compare_precos(
+        a_desc, a_val, b_desc, b_val, tol_rel, comparar_descricao,
+        desc_sim_min=desc_sim_min, b_sig=b_sig,
+    )
+    out: Dict[str, Any] = {"valor": valor, "ok": ok}
+    if not ok:
+        out.update(extras)
+    elif "desc_sim" in extras:
+        out["desc_sim"] = extras["desc_sim"]  # aceito por similaridade
     return out
 
 
@@ -190,7 +231,7 @@ def consolidar_precos(
 
         a_desc = a.get("descricao", "")
         a_val = _to_float(a.get("valor_unit"))
-        a_banco = _bank_norm(a.get("banco"))
+        a_banco = bank_norm(a.get("banco"))
 
         s = sinapi.get(codigo_base) or sinapi.get(codigo_orc) or sinapi.get(key)
         u = sudecap.get(codigo_base) or sudecap.get(codigo_orc) or sudecap.get(key)
@@ -262,102 +303,266 @@ def consolidar_precos(
     return payload
 
 
+DETALHES = ("completo", "divergencias")
+
+# abaixo disto a consolidação em processos não compensa o fork + retorno dos resultados
+PARALELO_MIN_ITENS = 20_000
+
+
+def norm_detalhe(detalhe: Optional[str]) -> str:
+    """'completo' (default) | 'divergencias'."""
+    d = str(detalhe or "completo").strip().lower()
+    if d not in DETALHES:
+        raise ValueError(f"detalhe inválido: {detalhe!r} (use completo ou divergencias).")
+    return d
+
+
+def chave_cruzado(r: Dict[str, Any]) -> Tuple[str, str]:
+    """Ordem de `cruzado` nos artefatos."""
+    return (r["codigo_base"], r["codigo"])
+
+
+def chave_divergencia(r: Dict[str, Any]) -> Tuple[str, str]:
+    """Ordem de `divergencias` nos artefatos."""
+    return (r["ref"], r["codigo"])
+
+
+class ComparadorPrecos:
+    """
+    Comparação de preços do orçamento contra várias bases, com estado (índices
+    das bases e contadores) reaproveitado entre lotes do orçamento:
+    `consolidar_precos_multi` compara tudo de uma vez; o modo streaming chama
+    `comparar` lote a lote e manda as linhas direto para o exportador.
+    Regras: ver `consolidar_precos_multi`.
+    """
+
+    def __init__(
+        self,
+        bancos: Dict[str, Dict[str, Dict[str, Any]]],
+        *,
+        tol_rel: float = 0.05,
+        comparar_descricao: bool = True,
+        desc_sim_min: float = 1.0,
+        sugestoes_k: int = SUGESTOES_K,
+        detalhe: str = "completo",
+    ) -> None:
+        self.tol_rel = tol_rel
+        self.comparar_descricao = comparar_descricao
+        self.desc_sim_min = desc_sim_min
+        self.sugestoes_k = sugestoes_k
+        self.detalhe = norm_detalhe(detalhe)
+
+        # normaliza chaves dos bancos (maiúsculas)
+        self.banks_upper = {k.upper(): v for k, v in (bancos or {}).items()}
+        self.bank_keys_sorted = sorted(self.banks_upper.keys())  # ordem estável
+
+        # assinaturas de descrição: calculadas uma vez por descrição de cada base
+        self.desc_idx = {k: DescIndex() for k in self.bank_keys_sorted}
+        # índice de consulta (chave, código e canônico → linha): montado uma vez por base;
+        # bases já indexadas (BankIndex) são reaproveitadas
+        self.bank_idx = {
+            k: BankIndex.de(self.banks_upper[k], desc_idx=self.desc_idx[k]) for k in self.bank_keys_sorted
+        }
+        for k, idx in self.bank_idx.items():
+            self.desc_idx[k] = idx.desc_idx
+        # índice de códigos: montado só na primeira ausência em cada base
+        self.code_idx: Dict[str, CodeIndex] = {}
+
+        # contadores por banco
+        self.comparados = {k: 0 for k in self.bank_keys_sorted}
+        self.oks = {f"{k.lower()}_ok": 0 for k in self.bank_keys_sorted}
+        self.desc_aproximadas = 0
+        self.itens_orc = 0
+        self.ignorados_por_banco = 0
+
+    def comparar(self, orc: Dict[str, Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Compara um lote do orçamento; devolve (itens, divergências) na ordem do lote."""
+        banks_upper, bank_keys_sorted = self.banks_upper, self.bank_keys_sorted
+        completo = self.detalhe == "completo"
+        itens: List[Dict[str, Any]] = []
+
+        progresso_total(len(orc))
+        for key, a in orc.items():
+            checkpoint()
+            codigo_orc = a.get("codigo") or key
+            codigo_base = _canon(codigo_orc)
+            a_desc = a.get("descricao", "")
+            a_val = _to_float(a.get("valor_unit"))
+            a_banco = bank_norm(a.get("banco"))  # "SINAPI"/"SUDECAP"/"SECID"/None
+
+            blocks: Dict[str, Any] = {}
+            if a_banco and a_banco in banks_upper:
+                # compara apenas com o banco indicado (só ele é consultado); os demais ficam nao_aplicavel
+                self.comparados[a_banco] += 1
+                idx = self.bank_idx[a_banco]
+                row = idx.buscar(codigo_base, codigo_orc, key)
+                for tag in bank_keys_sorted:
+                    if tag == a_banco:
+                        blk = _build_ref_block_idx(
+                            a_desc, a_val, idx, row, self.tol_rel, self.comparar_descricao,
+                            desc_sim_min=self.desc_sim_min,
+                        )
+                        if blk.get("ok"):
+                            self.oks[f"{tag.lower()}_ok"] += 1
+                            if "desc_sim" in blk:
+                                self.desc_aproximadas += 1
+                        elif self.sugestoes_k > 0 and "CODIGO_NAO_ENCONTRADO" in blk.get("motivos", []):
+                            if tag not in self.code_idx:
+                                self.code_idx[tag] = CodeIndex(idx.base, desc_idx=self.desc_idx[tag])
+                            blk["sugestoes"] = self.code_idx[tag].sugerir(codigo_base, a_desc, k=self.sugestoes_k)
+                        blocks[tag.lower()] = blk
+                    elif completo:
+                        blocks[tag.lower()] = {"nao_aplicavel": True}
+                if not completo and blocks[a_banco.lower()].get("ok"):
+                    # só divergências: item ok não entra em `cruzado` (já contado)
+                    continue
+            else:
+                self.ignorados_por_banco += 1
+                if not completo:
+                    continue
+                for tag in bank_keys_sorted:
+                    blocks[tag.lower()] = {"nao_aplicavel": True}
+
+            item = {
+                "codigo": str(codigo_orc),
+                "codigo_base": codigo_base,
+                "a_banco": a.get("banco"),
+                "a_desc": a_desc,
+                "a_valor": a_val,
+            }
+            item.update(blocks)
+            itens.append(item)
+        self.itens_orc += len(orc)
+
+        # Divergências
+        divergencias: List[Dict[str, Any]] = []
+        for it in itens:
+            for tag in bank_keys_sorted:
+                blk = it.get(tag.lower())
+                if blk is not None and not blk.get("nao_aplicavel") and not blk.get("ok"):
+                    d = {"ref": tag, "codigo": it["codigo_base"]}
+                    for k in ("motivos", "dif_abs", "dif_rel", "dir", "a_desc", "b_desc", "desc_sim", "sugestoes"):
+                        v = blk.get(k)
+                        if v is not None:
+                            d[k] = v
+                    if "VALOR_DIVERGENTE" in blk.get("motivos", []):
+                        d["a_valor"] = it["a_valor"]
+                        d["b_valor"] = blk.get("valor")
+                    divergencias.append(d)
+        return itens, divergencias
+
+    # ---- execução em fatias (core.paralelo)
+    def preparar(self, orc: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Monta antes do fork os índices de código das bases que o orçamento usa
+        (sugestões), para os processos filhos herdarem em vez de cada um montar o seu.
+        """
+        if self.sugestoes_k <= 0:
+            return
+        tags = {bank_norm(a.get("banco")) for a in orc.values()}
+        for tag in sorted(t for t in tags if t in self.bank_idx and t not in self.code_idx):
+            self.code_idx[tag] = CodeIndex(self.bank_idx[tag].base, desc_idx=self.desc_idx[tag])
+
+    def contadores(self) -> Dict[str, Any]:
+        return {
+            "comparados": dict(self.comparados),
+            "oks": dict(self.oks),
+            "desc_aproximadas": self.desc_aproximadas,
+            "itens_orc": self.itens_orc,
+            "ignorados_por_banco": self.ignorados_por_banco,
+        }
+
+    def zerar(self) -> None:
+        self.comparados = {k: 0 for k in self.comparados}
+        self.oks = {k: 0 for k in self.oks}
+        self.desc_aproximadas = self.itens_orc = self.ignorados_por_banco = 0
+
+    def somar(self, c: Dict[str, Any]) -> None:
+        for k, v in c["comparados"].items():
+            self.comparados[k] += v
+        for k, v in c["oks"].items():
+            self.oks[k] += v
+        self.desc_aproximadas += c["desc_aproximadas"]
+        self.itens_orc += c["itens_orc"]
+        self.ignorados_por_banco += c["ignorados_por_banco"]
+
+    def comparar_fatia(self, orc: Dict[str, Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, Any]]:
+        """No processo filho: compara uma fatia e devolve também os contadores só dela."""
+        self.zerar()
+        itens, divergencias = self.comparar(orc)
+        return itens, divergencias, self.contadores()
+
+    def meta(self) -> Dict[str, Any]:
+        return {
+            "tol_rel": self.tol_rel,
+            "comparar_descricao": self.comparar_descricao,
+            "desc_sim_min": self.desc_sim_min,
+            "sugestoes_k": self.sugestoes_k,
+            "detalhe": self.detalhe,
+            "generated_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        }
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "itens_orc": self.itens_orc,
+            "comparados": {k.lower(): self.comparados[k] for k in self.bank_keys_sorted},
+            "ok": {k.lower() + "_ok": self.oks[k.lower() + "_ok"] for k in self.bank_keys_sorted},
+            "ignorados_por_banco": self.ignorados_por_banco,
+            "descricoes_aproximadas": self.desc_aproximadas,
+        }
+
+
 def consolidar_precos_multi(
     orc: Dict[str, Dict[str, Any]],
     bancos: Dict[str, Dict[str, Dict[str, Any]]],
     *,
     tol_rel: float = 0.05,
     comparar_descricao: bool = True,
+    desc_sim_min: float = 1.0,
+    sugestoes_k: int = SUGESTOES_K,
+    detalhe: str = "completo",
+    processos: int = 1,
+    min_itens: int = PARALELO_MIN_ITENS,
 ) -> Dict[str, Any]:
     """
     Versão generalizada: aceita várias bases em `bancos`, p.ex.:
         {"SINAPI": sin, "SUDECAP": sud, "SECID": secid}
 
     Regras de comparação:
-      - Só compara com o banco indicado em a['banco'] (normalizado por _bank_norm).
+      - Só compara com o banco indicado em a['banco'] (normalizado por bank_norm).
       - Os demais bancos entram como {"nao_aplicavel": true}.
       - Se o orçamento não indicar banco suportado, ignora (para evitar falsos negativos).
+      - Descrições com similaridade >= `desc_sim_min` (ver core.similarity) não
+        geram DESCRICAO_DIVERGENTE; 1.0 mantém a comparação exata.
+      - CODIGO_NAO_ENCONTRADO vem com até `sugestoes_k` códigos candidatos da base
+        (ver core.code_index); 0 desativa.
+      - `detalhe="divergencias"`: `cruzado` traz só os itens com divergência e só o
+        bloco do banco comparado (sem itens ok nem blocos nao_aplicavel); o `resumo`
+        continua contando todos os itens.
+      - `processos` > 1 (e orçamento com pelo menos `min_itens` itens): consolida em
+        fatias por código canônico em processos filhos (core.paralelo); mesmo payload.
     """
-    # normaliza chaves dos bancos (maiúsculas)
-    banks_upper = {k.upper(): v for k, v in (bancos or {}).items()}
-    bank_keys_sorted = sorted(banks_upper.keys())  # ordem estável
-
-    # contadores por banco
-    comparados = {k: 0 for k in bank_keys_sorted}
-    oks = {f"{k.lower()}_ok": 0 for k in bank_keys_sorted}
-
-    itens: List[Dict[str, Any]] = []
-    ignorados_por_banco = 0
-
-    for key, a in orc.items():
-        codigo_orc = a.get("codigo") or key
-        codigo_base = _canon(codigo_orc)
-        a_desc = a.get("descricao", "")
-        a_val = _to_float(a.get("valor_unit"))
-        a_banco = _bank_norm(a.get("banco"))  # "SINAPI"/"SUDECAP"/"SECID"/None
-
-        # busca em todas as bases (pelo canônico; fallback no bruto)
-        refs: Dict[str, Optional[Dict[str, Any]]] = {}
-        for tag, base in banks_upper.items():
-            refs[tag] = base.get(codigo_base) or base.get(codigo_orc) or base.get(key)
-
-        blocks: Dict[str, Any] = {}
-        if a_banco and a_banco in banks_upper:
-            # compara apenas com o banco indicado; os demais ficam nao_aplicavel
-            comparados[a_banco] += 1
-            for tag in bank_keys_sorted:
-                if tag == a_banco:
-                    blk = _build_ref_block(a_desc, a_val, refs[tag], tol_rel, comparar_descricao)
-                    if blk.get("ok"):
-                        oks[f"{tag.lower()}_ok"] += 1
-                    blocks[tag.lower()] = blk
-                else:
-                    blocks[tag.lower()] = {"nao_aplicavel": True}
-        else:
-            ignorados_por_banco += 1
-            for tag in bank_keys_sorted:
-                blocks[tag.lower()] = {"nao_aplicavel": True}
-
-        item = {
-            "codigo": str(codigo_orc),
-            "codigo_base": codigo_base,
-            "a_banco": a.get("banco"),
-            "a_desc": a_desc,
-            "a_valor": a_val,
-        }
-        item.update(blocks)
-        itens.append(item)
-
-    # Divergências
-    divergencias: List[Dict[str, Any]] = []
-    for it in itens:
-        for tag in bank_keys_sorted:
-            blk = it[tag.lower()]
-            if not blk.get("nao_aplicavel") and not blk.get("ok"):
-                d = {"ref": tag, "codigo": it["codigo_base"]}
-                for k in ("motivos", "dif_abs", "dif_rel", "dir", "a_desc", "b_desc"):
-                    v = blk.get(k)
-                    if v is not None:
-                        d[k] = v
-                divergencias.append(d)
-
-    resumo_comp = {k.lower(): comparados[k] for k in bank_keys_sorted}
-    resumo_ok = {k.lower() + "_ok": oks[k.lower() + "_ok"] for k in bank_keys_sorted}
-
+    comp = ComparadorPrecos(
+        bancos, tol_rel=tol_rel, comparar_descricao=comparar_descricao,
+        desc_sim_min=desc_sim_min, sugestoes_k=sugestoes_k, detalhe=detalhe,
+    )
+    n = paralelo.usar_processos(processos, len(orc), min_itens)
+    if n > 1:
+        comp.preparar(orc)
+        fatias = paralelo.fatiar(orc, lambda k, a: _canon(a.get("codigo") or k), n * paralelo.FATIAS_POR_PROCESSO)
+        progresso_total(len(orc))
+        itens, divergencias = [], []
+        for _, (it, dv, cont) in paralelo.mapear(comp.comparar_fatia, fatias, n):
+            itens.extend(it)
+            divergencias.extend(dv)
+            comp.somar(cont)
+    else:
+        itens, divergencias = comp.comparar(orc)
     payload: Dict[str, Any] = {
-        "meta": {
-            "tol_rel": tol_rel,
-            "comparar_descricao": comparar_descricao,
-            "generated_at": datetime.now().astimezone().isoformat(timespec="seconds"),
-        },
-        "resumo": {
-            "itens_orc": len(itens),
-            "comparados": resumo_comp,
-            "ok": resumo_ok,
-            "ignorados_por_banco": ignorados_por_banco,
-        },
-        "cruzado": sorted(itens, key=lambda r: (r["codigo_base"], r["codigo"])),
-        "divergencias": sorted(divergencias, key=lambda r: (r["ref"], r["codigo"])),
+        "meta": comp.meta(),
+        "resumo": comp.resumo(),
+        "cruzado": sorted(itens, key=chave_cruzado),
+        "divergencias": sorted(divergencias, key=chave_divergencia),
     }
     return payload
 
@@ -400,21 +605,19 @@ def consolidar_estrutura(
 
     sin_norm = _norm_parent_map(sin_estr)
     sud_norm = _norm_parent_map(sud_estr)
+    pais = ParentIndex({"SINAPI": sin_norm, "SUDECAP": sud_norm})
 
+    progresso_total(len(orc_estr or {}))
     for key, comp_a in (orc_estr or {}).items():
+        checkpoint()
         pai_orc = comp_a.get("pai_codigo") or key
         pai_base = _canon(pai_orc)
-        banco_a = _bank_norm(comp_a.get("banco"))
+        banco_a = bank_norm(comp_a.get("banco"))
 
         # Auto-detecção simples entre SINAPI/SUDECAP
         if banco_a is None:
-            in_sin = pai_base in sin_norm
-            in_sud = pai_base in sud_norm
-            if in_sin and not in_sud:
-                banco_a = "SINAPI"
-            elif in_sud and not in_sin:
-                banco_a = "SUDECAP"
-            else:
+            banco_a = pais.unico(pai_base)
+            if banco_a is None:
                 ignorados_por_banco += 1
                 continue
 
@@ -481,92 +684,274 @@ def consolidar_estrutura(
     return payload
 
 
-def consolidar_estrutura_multi(
-    orc_estr: Dict[str, Dict[str, Any]],
-    bancos: Dict[str, Dict[str, Dict[str, Any]]],
-) -> Dict[str, Any]:
+class ComparadorEstrutura:
     """
-    Versão generalizada para estrutura: aceita múltiplas bases em `bancos`.
-    - Se o pai do orçamento indicar banco suportado, compara com aquele.
-    - Se não indicar, tenta auto-detectar: se o pai existe em **exatamente uma**
-      das bases, usa-a; caso contrário, ignora (para evitar falsos negativos).
+    Comparação de estrutura do orçamento contra várias bases, com estado
+    (índices das bases, explosores e contadores) montado uma vez: o
+    `consolidar_estrutura_multi` compara tudo de uma vez ou em fatias
+    (core.paralelo). Regras: ver `consolidar_estrutura_multi`.
     """
-    banks_upper = {k.upper(): _norm_parent_map(v) for k, v in (bancos or {}).items()}
-    bank_keys_sorted = sorted(banks_upper.keys())
-
-    comparados = {k: 0 for k in bank_keys_sorted}
-    ignorados_por_banco = 0
-    divergencias: List[Dict[str, Any]] = []
-
-    for key, comp_a in (orc_estr or {}).items():
-        pai_orc = comp_a.get("pai_codigo") or key
-        pai_base = _canon(pai_orc)
-        banco_a = _bank_norm(comp_a.get("banco"))  # pode ser None
-
-        target_tag: Optional[str] = None
 
-        if banco_a and banco_a in banks_upper:
-            target_tag = banco_a
-        else:
-            # auto-detecção: exatamente uma base contém o pai
-            hits = [tag for tag in bank_keys_sorted if pai_base in banks_upper[tag]]
-            if len(hits) == 1:
-                target_tag = hits[0]
+    def __init__(
+        self,
+        bancos: Dict[str, Dict[str, Dict[str, Any]]],
+        *,
+        desc_sim_min: float = 1.0,
+        profundo: bool = False,
+        orc_estr: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> None:
+        self.desc_sim_min = desc_sim_min
+        self.profundo = profundo
+        self.banks_upper = {k.upper(): _norm_parent_map(v) for k, v in (bancos or {}).items()}
+        self.bank_keys_sorted = sorted(self.banks_upper.keys())
+        self.pais = ParentIndex(self.banks_upper)  # auto-detecção O(1), qualquer número de bases
+
+        # explosores memoizados, criados sob demanda (um por base e um orçamento+base)
+        self.orc_norm = _norm_parent_map(orc_estr) if profundo else {}
+        self.exp_banco: Dict[str, Explosao] = {}
+        self.exp_orc: Dict[str, Explosao] = {}
+
+        # assinaturas memorizadas por texto (insumos se repetem em muitas composições)
+        self.desc_idx = DescIndex()
+
+        self.comparados = {k: 0 for k in self.bank_keys_sorted}
+        self.ignorados_por_banco = 0
+        self.desc_aproximadas = 0
+        self.pais_explodidos = self.pais_com_ciclo = 0
+        self.ambiguos: Set[str] = set()
+
+    def _alvo(self, key: str, comp_a: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """(código canônico do pai, base de comparação ou None)."""
+        pai_base = _canon(comp_a.get("pai_codigo") or key)
+        banco_a = bank_norm(comp_a.get("banco"))  # pode ser None
+        if banco_a and banco_a in self.banks_upper:
+            return pai_base, banco_a
+        # auto-detecção: exatamente uma base contém o pai
+        target_tag = self.pais.unico(pai_base)
+        if target_tag is None and pai_base in self.pais.ambiguos:
+            self.ambiguos.add(pai_base)
+        return pai_base, target_tag
+
+    def _explosores(self, tag: str) -> Tuple[Explosao, Explosao]:
+        if tag not in self.exp_banco:
+            self.exp_banco[tag] = Explosao(self.banks_upper[tag])
+            self.exp_orc[tag] = Explosao(self.orc_norm, self.banks_upper[tag])
+        return self.exp_orc[tag], self.exp_banco[tag]
+
+    def comparar(self, orc_estr: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Compara os pais do orçamento; devolve as divergências na ordem do orçamento."""
+        banks_upper = self.banks_upper
+        desc_idx = self.desc_idx
+        divergencias: List[Dict[str, Any]] = []
+
+        progresso_total(len(orc_estr or {}))
+        for key, comp_a in (orc_estr or {}).items():
+            checkpoint()
+            pai_base, target_tag = self._alvo(key, comp_a)
+            if not target_tag:
+                self.ignorados_por_banco += 1
+                continue
 
-        if not target_tag:
-            ignorados_por_banco += 1
-            continue
+            base_ref = banks_upper[target_tag]
+            self.comparados[target_tag] += 1
+
+            comp_b = base_ref.get(pai_base)
+            idx_a = _index_children_desc(comp_a)
+
+            if comp_b is None:
+                if idx_a:
+                    divergencias.append({
+                        "ref": target_tag,
+                        "pai_codigo": pai_base,
+                        "pai_desc_a": comp_a.get("descricao"),
+                        "pai_desc_b": None,
+                        "filhos_missing": sorted(idx_a.keys()),
+                        "filhos_extra": [],
+                        "filhos_desc_mismatch": [],
+                    })
+                continue
 
-        base_ref = banks_upper[target_tag]
-        comparados[target_tag] += 1
+            idx_b = _index_children_desc(comp_b)
+            set_a, set_b = set(idx_a.keys()), set(idx_b.keys())
+
+            filhos_missing = sorted(set_a - set_b)
+            filhos_extra   = sorted(set_b - set_a)
+
+            filhos_desc_mismatch: List[Dict[str, Any]] = []
+            for code in sorted(set_a & set_b):
+                da = idx_a[code]
+                db = idx_b[code]
+                sa, sb = desc_idx.get(da), desc_idx.get(db)
+                if sa.norm == sb.norm:
+                    continue
+                if desc_equivalentes(sa, sb, self.desc_sim_min):
+                    self.desc_aproximadas += 1
+                    continue
+                filhos_desc_mismatch.append({
+                    "codigo": code, "a_desc": da, "b_desc": db, "desc_sim": similarity(sa, sb),
+                })
 
-        comp_b = base_ref.get(pai_base)
-        idx_a = _index_children_desc(comp_a)
+            prof: Optional[Dict[str, Any]] = None
+            if self.profundo:
+                exp_orc, exp_banco = self._explosores(target_tag)
+                fa = exp_orc.folhas(pai_base)
+                fb = exp_banco.folhas(pai_base)
+                self.pais_explodidos += 1
+                if fa is None or fb is None:
+                    self.pais_com_ciclo += 1
+                    prof = {"ciclo": True}
+                else:
+                    prof = comparar_folhas(fa, fb)
+                    if not any(prof.values()):
+                        prof = None
 
-        if comp_b is None:
-            if idx_a:
-                divergencias.append({
+            if filhos_missing or filhos_extra or filhos_desc_mismatch or prof:
+                div = {
                     "ref": target_tag,
                     "pai_codigo": pai_base,
                     "pai_desc_a": comp_a.get("descricao"),
-                    "pai_desc_b": None,
-                    "filhos_missing": sorted(idx_a.keys()),
-                    "filhos_extra": [],
-                    "filhos_desc_mismatch": [],
-                })
-            continue
+                    "pai_desc_b": comp_b.get("descricao"),
+                    "filhos_missing": filhos_missing,
+                    "filhos_extra": filhos_extra,
+                    "filhos_desc_mismatch": filhos_desc_mismatch,
+                }
+                if prof:
+                    div["profundo"] = prof
+                divergencias.append(div)
+        return divergencias
+
+    # ---- execução em fatias (core.paralelo)
+    def preparar(self, orc_estr: Dict[str, Dict[str, Any]]) -> None:
+        """Cria antes do fork os explosores das bases que o orçamento usa (herdados pelos filhos)."""
+        if not self.profundo:
+            return
+        tags = {bank_norm(c.get("banco")) for c in orc_estr.values()}
+        if any(t not in self.banks_upper for t in tags):
+            tags |= set(self.bank_keys_sorted)  # pais sem banco: qualquer base pode ser a detectada
+        for tag in sorted(t for t in tags if t in self.banks_upper):
+            self._explosores(tag)
+
+    def varrer_ciclos(self, orc_estr: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Depois das fatias: percorre (sem explodir) os pais na ordem do orçamento,
+        como a execução em série, para os ciclos reportados serem os mesmos.
+        """
+        if not self.profundo:
+            return
+        for key, comp_a in orc_estr.items():
+            pai_base, tag = self._alvo(key, comp_a)
+            if tag and pai_base in self.banks_upper[tag]:
+                exp_orc, exp_banco = self._explosores(tag)
+                exp_orc.varrer(pai_base)
+                exp_banco.varrer(pai_base)
+
+    def ciclos(self) -> List[List[str]]:
+        ciclos = sorted({tuple(c) for e in self.exp_banco.values() for c in e.ciclos}
+                        | {tuple(c) for e in self.exp_orc.values() for c in e.ciclos})
+        return [list(c) for c in ciclos]
+
+    def contadores(self) -> Dict[str, Any]:
+        return {
+            "comparados": dict(self.comparados),
+            "ignorados_por_banco": self.ignorados_por_banco,
+            "desc_aproximadas": self.desc_aproximadas,
+            "pais_explodidos": self.pais_explodidos,
+            "pais_com_ciclo": self.pais_com_ciclo,
+            "ambiguos": sorted(self.ambiguos),
+        }
 
-        idx_b = _index_children_desc(comp_b)
-        set_a, set_b = set(idx_a.keys()), set(idx_b.keys())
+    def zerar(self) -> None:
+        self.comparados = {k: 0 for k in self.comparados}
+        self.ignorados_por_banco = self.desc_aproximadas = 0
+        self.pais_explodidos = self.pais_com_ciclo = 0
+        self.ambiguos = set()
+
+    def somar(self, c: Dict[str, Any]) -> None:
+        for k, v in c["comparados"].items():
+            self.comparados[k] += v
+        self.ignorados_por_banco += c["ignorados_por_banco"]
+        self.desc_aproximadas += c["desc_aproximadas"]
+        self.pais_explodidos += c["pais_explodidos"]
+        self.pais_com_ciclo += c["pais_com_ciclo"]
+        self.ambiguos.update(c["ambiguos"])
+
+    def comparar_fatia(self, orc_estr: Dict[str, Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """No processo filho: compara uma fatia e devolve também os contadores só dela."""
+        self.zerar()
+        divergencias = self.comparar(orc_estr)
+        return divergencias, self.contadores()
+
+    def meta(self) -> Dict[str, Any]:
+        return {
+            "desc_sim_min": self.desc_sim_min,
+            "profundo": self.profundo,
+            "generated_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        }
 
-        filhos_missing = sorted(set_a - set_b)
-        filhos_extra   = sorted(set_b - set_a)
+    def resumo(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "comparados": {k.lower(): self.comparados[k] for k in self.bank_keys_sorted},
+            "ignorados_por_banco": self.ignorados_por_banco,
+            "descricoes_aproximadas": self.desc_aproximadas,
+            "ambiguos": {
+                # pais presentes em mais de uma base (todas as bases / só os do orçamento sem banco)
+                "bases": len(self.pais.ambiguos),
+                "pais": sorted(self.ambiguos),
+            },
+        }
+        if self.profundo:
+            out["profundo"] = {
+                "pais_explodidos": self.pais_explodidos,
+                "pais_com_ciclo": self.pais_com_ciclo,
+                "ciclos": self.ciclos(),
+            }
+        return out
 
-        filhos_desc_mismatch: List[Dict[str, str]] = []
-        for code in sorted(set_a & set_b):
-            da = idx_a[code]
-            db = idx_b[code]
-            if norm_text(da) != norm_text(db):
-                filhos_desc_mismatch.append({"codigo": code, "a_desc": da, "b_desc": db})
 
-        if filhos_missing or filhos_extra or filhos_desc_mismatch:
-            divergencias.append({
-                "ref": target_tag,
-                "pai_codigo": pai_base,
-                "pai_desc_a": comp_a.get("descricao"),
-                "pai_desc_b": comp_b.get("descricao"),
-                "filhos_missing": filhos_missing,
-                "filhos_extra": filhos_extra,
-                "filhos_desc_mismatch": filhos_desc_mismatch,
-            })
+def consolidar_estrutura_multi(
+    orc_estr: Dict[str, Dict[str, Any]],
+    bancos: Dict[str, Dict[str, Dict[str, Any]]],
+    *,
+    desc_sim_min: float = 1.0,
+    profundo: bool = False,
+    processos: int = 1,
+    min_itens: int = PARALELO_MIN_ITENS,
+) -> Dict[str, Any]:
+    """
+    Versão generalizada para estrutura: aceita múltiplas bases em `bancos`.
+    - Se o pai do orçamento indicar banco suportado, compara com aquele.
+    - Se não indicar, tenta auto-detectar: se o pai existe em **exatamente uma**
+      das bases, usa-a; caso contrário, ignora (para evitar falsos negativos).
+      A consulta usa um índice invertido código → bases (core.bank_index); pais
+      ignorados por existirem em mais de uma base vão em `resumo.ambiguos`.
+    - Descrições de filhos com similaridade >= `desc_sim_min` não entram em
+      `filhos_desc_mismatch`; 1.0 mantém a comparação exata.
+    - Com `profundo=True`, explode pai do orçamento e da base até os insumos-folha
+      (core.explosao) e compara folhas e coeficientes acumulados em `profundo`.
+      Auxiliares que o orçamento não detalha são abertas pela própria base.
+    - `processos` > 1 (e orçamento com pelo menos `min_itens` pais): consolida em
+      fatias por código canônico do pai em processos filhos (core.paralelo).
+    """
+    comp = ComparadorEstrutura(bancos, desc_sim_min=desc_sim_min, profundo=profundo, orc_estr=orc_estr)
+    orc_estr = orc_estr or {}
+    n = paralelo.usar_processos(processos, len(orc_estr), min_itens)
+    if n > 1:
+        comp.preparar(orc_estr)
+        fatias = paralelo.fatiar(
+            orc_estr, lambda k, c: _canon(c.get("pai_codigo") or k), n * paralelo.FATIAS_POR_PROCESSO,
+        )
+        progresso_total(len(orc_estr))
+        divergencias: List[Dict[str, Any]] = []
+        for _, (dv, cont) in paralelo.mapear(comp.comparar_fatia, fatias, n):
+            divergencias.extend(dv)
+            comp.somar(cont)
+        comp.varrer_ciclos(orc_estr)
+    else:
+        divergencias = comp.comparar(orc_estr)
 
-    resumo_comp = {k.lower(): comparados[k] for k in bank_keys_sorted}
     payload = {
-        "meta": {"generated_at": datetime.now().astimezone().isoformat(timespec="seconds")},
-        "resumo": {
-            "comparados": resumo_comp,
-            "ignorados_por_banco": ignorados_por_banco,
-        },
+        "meta": comp.meta(),
+        "resumo": comp.resumo(),
         "divergencias": sorted(divergencias, key=lambda r: (r["ref"], r["pai_codigo"])),
     }
     return payload
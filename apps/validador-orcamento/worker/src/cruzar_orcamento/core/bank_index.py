@@ -0,0 +1,132 @@
+# src/cruzar_orcamento/core/bank_index.py
+from __future__ import annotations
+
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from ..utils.utils_code import norm_code_canonical
+from ..utils.utils_num import to_float as _to_float
+from ..utils.checkpoint import checkpoint, total as progresso_total
+from .similarity import DescIndex, DescSignature
+
+
+# ============================================================
+# Índice de consulta de uma base de preços
+# ============================================================
+#
+# Os loaders chaveiam as bases de jeitos diferentes: SINAPI/SUDECAP pelo
+# código da planilha (`norm_code`, sem tirar zeros à esquerda), SECID e o
+# histórico pelo canônico (`norm_code_canonical`). Procurar o item do
+# orçamento com `base.get(canônico) or base.get(bruto) or base.get(chave)`
+# perdia em silêncio "01.02.003" (base) x "1.2.3" (orçamento).
+#
+# O índice é montado uma vez por base e leva cada apelido de um item — chave
+# do dict, código do item e código canônico — a um único número de linha.
+# Chave/código exatos têm prioridade sobre o canônico (mesmo resultado da
+# busca antiga quando ela achava algo); com dois itens de mesmo canônico,
+# fica o primeiro. Valor numérico de cada linha sai pronto na montagem; a
+# assinatura da descrição é calculada na primeira consulta à linha e fica
+# guardada (a maioria das linhas de uma release nunca é consultada).
+
+
+class BankIndex:
+    """
+    Base de preços ({codigo: {"descricao", "valor_unit", ...}}) indexada.
+
+    `buscar(*codigos)` → número da linha (primeiro código que casa) ou None;
+    `itens[i]`, `descricoes[i]`, `valores[i]` (float|None) e `assinatura(i)`.
+    """
+
+    def __init__(self, base: Dict[str, Dict[str, Any]], desc_idx: Optional[DescIndex] = None) -> None:
+        self.base = base or {}
+        self.desc_idx = desc_idx if desc_idx is not None else DescIndex()
+        self.itens: List[Dict[str, Any]] = []
+        self.descricoes: List[Optional[str]] = []
+        self.valores: List[Optional[float]] = []
+        self._sigs: List[Optional[DescSignature]] = []
+        self._chaves: Dict[str, int] = {}
+
+        canonicos: Dict[str, int] = {}
+        codigos: Dict[str, int] = {}
+        progresso_total(len(self.base))
+        for key, it in self.base.items():
+            checkpoint()
+            it = it or {}
+            i = len(self.itens)
+            self.itens.append(it)
+            self.descricoes.append(it.get("descricao"))
+            self.valores.append(_to_float(it.get("valor_unit")))
+            self._sigs.append(None)
+
+            self._chaves.setdefault(str(key), i)
+            raw = it.get("codigo")
+            if raw is not None:
+                codigos.setdefault(str(raw).strip(), i)
+            canon = norm_code_canonical(raw or key)
+            if canon:
+                canonicos.setdefault(canon, i)
+
+        # prioridade: chave do dict > código do item > canônico
+        for apelidos in (codigos, canonicos):
+            for k, i in apelidos.items():
+                self._chaves.setdefault(k, i)
+
+    @classmethod
+    def de(cls, base: Any, desc_idx: Optional[DescIndex] = None) -> "BankIndex":
+        """Índice da base (ou o próprio, se já vier indexada)."""
+        return base if isinstance(base, cls) else cls(base, desc_idx=desc_idx)
+
+    def __len__(self) -> int:
+        return len(self.itens)
+
+    def buscar(self, *codigos: Any) -> Optional[int]:
+        for c in codigos:
+            if c is None or c == "":
+                continue
+            i = self._chaves.get(c if isinstance(c, str) else str(c))
+            if i is not None:
+                return i
+        return None
+
+    def assinatura(self, i: int) -> DescSignature:
+        sig = self._sigs[i]
+        if sig is None:
+            sig = self._sigs[i] = self.desc_idx.get(self.descricoes[i])
+        return sig
+
+
+# ============================================================
+# Índice invertido código do pai → bases (estrutura)
+# ============================================================
+#
+# Pai do orçamento sem banco utilizável: a base é a única que contém o código.
+# Em vez de perguntar a cada base por item (custo cresce com o número de
+# bases), o índice é montado uma vez por conjunto de bases carregadas e já
+# diz quais códigos existem em mais de uma delas (ambíguos: não dá para
+# escolher sem o banco no orçamento).
+
+
+class ParentIndex:
+    """
+    {tag: {codigo_canonico_pai: comp}} → código → bases que o contêm (ordem das tags).
+
+    `bancos(codigo)` → tupla de tags; `unico(codigo)` → a tag se só uma base tem o
+    código, senão None; `ambiguos` → códigos presentes em mais de uma base.
+    """
+
+    def __init__(self, bancos: Dict[str, Dict[str, Any]]) -> None:
+        por_codigo: Dict[str, List[str]] = {}
+        for tag in sorted(bancos):
+            for codigo in bancos[tag] or {}:
+                por_codigo.setdefault(codigo, []).append(tag)
+        self._bancos: Dict[str, Tuple[str, ...]] = {c: tuple(t) for c, t in por_codigo.items()}
+        self.ambiguos: FrozenSet[str] = frozenset(c for c, t in self._bancos.items() if len(t) > 1)
+
+    def __len__(self) -> int:
+        return len(self._bancos)
+
+    def bancos(self, codigo: str) -> Tuple[str, ...]:
+        return self._bancos.get(codigo, ())
+
+    def unico(self, codigo: str) -> Optional[str]:
+        tags = self._bancos.get(codigo)
+        return tags[0] if tags and len(tags) == 1 else None
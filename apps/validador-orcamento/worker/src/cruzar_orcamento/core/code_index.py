@@ -0,0 +1,236 @@
+# src/cruzar_orcamento/core/code_index.py
+from __future__ import annotations
+
+import math
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from ..utils.utils_code import norm_code_canonical
+from ..utils.checkpoint import checkpoint, total as progresso_total
+from .similarity import DescIndex, similarity
+
+
+# ============================================================
+# Índice de códigos de uma base (sugestões para CODIGO_NAO_ENCONTRADO)
+# ============================================================
+#
+# Três estruturas, montadas uma vez por base (na primeira ausência):
+#   - trie de prefixos do código canônico → códigos truncados/estendidos
+#     (ex.: "9409" x "94095"), com no máximo `_TRIE_KEEP` códigos por nó;
+#   - vizinhança por deleções (distância de Levenshtein <= 2) → erros de
+#     digitação/transposição;
+#   - índice invertido de tokens da descrição → código aposentado/trocado
+#     entre releases, mas com a mesma descrição.
+# Além disso, uma chave "compacta" (só alfanuméricos) pega diferenças de
+# separador/segmentação ("1.2.3" x "123").
+#
+# Cada ausência gera poucas dezenas de candidatos, que recebem nota de código
+# (1 - distância/len) e de descrição (core.similarity); o custo por consulta
+# fica na casa de milissegundos mesmo numa release completa do SINAPI.
+
+SUGESTOES_K = 5
+
+_TRIE_KEEP = 8          # códigos guardados por nó da trie
+_EDIT_MAX_DIST = 2      # distância de edição máxima nas sugestões
+_TOKEN_MAX_DF = 0.05    # tokens presentes em mais de 5% da base não geram candidatos
+_EDIT_CANDIDATOS = 20   # candidatos por distância de edição (os mais próximos)
+_TOKEN_CANDIDATOS = 20  # candidatos por descrição (antes da nota fina)
+_MIN_SCORE = 0.35
+
+_NON_ALNUM_RE = re.compile(r"[^0-9A-Za-z]+")
+
+
+def _compact(code: str) -> str:
+    return _NON_ALNUM_RE.sub("", code).upper().lstrip("0")
+
+
+def levenshtein(a: str, b: str, max_dist: Optional[int] = None) -> int:
+    """Distância de edição; com `max_dist`, para cedo e devolve max_dist + 1."""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_dist is not None and len(a) - len(b) > max_dist:
+        return max_dist + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        left = row_min = i
+        for j, cb in enumerate(b, 1):
+            v = prev[j - 1] if ca == cb else prev[j - 1] + 1
+            if prev[j] + 1 < v:
+                v = prev[j] + 1
+            if left + 1 < v:
+                v = left + 1
+            cur.append(v)
+            left = v
+            if v < row_min:
+                row_min = v
+        if max_dist is not None and row_min > max_dist:
+            return max_dist + 1
+        prev = cur
+    return prev[-1]
+
+
+def _deletes(word: str, max_dist: int) -> Set[str]:
+    """Todas as variantes de `word` com até `max_dist` caracteres removidos."""
+    out = {word}
+    frontier = {word}
+    for _ in range(max_dist):
+        nxt = set()
+        for w in frontier:
+            if len(w) <= 1:
+                continue
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i + 1:])
+        out |= nxt
+        frontier = nxt
+    return out
+
+
+class _DeleteIndex:
+    """
+    Índice de vizinhança por deleções (estilo SymSpell): dois códigos a distância
+    de edição <= d compartilham alguma variante com até d deleções. A consulta
+    vira poucas dezenas de lookups em dict + verificação com Levenshtein, sem
+    depender da distribuição dos códigos (uma BK-tree degenera com códigos
+    numéricos curtos, quase todos à mesma distância uns dos outros).
+    """
+
+    def __init__(self, max_dist: int) -> None:
+        self.max_dist = max_dist
+        self._idx: Dict[str, List[str]] = defaultdict(list)
+
+    def add(self, word: str) -> None:
+        for v in _deletes(word, self.max_dist):
+            self._idx[v].append(word)
+
+    def search(self, word: str) -> Iterator[Tuple[str, int]]:
+        seen: Set[str] = set()
+        for v in _deletes(word, self.max_dist):
+            for w in self._idx.get(v, ()):
+                if w in seen:
+                    continue
+                seen.add(w)
+                d = levenshtein(word, w, self.max_dist)
+                if d <= self.max_dist:
+                    yield w, d
+
+
+class CodeIndex:
+    """
+    Índice de uma base de preços ({codigo: {"descricao", "valor_unit", ...}}).
+
+    `sugerir(codigo, descricao, k)` devolve até k candidatos:
+        [{"codigo", "descricao", "score", "via": ["prefixo"|"edicao"|"formato"|"descricao"]}]
+    """
+
+    def __init__(self, base: Dict[str, Dict[str, Any]], desc_idx: Optional[DescIndex] = None) -> None:
+        self.desc_idx = desc_idx if desc_idx is not None else DescIndex()
+        self._items: Dict[str, Tuple[str, Optional[str]]] = {}  # canônico -> (código original, descrição)
+        self._trie: Dict[str, Any] = {}
+        self._edit = _DeleteIndex(_EDIT_MAX_DIST)
+        self._compact: Dict[str, List[str]] = defaultdict(list)
+        self._tokens: Dict[str, Set[str]] = defaultdict(set)
+
+        progresso_total(len(base or {}))
+        for key, it in (base or {}).items():
+            checkpoint()
+            raw = (it or {}).get("codigo") or key
+            canon = norm_code_canonical(raw)
+            if not canon or canon in self._items:
+                continue
+            desc = (it or {}).get("descricao")
+            self._items[canon] = (str(raw), desc)
+            self._add_trie(canon)
+            self._edit.add(canon)
+            self._compact[_compact(canon)].append(canon)
+            for tok in self.desc_idx.get(desc).tokens:
+                self._tokens[tok].add(canon)
+
+        n = max(1, len(self._items))
+        self._max_df = max(50, int(n * _TOKEN_MAX_DF))
+        self._idf = {t: math.log(n / len(codes)) for t, codes in self._tokens.items()}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    # ---- construção
+    def _add_trie(self, canon: str) -> None:
+        node = self._trie
+        for ch in canon:
+            node = node.setdefault(ch, {})
+            keep = node.setdefault("", [])
+            if len(keep) < _TRIE_KEEP:
+                keep.append(canon)
+
+    # ---- geração de candidatos
+    def _por_prefixo(self, canon: str) -> List[str]:
+        node, depth = self._trie, 0
+        for ch in canon:
+            nxt = node.get(ch)
+            if nxt is None:
+                break
+            node, depth = nxt, depth + 1
+        # prefixo comum precisa cobrir boa parte do código consultado
+        if depth < max(2, int(len(canon) * 0.6)):
+            return []
+        return list(node.get("", []))
+
+    def _por_descricao(self, descricao: Any) -> List[str]:
+        sig = self.desc_idx.get(descricao)
+        acc: Dict[str, float] = defaultdict(float)
+        for tok in sig.tokens:
+            codes = self._tokens.get(tok)
+            if not codes or len(codes) > self._max_df:
+                continue
+            w = self._idf[tok]
+            for c in codes:
+                acc[c] += w
+        return sorted(acc, key=lambda c: (-acc[c], c))[:_TOKEN_CANDIDATOS]
+
+    # ---- consulta
+    def sugerir(self, codigo: Any, descricao: Any = None, k: int = SUGESTOES_K) -> List[Dict[str, Any]]:
+        if k <= 0 or not self._items:
+            return []
+        canon = norm_code_canonical(codigo)
+        cands: Dict[str, Set[str]] = defaultdict(set)
+        dist: Dict[str, int] = {}
+
+        if canon:
+            for c in self._compact.get(_compact(canon), []):
+                cands[c].add("formato")
+            for c in self._por_prefixo(canon):
+                cands[c].add("prefixo")
+            near = sorted(self._edit.search(canon), key=lambda t: (t[1], t[0]))[:_EDIT_CANDIDATOS]
+            for c, d in near:
+                cands[c].add("edicao")
+                dist[c] = d
+        if descricao:
+            for c in self._por_descricao(descricao):
+                cands[c].add("descricao")
+        cands.pop(canon, None)
+
+        a_sig = self.desc_idx.get(descricao) if descricao else None
+        out: List[Dict[str, Any]] = []
+        for c, via in cands.items():
+            raw, desc = self._items[c]
+            if canon:
+                d = dist[c] if c in dist else levenshtein(canon, c)
+                s_cod = 1.0 - d / max(len(canon), len(c))
+                if "formato" in via:
+                    s_cod = max(s_cod, 0.95)
+            else:
+                s_cod = 0.0
+            if a_sig is not None and a_sig.norm:
+                s_desc = similarity(a_sig, self.desc_idx.get(desc))
+                score = 0.5 * s_cod + 0.5 * s_desc
+            else:
+                score = s_cod
+            if score < _MIN_SCORE:
+                continue
+            out.append({"codigo": raw, "descricao": desc, "score": round(score, 4), "via": sorted(via)})
+
+        out.sort(key=lambda r: (-r["score"], r["codigo"]))
+        return out[:k]
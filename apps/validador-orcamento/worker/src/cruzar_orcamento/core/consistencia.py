@@ -0,0 +1,235 @@
+# src/cruzar_orcamento/core/consistencia.py
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..utils.utils_code import norm_code_canonical
+from .aggregate import bank_norm
+from .bank_index import BankIndex
+
+
+# ============================================================
+# Consistência de preço das composições (Σ coeficiente × preço dos filhos)
+# ============================================================
+#
+# Tabela de arestas (pai, filho, coeficiente, preço na linha do filho) em
+# arrays numpy; o preço recalculado de cada pai é um `np.bincount` ponderado.
+# Filhos sem preço próprio que são composições recebem o valor recalculado na
+# iteração seguinte (uma iteração por nível de profundidade), então o custo é
+# O(arestas × profundidade), sem laço Python por composição.
+#
+# Preço de um filho, em ordem de preferência:
+#   1) `valor_unit` da própria linha do filho na estrutura;
+#   2) `valor_unit` do código em `precos` (saída dos loaders de preço);
+#   3) preço declarado do filho, quando ele é pai na mesma estrutura;
+#   4) preço do código nas bases de preço (`precos_bancos`: BankIndex por tag),
+#      primeiro na base do pai (campo `banco`), depois nas demais em ordem de
+#      tag — só para filhos que não são composições da estrutura;
+#   5) preço recalculado do filho (composição auxiliar sem preço declarado).
+# Pais com algum filho sem coeficiente/preço resolvível ficam "incompletos";
+# pais sem filhos na estrutura não são verificados.
+
+
+def _f(x: Any) -> float:
+    try:
+        return float(x) if x is not None else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _dir(a: float, b: float) -> str:
+    return "MAIOR" if a > b else "MENOR" if a < b else "IGUAL"
+
+
+def verificar_consistencia(
+    estr: Dict[str, Dict[str, Any]],
+    precos: Optional[Dict[str, Dict[str, Any]]] = None,
+    *,
+    precos_bancos: Optional[Dict[str, Any]] = None,
+    tol_rel: float = 0.0,
+    fonte: str = "ORCAMENTO",
+) -> Dict[str, Any]:
+    """
+    Recalcula o preço de cada composição de `estr` a partir dos filhos e compara
+    com o preço declarado (`valor_unit` do pai na estrutura ou em `precos`).
+    Divergência quando |declarado − calculado| / calculado > tol_rel.
+    `precos_bancos` ({tag: base ou BankIndex}) só completa o preço dos filhos.
+    """
+    tol = max(0.0, float(tol_rel or 0.0)) + 1e-9
+
+    # preços dos loaders de preço, por código canônico (1ª ocorrência)
+    p_loader: Dict[str, float] = {}
+    for key, it in (precos or {}).items():
+        code = norm_code_canonical((it or {}).get("codigo") or key)
+        if code and code not in p_loader:
+            p_loader[code] = _f((it or {}).get("valor_unit"))
+
+    # índice de códigos (pais + filhos)
+    idx: Dict[str, int] = {}
+    pais: List[int] = []
+    descr: Dict[int, str] = {}
+    e_pai: List[int] = []
+    e_filho: List[int] = []
+    e_coef: List[float] = []
+    e_preco: List[float] = []
+    declarado: Dict[int, float] = {}
+    banco_pai: Dict[int, Optional[str]] = {}
+
+    for key, comp in (estr or {}).items():
+        pai = norm_code_canonical(comp.get("codigo") or key)
+        if not pai:
+            continue
+        i = idx.setdefault(pai, len(idx))
+        pais.append(i)
+        banco_pai[i] = bank_norm(comp.get("banco"))
+        descr[i] = str(comp.get("descricao") or "")
+        v = _f(comp.get("valor_unit"))
+        declarado[i] = v if not np.isnan(v) else p_loader.get(pai, np.nan)
+        for ch in comp.get("filhos", []) or []:
+            code = norm_code_canonical(ch.get("codigo"))
+            if not code:
+                continue
+            e_pai.append(i)
+            e_filho.append(idx.setdefault(code, len(idx)))
+            e_coef.append(_f(ch.get("coeficiente")))
+            e_preco.append(_f(ch.get("valor_unit")))
+
+    n = len(idx)
+    codes = [""] * n
+    for c, i in idx.items():
+        codes[i] = c
+
+    pai_a = np.asarray(e_pai, dtype=np.intp)
+    filho_a = np.asarray(e_filho, dtype=np.intp)
+    coef_a = np.asarray(e_coef, dtype=np.float64)
+    preco_a = np.asarray(e_preco, dtype=np.float64)
+
+    # 2) e 3): preço de referência por código
+    p_ref = np.full(n, np.nan)
+    for c, v in p_loader.items():
+        j = idx.get(c)
+        if j is not None:
+            p_ref[j] = v
+    for j, v in declarado.items():
+        if not np.isnan(v):
+            p_ref[j] = v
+    if len(preco_a):
+        preco_a = np.where(np.isnan(preco_a), p_ref[filho_a], preco_a)
+
+    eh_pai = np.zeros(n, dtype=bool)
+    eh_pai[pais] = True
+
+    # 4) bases de preço, só nas arestas ainda sem preço cujo filho não é composição daqui
+    if precos_bancos and len(preco_a):
+        bancos = {str(t).upper(): BankIndex.de(b) for t, b in precos_bancos.items()}
+        ordem = sorted(bancos)
+        cache: Dict[tuple, float] = {}
+        for e in np.flatnonzero(np.isnan(preco_a) & ~eh_pai[filho_a]):
+            chave = (banco_pai.get(int(pai_a[e])), int(filho_a[e]))
+            v = cache.get(chave)
+            if v is None:
+                v = np.nan
+                for tag in ([chave[0]] if chave[0] in bancos else []) + ordem:
+                    j = bancos[tag].buscar(codes[chave[1]])
+                    if j is not None and bancos[tag].valores[j] is not None:
+                        v = bancos[tag].valores[j]
+                        break
+                cache[chave] = v
+            preco_a[e] = v
+    # composição sem filhos (ex.: só o preço veio na planilha) não é verificável
+    sem_filhos = eh_pai & (np.bincount(pai_a, minlength=n) == 0)
+
+    # 5) recálculo iterativo (profundidade): só preenche arestas ainda sem preço
+    calc = np.full(n, np.nan)
+    for _ in range(n + 1):
+        contrib = coef_a * preco_a
+        falta = np.bincount(pai_a, weights=np.isnan(contrib), minlength=n) > 0
+        # float mesmo sem arestas (bincount vazio devolve inteiros)
+        calc = np.bincount(pai_a, weights=np.nan_to_num(contrib, nan=0.0), minlength=n).astype(np.float64)
+        calc[falta | ~eh_pai | sem_filhos] = np.nan
+        pend = np.isnan(preco_a) & eh_pai[filho_a] & ~np.isnan(calc[filho_a])
+        if not pend.any():
+            break
+        preco_a = np.where(pend, calc[filho_a], preco_a)
+
+    decl = np.full(n, np.nan)
+    for j, v in declarado.items():
+        decl[j] = v
+
+    verificaveis = eh_pai & ~np.isnan(calc) & ~np.isnan(decl)
+    dif_abs = np.abs(decl - calc)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dif_rel = np.where(calc != 0, dif_abs / np.abs(calc), np.where(dif_abs > 0, np.inf, 0.0))
+    diverg = verificaveis & (dif_rel > tol)
+
+    divergencias: List[Dict[str, Any]] = []
+    for j in np.flatnonzero(diverg):
+        divergencias.append({
+            "ref": fonte,
+            "codigo": codes[j],
+            "descricao": descr.get(int(j), ""),
+            "valor_declarado": round(float(decl[j]), 6),
+            "valor_calculado": round(float(calc[j]), 6),
+            "dif_abs": round(float(dif_abs[j]), 6),
+            "dif_rel": round(float(dif_rel[j]), 6) if np.isfinite(dif_rel[j]) else None,
+            "dir": _dir(float(decl[j]), float(calc[j])),
+        })
+
+    return {
+        "meta": {
+            "tol_rel": float(tol_rel or 0.0),
+            "fonte": fonte,
+            "generated_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        },
+        "resumo": {
+            "composicoes": int(eh_pai.sum()),
+            "arestas": int(len(pai_a)),
+            "verificadas": int(verificaveis.sum()),
+            "incompletas": int((eh_pai & ~sem_filhos & np.isnan(calc)).sum()),
+            "sem_filhos": int(sem_filhos.sum()),
+            "sem_preco_declarado": int((eh_pai & np.isnan(decl)).sum()),
+            "divergentes": len(divergencias),
+        },
+        "divergencias": sorted(divergencias, key=lambda r: r["codigo"]),
+    }
+
+
+def verificar_consistencia_multi(
+    estr: Dict[str, Dict[str, Any]],
+    precos: Optional[Dict[str, Dict[str, Any]]],
+    bancos_estr: Dict[str, Dict[str, Dict[str, Any]]],
+    bancos_precos: Dict[str, Any],
+    *,
+    bancos_idx: Optional[Dict[str, Any]] = None,
+    tol_rel: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Consistência do orçamento (filhos sem preço completados pelas bases, via
+    `bancos_idx` ou `bancos_precos`) e de cada base que tem estrutura e preços
+    (`bancos_estr[tag]` x `bancos_precos[tag]`). `resumo` soma as fontes,
+    `por_fonte` traz o resumo de cada uma e as divergências levam a fonte em `ref`.
+    """
+    res = {"ORCAMENTO": verificar_consistencia(
+        estr, precos, precos_bancos=bancos_idx or bancos_precos, tol_rel=tol_rel, fonte="ORCAMENTO",
+    )}
+    for tag in sorted(bancos_estr):
+        if bancos_estr[tag] and bancos_precos.get(tag):
+            res[tag] = verificar_consistencia(bancos_estr[tag], bancos_precos[tag], tol_rel=tol_rel, fonte=tag)
+
+    resumo: Dict[str, int] = {}
+    for r in res.values():
+        for k, v in r["resumo"].items():
+            resumo[k] = resumo.get(k, 0) + v
+    return {
+        "meta": {
+            "tol_rel": float(tol_rel or 0.0),
+            "fontes": list(res),
+            "generated_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+        },
+        "resumo": resumo,
+        "por_fonte": {f: r["resumo"] for f, r in res.items()},
+        "divergencias": [d for r in res.values() for d in r["divergencias"]],
+    }
@@ -0,0 +1,167 @@
+# src/cruzar_orcamento/core/explosao.py
+from __future__ import annotations
+
+from typing import Any, Callable, Container, Dict, Iterator, List, Optional, Set, Tuple
+
+from ..utils.utils_code import norm_code_canonical
+
+
+# ============================================================
+# Explosão profunda de composições (até os insumos-folha)
+# ============================================================
+#
+# As estruturas (EstruturaDict) formam um DAG: pai → filhos, onde um filho que
+# também é pai em alguma das estruturas é composição auxiliar e os demais são
+# folhas (insumos). Explodir recursivamente sem memória é exponencial no
+# SINAPI (as mesmas auxiliares aparecem sob centenas de composições).
+#
+# Aqui cada composição é explodida **uma vez**: DFS iterativa em pós-ordem
+# (ordem topológica: filhos antes dos pais) com memo por código. Coeficientes
+# são multiplicados ao longo do caminho e somados quando a mesma folha é
+# alcançada por caminhos diferentes. Ciclos (A → B → A) são detectados pelo
+# conjunto de nós "em aberto" da DFS; as composições envolvidas (e as que
+# dependem delas) ficam sem explosão e os ciclos são reportados.
+
+# Tolerância relativa para coeficientes acumulados (erros de arredondamento)
+TOL_COEF = 1e-4
+
+Folhas = Dict[str, Tuple[Optional[float], str]]  # folha -> (coeficiente acumulado, descrição)
+_Filho = Tuple[str, Optional[float], str]          # (código, coeficiente, descrição)
+
+
+def _mul(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    return None if a is None or b is None else a * b
+
+
+def _add(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    return None if a is None or b is None else a + b
+
+
+class Explosao:
+    """
+    Explosor memoizado sobre uma ou mais estruturas.
+
+    Com várias estruturas, a primeira que define uma composição prevalece:
+    `Explosao(orc, sinapi)` usa a abertura do orçamento e recorre ao SINAPI só
+    para auxiliares que o orçamento não detalha.
+
+    `folhas(codigo)` → {folha: (coef, desc)} ou None (composição em/sobre ciclo).
+    Coeficiente ausente em qualquer trecho do caminho propaga None.
+    """
+
+    def __init__(self, *estruturas: Dict[str, Dict[str, Any]]) -> None:
+        self._defs: Dict[str, List[_Filho]] = {}
+        for estr in estruturas:
+            for key, comp in (estr or {}).items():
+                pai = norm_code_canonical(key)
+                if not pai or pai in self._defs:
+                    continue
+                filhos: List[_Filho] = []
+                for ch in comp.get("filhos", []) or []:
+                    code = norm_code_canonical(ch.get("codigo"))
+                    if code:
+                        coef = ch.get("coeficiente")
+                        filhos.append((code, float(coef) if coef is not None else None,
+                                       str(ch.get("descricao") or "").strip()))
+                self._defs[pai] = filhos
+        self._memo: Dict[str, Optional[Folhas]] = {}
+        self._ciclos: Set[Tuple[str, ...]] = set()
+        self._visto: Set[str] = set()  # nós já percorridos por `varrer`
+
+    def __contains__(self, codigo: str) -> bool:
+        return codigo in self._defs
+
+    @property
+    def ciclos(self) -> List[List[str]]:
+        return [list(c) for c in sorted(self._ciclos)]
+
+    def folhas(self, codigo: str) -> Optional[Folhas]:
+        if codigo in self._memo:
+            return self._memo[codigo]
+        if codigo not in self._defs:
+            return None
+        self._dfs(codigo, self._memo, lambda node: self._memo.__setitem__(node, self._combinar(node)))
+        return self._memo[codigo]
+
+    def varrer(self, codigo: str) -> None:
+        """
+        Mesma DFS de `folhas`, sem combinar folhas: só registra os ciclos. Quem
+        explodiu em outros processos (core.paralelo) repete aqui a ordem de
+        chamadas da execução em série e obtém a mesma lista de ciclos.
+        """
+        if codigo in self._visto or codigo not in self._defs:
+            return
+        self._dfs(codigo, self._visto, self._visto.add)
+
+    def _dfs(self, codigo: str, feitos: Container[str], fechar: Callable[[str], None]) -> None:
+        # DFS iterativa em pós-ordem; `aberto` = nós no caminho atual (cinza)
+        stack: List[Tuple[str, Iterator[_Filho]]] = [(codigo, iter(self._defs[codigo]))]
+        caminho: List[str] = [codigo]
+        aberto: Set[str] = {codigo}
+        while stack:
+            node, it = stack[-1]
+            desceu = False
+            for ch, _, _ in it:
+                if ch not in self._defs or ch in feitos:
+                    continue
+                if ch in aberto:
+                    self._registrar_ciclo(caminho[caminho.index(ch):])
+                    continue
+                stack.append((ch, iter(self._defs[ch])))
+                caminho.append(ch)
+                aberto.add(ch)
+                desceu = True
+                break
+            if desceu:
+                continue
+            stack.pop()
+            caminho.pop()
+            aberto.discard(node)
+            fechar(node)
+
+    def _combinar(self, node: str) -> Optional[Folhas]:
+        out: Folhas = {}
+        for ch, coef, desc in self._defs[node]:
+            if ch not in self._defs:
+                prev = out.get(ch)
+                out[ch] = (coef if prev is None else _add(prev[0], coef), desc if prev is None else prev[1])
+                continue
+            sub = self._memo.get(ch)
+            if sub is None:
+                return None  # filho em ciclo (ainda aberto) ou dependente de ciclo
+            for leaf, (c_leaf, d_leaf) in sub.items():
+                c = _mul(coef, c_leaf)
+                prev = out.get(leaf)
+                out[leaf] = (c if prev is None else _add(prev[0], c), d_leaf if prev is None else prev[1])
+        return out
+
+    def _registrar_ciclo(self, nos: List[str]) -> None:
+        i = nos.index(min(nos))  # rotação canônica: mesmo ciclo, mesma chave
+        self._ciclos.add(tuple(nos[i:] + nos[:i]))
+
+
+def comparar_folhas(fa: Folhas, fb: Folhas, tol_rel: float = TOL_COEF) -> Dict[str, Any]:
+    """
+    Compara conjuntos de folhas (A = orçamento, B = referência):
+      - folhas_missing: em A e não em B; folhas_extra: em B e não em A
+      - folhas_coef_divergente: coeficientes acumulados diferentes (quando ambos conhecidos)
+    """
+    set_a, set_b = set(fa), set(fb)
+    coef_div: List[Dict[str, Any]] = []
+    for code in sorted(set_a & set_b):
+        ca, cb = fa[code][0], fb[code][0]
+        if ca is None or cb is None:
+            continue
+        base = max(abs(ca), abs(cb))
+        if base and abs(ca - cb) / base > tol_rel:
+            coef_div.append({
+                "codigo": code,
+                "a_coef": round(ca, 8),
+                "b_coef": round(cb, 8),
+                "dif_rel": round(abs(ca - cb) / abs(cb), 6) if cb else None,
+            })
+    return {
+        "folhas_missing": sorted(set_a - set_b),
+        "folhas_extra": sorted(set_b - set_a),
+        "folhas_coef_divergente": coef_div,
+    }
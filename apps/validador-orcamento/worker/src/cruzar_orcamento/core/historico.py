@@ -0,0 +1,463 @@
+# src/cruzar_orcamento/core/historico.py
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+from collections import defaultdict
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from ..models import CanonDict
+from ..utils.utils_code import norm_code_canonical
+
+
+# ============================================================
+# Histórico mensal de preços dos bancos de referência (Parquet)
+# ============================================================
+#
+# Cada release carregada por um job é gravada num dataset colunar particionado
+# por banco e mês (layout "hive", lido pela API com o mesmo contrato):
+#
+#   <raiz>/banco=SINAPI/mes=2025-06/CCD.parquet   (uma parte por regime)
+#   <raiz>/banco=SUDECAP/mes=2025-04/base.parquet
+#
+# Colunas: codigo (canônico), descricao, unidade, valor_unit (float64, nulo =
+# custo vazio), localidade ("CCD:PR/CURITIBA" no SINAPI; "" nos demais).
+# As linhas são gravadas ordenadas por (codigo, localidade): as estatísticas
+# min/max de `codigo` por row group deixam a consulta de poucos códigos pular
+# quase todo o arquivo, e o filtro de banco/mês nem abre as outras partições.
+#
+# A parte guarda nos metadados a origem (nome, tamanho, mtime do arquivo):
+# recarregar a mesma planilha não regrava nada; uma planilha nova para o
+# mesmo banco/mês substitui a parte (gravação atômica via rename).
+#
+# A lista de meses vem só dos diretórios: achar a release vigente numa
+# data-base é um lookup, e carregá-la (`carregar_release`) lê uma partição
+# Parquet em vez de reprocessar a planilha arquivada.
+
+SCHEMA = pa.schema([
+    ("codigo", pa.string()),
+    ("descricao", pa.string()),
+    ("unidade", pa.string()),
+    ("valor_unit", pa.float64()),
+    ("localidade", pa.string()),
+])
+PARTICOES = ds.partitioning(pa.schema([("banco", pa.string()), ("mes", pa.string())]), flavor="hive")
+
+_ROW_GROUP = 64 * 1024
+_META_FONTE = b"fonte"
+
+_MES_RE = re.compile(r"(?<!\d)(20\d{2})[-_./]?(0[1-9]|1[0-2])(?!\d)")
+_MES_INV_RE = re.compile(r"(?<!\d)(0[1-9]|1[0-2])[-_./](20\d{2})(?!\d)")
+
+
+# ------------------------------------------------------------
+# Mês de referência
+# ------------------------------------------------------------
+def norm_mes(x: Any) -> str:
+    """'2025-06', '2025_06', '202506', '06/2025', date/datetime → '2025-06'."""
+    if isinstance(x, (date, datetime)):
+        return f"{x.year:04d}-{x.month:02d}"
+    s = str(x or "").strip()
+    m = _MES_RE.fullmatch(s) or _MES_RE.match(s)
+    if m:
+        return f"{m.group(1)}-{m.group(2)}"
+    m = _MES_INV_RE.fullmatch(s)
+    if m:
+        return f"{m.group(2)}-{m.group(1)}"
+    raise ValueError(f"Mês de referência inválido: {x!r} (use AAAA-MM).")
+
+
+def mes_do_arquivo(path: Any) -> Optional[str]:
+    """Mês de referência pelo nome do arquivo (ex.: 'SINAPI_2025_06.xlsx' → '2025-06')."""
+    name = Path(str(path)).stem
+    m = _MES_RE.search(name)
+    if m:
+        return f"{m.group(1)}-{m.group(2)}"
+    m = _MES_INV_RE.search(name)
+    return f"{m.group(2)}-{m.group(1)}" if m else None
+
+
+# ------------------------------------------------------------
+# Gravação
+# ------------------------------------------------------------
+def _norm_banco(banco: str) -> str:
+    b = str(banco or "").strip().upper()
+    if not b or not re.fullmatch(r"[A-Z0-9_]+", b):
+        raise ValueError(f"Banco inválido para o histórico: {banco!r}")
+    return b
+
+
+def _parte_path(raiz: Path, banco: str, mes: str, parte: str) -> Path:
+    return Path(raiz) / f"banco={banco}" / f"mes={mes}" / f"{parte}.parquet"
+
+
+def _fonte_info(fonte: Optional[Any]) -> Dict[str, Any]:
+    if fonte is None:
+        return {}
+    p = Path(fonte)
+    try:
+        st = p.stat()
+        return {"nome": p.name, "bytes": st.st_size, "mtime_ns": st.st_mtime_ns}
+    except OSError:
+        return {"nome": p.name}
+
+
+def _mesma_fonte(path: Path, info: Dict[str, Any]) -> bool:
+    if not info or "mtime_ns" not in info or not path.exists():
+        return False
+    try:
+        meta = pq.read_schema(path).metadata or {}
+        return json.loads(meta.get(_META_FONTE, b"{}")) == info
+    except Exception:
+        return False
+
+
+def _gravar(path: Path, table: pa.Table, info: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = table.replace_schema_metadata({_META_FONTE: json.dumps(info, sort_keys=True).encode()})
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        pq.write_table(table, tmp, row_group_size=_ROW_GROUP, compression="zstd")
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def registrar_canon(
+    raiz: Path,
+    banco: str,
+    mes: Any,
+    itens: CanonDict,
+    *,
+    fonte: Optional[Any] = None,
+    parte: str = "base",
+) -> Dict[str, Any]:
+    """
+    Grava (ou substitui) a parte `parte` de banco/mês a partir de um CanonDict
+    de preços (saída de load_sudecap / load_secid_precos / to_canon).
+    Retorna {"arquivo", "linhas", "gravado"} — gravado=False quando a mesma
+    planilha já está registrada.
+    """
+    banco, mes = _norm_banco(banco), norm_mes(mes)
+    path = _parte_path(raiz, banco, mes, parte)
+    info = _fonte_info(fonte)
+    if _mesma_fonte(path, info):
+        return {"arquivo": str(path), "linhas": pq.read_metadata(path).num_rows, "gravado": False}
+
+    rows: Dict[str, Dict[str, Any]] = {}
+    for key, it in (itens or {}).items():
+        code = norm_code_canonical((it or {}).get("codigo") or key)
+        if code and code not in rows:
+            rows[code] = it
+    codes = sorted(rows)
+
+    def _val(it: Dict[str, Any]) -> Optional[float]:
+        try:
+            v = it.get("valor_unit")
+            return None if v is None or v != v else float(v)
+        except (TypeError, ValueError):
+            return None
+
+    table = pa.table({
+        "codigo": codes,
+        "descricao": [str(rows[c].get("descricao") or "") for c in codes],
+        "unidade": [(str(rows[c]["unidade"]) if rows[c].get("unidade") else None) for c in codes],
+        "valor_unit": [_val(rows[c]) for c in codes],
+        "localidade": [""] * len(codes),
+    }, schema=SCHEMA)
+    _gravar(path, table, info)
+    return {"arquivo": str(path), "linhas": table.num_rows, "gravado": True}
+
+
+def registrar_sinapi(
+    raiz: Path,
+    mes: Any,
+    matriz: Any,
+    *,
+    fonte: Optional[Any] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Grava a `SinapiMatriz` inteira (todas as UFs/cidades), uma parte por regime.
+    Monta as colunas direto dos arrays da matriz (sem dict por item).
+    """
+    mes = norm_mes(mes)
+    info = _fonte_info(fonte)
+    canon = [norm_code_canonical(c) for c in matriz.codigos]
+    ordem = np.array(sorted(range(len(canon)), key=canon.__getitem__), dtype=np.intp)
+    codigos = np.array(canon, dtype=object)[ordem]
+    descricoes = np.array(matriz.descricoes, dtype=object)[ordem]
+    labels = np.array([matriz.label(j) for j in range(len(matriz.localidades))], dtype=object)
+
+    out: List[Dict[str, Any]] = []
+    for reg in sorted({loc[0] for loc in matriz.localidades}):
+        path = _parte_path(raiz, "SINAPI", mes, reg)
+        if _mesma_fonte(path, info):
+            out.append({"arquivo": str(path), "linhas": pq.read_metadata(path).num_rows, "gravado": False})
+            continue
+        cols = np.array([j for j, loc in enumerate(matriz.localidades) if loc[0] == reg], dtype=np.intp)
+        # ordem de cols por rótulo → linhas saem ordenadas por (codigo, localidade)
+        cols = cols[np.argsort(labels[cols], kind="stable")]
+        ii, jj = np.nonzero(matriz.presente[ordem][:, cols])
+        precos = matriz.precos[ordem][:, cols][ii, jj]
+        table = pa.table({
+            "codigo": pa.array(codigos[ii], type=pa.string()),
+            "descricao": pa.array(descricoes[ii], type=pa.string()),
+            "unidade": pa.nulls(len(ii), type=pa.string()),
+            "valor_unit": pa.array(precos, type=pa.float64(), from_pandas=True),
+            "localidade": pa.array(labels[cols][jj], type=pa.string()),
+        }, schema=SCHEMA)
+        _gravar(path, table, info)
+        out.append({"arquivo": str(path), "linhas": table.num_rows, "gravado": True})
+    return out
+
+
+# ------------------------------------------------------------
+# Consulta
+# ------------------------------------------------------------
+def meses(raiz: Path, banco: Optional[str] = None) -> Dict[str, List[str]]:
+    """{banco: [meses registrados]} — só lista diretórios, não abre arquivos."""
+    raiz = Path(raiz)
+    out: Dict[str, List[str]] = {}
+    if not raiz.exists():
+        return out
+    for b in sorted(raiz.glob("banco=*")):
+        nome = b.name.split("=", 1)[1]
+        if banco and nome != _norm_banco(banco):
+            continue
+        ms = sorted(m.name.split("=", 1)[1] for m in b.glob("mes=*") if any(m.glob("*.parquet")))
+        if ms:
+            out[nome] = ms
+    return out
+
+
+def release_vigente(raiz: Path, banco: str, em: Any) -> Optional[str]:
+    """Release em vigor na data-base `em`: o último mês registrado <= em."""
+    alvo = norm_mes(em)
+    ms = [m for m in meses(raiz, banco).get(_norm_banco(banco), []) if m <= alvo]
+    return ms[-1] if ms else None
+
+
+def _filtro_localidade(localidade: str):
+    """'CCD:PR/CURITIBA' casa exato; sem cidade ('CCD:PR') casa pelo prefixo 'CCD:PR/'."""
+    loc = str(localidade).strip().upper()
+    if "/" in loc:
+        return ds.field("localidade") == loc
+    return pc.starts_with(ds.field("localidade"), pattern=loc + "/")
+
+
+def carregar_release(
+    raiz: Path,
+    banco: str,
+    mes: Any,
+    *,
+    localidade: Optional[str] = None,
+) -> Tuple[CanonDict, Optional[str]]:
+    """
+    CanonDict de uma release registrada (mesmo formato dos loaders de preço).
+    SINAPI: `localidade` ('CCD:PR/CURITIBA' ou 'CCD:PR') escolhe a coluna; só a
+    parte do regime é lida. Retorna (itens, rótulo da localidade ou None).
+    """
+    banco, mes = _norm_banco(banco), norm_mes(mes)
+    pasta = Path(raiz) / f"banco={banco}" / f"mes={mes}"
+    filtro = None
+    if localidade:
+        partes = [pasta / f"{str(localidade).split(':', 1)[0].strip().upper()}.parquet"]
+        filtro = _filtro_localidade(localidade)
+    else:
+        partes = sorted(pasta.glob("*.parquet"))
+    partes = [p for p in partes if p.exists()]
+    if not partes:
+        alvo = f" ({localidade})" if localidade else ""
+        raise FileNotFoundError(f"{banco} {mes}{alvo}: release não registrada no histórico.")
+
+    tab = ds.dataset([str(p) for p in partes], format="parquet", schema=SCHEMA).to_table(filter=filtro)
+    labels = sorted(set(tab.column("localidade").to_pylist()))
+    if len(labels) > 1:
+        raise ValueError(f"{banco} {mes}: várias localidades ({', '.join(labels[:5])}…); informe a cidade.")
+    if localidade and not labels:
+        raise ValueError(f"{banco} {mes}: localidade {localidade} não encontrada no histórico.")
+
+    out: CanonDict = {}
+    for r in tab.to_pylist():
+        item: Dict[str, Any] = {
+            "codigo": r["codigo"],
+            "descricao": r["descricao"],
+            # custo vazio vira 0.0, como nos loaders
+            "valor_unit": 0.0 if r["valor_unit"] is None else r["valor_unit"],
+            "fonte": banco,
+        }
+        if r["unidade"]:
+            item["unidade"] = r["unidade"]
+        out[r["codigo"]] = item
+    return out, (labels[0] or None) if labels else None
+
+
+def melhor_release(
+    raiz: Path,
+    banco: str,
+    alvos: Iterable[Tuple[Any, float]],
+    *,
+    localidade: Optional[str] = None,
+) -> Dict[Tuple[str, float], Dict[str, Any]]:
+    """
+    Para cada (codigo, valor do orçamento), a release registrada cujo preço mais
+    se aproxima do valor: {(codigo, valor): {"mes", "valor_unit", "dif_rel"}}.
+    Empate → mês mais recente. Uma única leitura (mes/codigo/valor_unit) de
+    todos os meses do banco, filtrada pelos códigos.
+    """
+    alvos = [(norm_code_canonical(c), float(v)) for c, v in alvos if v is not None]
+    codes = sorted({c for c, _ in alvos if c})
+    if not codes or not meses(raiz, banco):
+        return {}
+    f = (ds.field("banco") == _norm_banco(banco)) & ds.field("codigo").isin(codes)
+    if localidade:
+        f &= _filtro_localidade(localidade)
+    tab = ds.dataset(Path(raiz), format="parquet", partitioning=PARTICOES).to_table(
+        columns=["mes", "codigo", "valor_unit"], filter=f,
+    )
+    serie: Dict[str, List[Tuple[str, float]]] = defaultdict(list)
+    for m, c, v in zip(*(tab.column(k).to_pylist() for k in ("mes", "codigo", "valor_unit"))):
+        if v is not None:
+            serie[c].append((m, v))
+
+    out: Dict[Tuple[str, float], Dict[str, Any]] = {}
+    for codigo, valor in alvos:
+        best: Optional[Tuple[str, float, float]] = None
+        for m, v in serie.get(codigo, ()):
+            dif = abs(valor - v) / abs(v) if v else (0.0 if valor == v else math.inf)
+            if best is None or dif < best[2] or (dif == best[2] and m > best[0]):
+                best = (m, v, dif)
+        if best is not None:
+            out[(codigo, valor)] = {
+                "mes": best[0],
+                "valor_unit": best[1],
+                "dif_rel": round(best[2], 6) if math.isfinite(best[2]) else None,
+            }
+    return out
+
+
+def anotar_releases_provaveis(
+    raiz: Path,
+    divergencias: List[Dict[str, Any]],
+    localidades: Optional[Dict[str, Optional[str]]] = None,
+) -> Dict[str, Dict[str, int]]:
+    """
+    Anota `release_provavel` ({mes, valor_unit, dif_rel}) em cada VALOR_DIVERGENTE
+    (precisa de `a_valor`, ver consolidar_precos_multi): a release do histórico
+    cujo preço mais se aproxima do valor orçado. Uma consulta por banco.
+    Retorna {banco: {mes: nº de divergências explicadas por ele}}.
+    """
+    por_banco: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for d in divergencias:
+        if "VALOR_DIVERGENTE" in d.get("motivos", []) and d.get("a_valor") is not None:
+            por_banco[d["ref"]].append(d)
+
+    resumo: Dict[str, Dict[str, int]] = {}
+    for banco, divs in sorted(por_banco.items()):
+        loc = (localidades or {}).get(banco)
+        melhor = melhor_release(raiz, banco, [(d["codigo"], d["a_valor"]) for d in divs], localidade=loc)
+        cont: Dict[str, int] = defaultdict(int)
+        for d in divs:
+            r = melhor.get((norm_code_canonical(d["codigo"]), float(d["a_valor"])))
+            if r is not None:
+                d["release_provavel"] = r
+                cont[r["mes"]] += 1
+        resumo[banco] = dict(sorted(cont.items()))
+    return resumo
+
+
+def _filtro(banco: str, codigos: Iterable[Any], localidade: Optional[str], desde: Optional[Any], ate: Optional[Any]):
+    codes = sorted({c for c in (norm_code_canonical(x) for x in codigos) if c})
+    if not codes:
+        raise ValueError("Informe ao menos um código.")
+    f = (ds.field("banco") == _norm_banco(banco)) & ds.field("codigo").isin(codes)
+    if desde is not None:
+        f &= ds.field("mes") >= norm_mes(desde)
+    if ate is not None:
+        f &= ds.field("mes") <= norm_mes(ate)
+    if localidade is not None:
+        f &= _filtro_localidade(localidade) if localidade else ds.field("localidade") == ""
+    return f
+
+
+def historico(
+    raiz: Path,
+    banco: str,
+    codigos: Iterable[Any],
+    *,
+    localidade: Optional[str] = None,
+    desde: Optional[Any] = None,
+    ate: Optional[Any] = None,
+    colunas: Sequence[str] = ("mes", "codigo", "localidade", "valor_unit", "descricao"),
+) -> List[Dict[str, Any]]:
+    """
+    Linhas do histórico dos `codigos` (ordem: codigo, localidade, mes). Lê só
+    as partições do banco/intervalo e só as `colunas` pedidas.
+    """
+    if not meses(raiz, banco):
+        return []
+    dset = ds.dataset(Path(raiz), format="parquet", partitioning=PARTICOES)
+    tab = dset.to_table(columns=list(colunas), filter=_filtro(banco, codigos, localidade, desde, ate))
+    ordem = [(k, "ascending") for k in ("codigo", "localidade", "mes") if k in colunas]
+    return (tab.sort_by(ordem) if ordem else tab).to_pylist()
+
+
+def vigente(
+    raiz: Path,
+    banco: str,
+    codigo: Any,
+    em: Any,
+    *,
+    localidade: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Preço do código na release vigente em `em` (último mês <= em), por localidade."""
+    linhas = historico(raiz, banco, [codigo], localidade=localidade, ate=em)
+    ultimo: Dict[str, Dict[str, Any]] = {}
+    for r in linhas:  # ordenado por mês: o último de cada localidade prevalece
+        ultimo[r["localidade"]] = r
+    return [ultimo[k] for k in sorted(ultimo)]
+
+
+def variacoes(
+    raiz: Path,
+    banco: str,
+    codigos: Iterable[Any],
+    *,
+    localidade: Optional[str] = None,
+    desde: Optional[Any] = None,
+    ate: Optional[Any] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Variação mês a mês de cada (codigo, localidade):
+      [{"codigo", "localidade", "mes", "valor_unit", "mes_anterior", "dif_abs", "dif_rel"}]
+    A primeira release do intervalo entra sem anterior (dif_* nulos).
+    """
+    linhas = historico(
+        raiz, banco, codigos, localidade=localidade, desde=desde, ate=ate,
+        colunas=("mes", "codigo", "localidade", "valor_unit"),
+    )
+    out: List[Dict[str, Any]] = []
+    prev: Optional[Dict[str, Any]] = None
+    for r in linhas:
+        mesma = prev is not None and prev["codigo"] == r["codigo"] and prev["localidade"] == r["localidade"]
+        a = prev["valor_unit"] if mesma else None
+        b = r["valor_unit"]
+        dif = round(b - a, 6) if a is not None and b is not None else None
+        out.append({
+            **r,
+            "mes_anterior": prev["mes"] if mesma else None,
+            "dif_abs": dif,
+            "dif_rel": round(dif / abs(a), 6) if dif is not None and a else None,
+        })
+        prev = r
+    return out
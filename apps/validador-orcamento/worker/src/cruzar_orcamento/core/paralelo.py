@@ -0,0 +1,133 @@
+# src/cruzar_orcamento/core/paralelo.py
+from __future__ import annotations
+
+import multiprocessing as mp
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ..utils import checkpoint as _checkpoint
+
+
+# ============================================================
+# Consolidação em fatias (processos com fork)
+# ============================================================
+#
+# As consolidações multi são laços Python sobre todos os itens/pais do
+# orçamento: num orçamento enorme, um núcleo só. Aqui o orçamento é dividido
+# em fatias pelo hash (crc32) do código canônico e cada fatia é consolidada
+# num processo filho. Os filhos nascem por fork *depois* de montados os
+# índices das bases (BankIndex, CodeIndex, ParentIndex, explosores): herdam
+# tudo por cópia-na-escrita, sem pickle por tarefa; só o resultado de cada
+# fatia volta ao pai.
+#
+# Mesmo código canônico → mesma fatia, na ordem original do orçamento: a
+# ordenação estável do pai (chave_cruzado / chave_divergencia) devolve
+# exatamente a mesma lista da execução sequencial, e os contadores do
+# `resumo` são somas por fatia.
+#
+# Os filhos não falam com Redis: o hook de checkpoint (cancelamento, prazos,
+# progresso) é desligado neles; o pai conta os itens de cada fatia que volta
+# e consulta o hook ali e a cada ESPERA_S sem resultado. Sem fork
+# (Windows/macOS spawn) tudo roda em série.
+#
+# Filho morto no meio de uma fatia (OOM killer, sinal) não devolve nada e o
+# Pool só repõe o processo: a fatia some e o imap esperaria para sempre. A
+# cada ESPERA_S sem resultado o pai confere os filhos; algum encerrado vira
+# `FilhoPerdido` e o job falha. A memória dos filhos entra no orçamento do
+# job pelo MemoryWatch do worker (src.memory.filhos_bytes).
+
+FATIAS_POR_PROCESSO = 4   # mais fatias que processos: balanceia e dá progresso mais fino
+ESPERA_S = 1.0            # sem resultado por esse tempo: consulta o hook e confere os filhos
+
+_tarefa: Optional[Tuple[Callable[[Any], Any], List[Any]]] = None  # herdada pelos filhos
+
+
+class FilhoPerdido(RuntimeError):
+    """Um processo da consolidação em fatias encerrou (p.ex. OOM killer) e a fatia dele se perdeu."""
+
+
+def fork_disponivel() -> bool:
+    return "fork" in mp.get_all_start_methods()
+
+
+def usar_processos(processos: Optional[int], n_itens: int, min_itens: int) -> int:
+    """Quantos processos usar (1 = em série): pedido > 1, orçamento grande e fork disponível."""
+    p = int(processos or 1)
+    if p <= 1 or n_itens < max(1, int(min_itens)) or not fork_disponivel():
+        return 1
+    return p
+
+
+def fatia_de(codigo_canonico: str, n: int) -> int:
+    return zlib.crc32(codigo_canonico.encode("utf-8")) % n
+
+
+def fatiar(
+    itens: Dict[str, Dict[str, Any]],
+    codigo: Callable[[str, Dict[str, Any]], str],
+    n: int,
+) -> List[Dict[str, Dict[str, Any]]]:
+    """Divide o dict do orçamento em `n` fatias pelo código canônico (ordem preservada)."""
+    fatias: List[Dict[str, Dict[str, Any]]] = [{} for _ in range(n)]
+    for key, it in itens.items():
+        fatias[fatia_de(codigo(key, it), n)][key] = it
+    return [f for f in fatias if f]
+
+
+def _init_filho() -> None:
+    _checkpoint.instalar(None)
+
+
+def _rodar(i: int) -> Tuple[int, Any]:
+    fn, fatias = _tarefa  # type: ignore[misc]
+    return i, fn(fatias[i])
+
+
+def _conferir_filhos(pool: Any, iniciais: Dict[int, Any]) -> None:
+    # sem maxtasksperchild nenhum filho sai por conta própria: encerrado ou
+    # reposto pelo Pool (pid novo) = filho morto com uma fatia na mão
+    mortos = [p for p in iniciais.values() if p.exitcode is not None]
+    repostos = [p for p in list(pool._pool) if p.pid not in iniciais]
+    if not mortos and not repostos:
+        return
+    if mortos:
+        code = mortos[0].exitcode
+        causa = f"encerrou com sinal {-code}" if code < 0 else f"encerrou com código {code}"
+        quem = f"(pid {mortos[0].pid}) {causa}"
+    else:
+        quem = "foi reposto pelo pool"
+    raise FilhoPerdido(
+        f"Processo da consolidação em fatias {quem}; "
+        "a fatia em andamento se perdeu (provável falta de memória)."
+    )
+
+
+def mapear(
+    fn: Callable[[Dict[str, Dict[str, Any]]], Any],
+    fatias: List[Dict[str, Dict[str, Any]]],
+    processos: int,
+) -> Iterator[Tuple[int, Any]]:
+    """
+    (índice da fatia, fn(fatia)) na ordem em que terminam. `fn` e as fatias
+    chegam aos filhos pelo fork (não são serializados); interromper o
+    iterador (exceção do hook no pai, `FilhoPerdido`) encerra o pool.
+    """
+    global _tarefa
+    _tarefa = (fn, fatias)
+    try:
+        ctx = mp.get_context("fork")
+        with ctx.Pool(processes=min(processos, len(fatias)), initializer=_init_filho) as pool:
+            iniciais: Dict[int, Any] = {p.pid: p for p in pool._pool}
+            it = pool.imap_unordered(_rodar, range(len(fatias)))
+            for _ in range(len(fatias)):
+                while True:
+                    try:
+                        i, out = it.next(timeout=ESPERA_S)
+                        break
+                    except mp.TimeoutError:
+                        _conferir_filhos(pool, iniciais)
+                        _checkpoint.avancar(0)
+                _checkpoint.avancar(len(fatias[i]))
+                yield i, out
+    finally:
+        _tarefa = None
@@ -0,0 +1,101 @@
+# src/cruzar_orcamento/core/similarity.py
+from __future__ import annotations
+
+from typing import Any, Dict, FrozenSet, Hashable, NamedTuple, Optional
+
+from ..utils.utils_text import norm_text
+
+
+# ============================================================
+# Similaridade de descrições
+# ============================================================
+#
+# Em vez de `norm_text(a) != norm_text(b)`, cada descrição vira uma assinatura
+# (texto normalizado + conjunto de tokens + trigramas de caracteres + números).
+# A nota combina Jaccard de tokens (robusto a reordenação) com Dice de
+# trigramas (robusto a erros de digitação/abreviações). Números (bitolas,
+# fck, dimensões) precisam bater exatamente: "CONCRETO FCK 20" x "FCK 25"
+# nunca é considerado equivalente, por mais alta que seja a nota.
+#
+# As assinaturas das bases são calculadas uma única vez por descrição
+# (`DescIndex`), e a comparação de um par é O(tokens + trigramas): o custo por
+# item fica no mesmo patamar da comparação exata, sem nada quadrático.
+
+
+class DescSignature(NamedTuple):
+    norm: str
+    tokens: FrozenSet[str]
+    grams: FrozenSet[str]
+    nums: FrozenSet[str]
+
+
+_EMPTY = DescSignature("", frozenset(), frozenset(), frozenset())
+
+
+def signature(text: Any) -> DescSignature:
+    """Assinatura de uma descrição (normalização de `norm_text`)."""
+    s = norm_text(text)
+    if not s:
+        return _EMPTY
+    tokens = frozenset(s.split(" "))
+    padded = f" {s} "
+    grams = frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+    nums = frozenset(t for t in tokens if any(ch.isdigit() for ch in t))
+    return DescSignature(s, tokens, grams, nums)
+
+
+def similarity(a: DescSignature, b: DescSignature) -> float:
+    """
+    Nota em [0, 1]. 1.0 somente quando os textos normalizados são idênticos.
+    Números divergentes derrubam a nota para no máximo o Jaccard de tokens.
+    """
+    if a.norm == b.norm:
+        return 1.0
+    if not a.norm or not b.norm:
+        return 0.0
+    tok = len(a.tokens & b.tokens) / len(a.tokens | b.tokens)
+    gram = 2.0 * len(a.grams & b.grams) / (len(a.grams) + len(b.grams))
+    score = 0.5 * (tok + gram)
+    if a.nums != b.nums:
+        score = min(score, tok)
+    return round(min(score, 0.9999), 4)
+
+
+def desc_equivalentes(a: DescSignature, b: DescSignature, sim_min: float) -> bool:
+    """Equivalência sob o limiar: idênticas, ou nota >= sim_min com os mesmos números."""
+    if a.norm == b.norm:
+        return True
+    if sim_min >= 1.0 or a.nums != b.nums:
+        return False
+    return similarity(a, b) >= sim_min
+
+
+class DescIndex:
+    """
+    Assinaturas das descrições de uma base, memorizadas pelo texto original.
+    Cada descrição distinta é processada no máximo uma vez por base/job —
+    inclusive insumos que se repetem como filhos de milhares de composições.
+    """
+
+    def __init__(self) -> None:
+        self._sigs: Dict[Hashable, DescSignature] = {}
+
+    def get(self, text: Any) -> DescSignature:
+        key = "" if text is None else text
+        sig = self._sigs.get(key)
+        if sig is None:
+            sig = signature(text)
+            self._sigs[key] = sig
+        return sig
+
+    def __len__(self) -> int:
+        return len(self._sigs)
+
+
+def clamp_sim_min(x: Optional[Any], default: float = 1.0) -> float:
+    """Normaliza o limiar vindo do payload para [0, 1]."""
+    try:
+        v = float(x) if x is not None else default
+    except (TypeError, ValueError):
+        v = default
+    return max(0.0, min(1.0, v))
@@ -0,0 +1,171 @@
+# src/cruzar_orcamento/exporters/colunar.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import itertools, json, os, tempfile
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+# ---------------------------------------------------------------------
+# Tabelas do artefato em formato colunar (Parquet / Arrow IPC)
+# ---------------------------------------------------------------------
+# Cada lista de linhas do payload (cruzado, divergencias, ...) vira um arquivo
+# ao lado do JSON: '<artefato>.<tabela>.parquet' (ou .arrow). Blocos aninhados
+# (ex.: sinapi: {...}) viram colunas 'sinapi.valor', 'sinapi.ok', ...; listas
+# (motivos, sugestoes) ficam como list<...>. Duas passadas em lotes: a 1ª
+# unifica o schema, a 2ª grava — a memória não depende do tamanho da tabela.
+
+FORMATOS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+_LOTE = 50_000
+
+Fonte = Callable[[], Iterable[Dict[str, Any]]]
+
+
+def norm_formato(formato: Optional[str]) -> Optional[str]:
+    """'parquet' | 'arrow' | None (desligado)."""
+    f = str(formato or "").strip().lower()
+    if not f:
+        return None
+    if f not in FORMATOS:
+        raise ValueError(f"Formato colunar inválido: {formato!r} (use parquet ou arrow).")
+    return f
+
+
+def _achatar(r: Dict[str, Any], prefixo: str = "", out: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    out = {} if out is None else out
+    for k, v in r.items():
+        nome = f"{prefixo}{k}"
+        if isinstance(v, dict):
+            _achatar(v, nome + ".", out)
+        else:
+            out[nome] = v
+    return out
+
+
+def _lotes(fonte: Fonte) -> Iterator[List[Dict[str, Any]]]:
+    it = iter(fonte())
+    while True:
+        lote = [_achatar(r) for r in itertools.islice(it, _LOTE)]
+        if not lote:
+            return
+        yield lote
+
+
+def _texto(v: Any) -> Optional[str]:
+    if v is None or isinstance(v, str):
+        return v
+    return json.dumps(v, ensure_ascii=False)
+
+
+def _schema(fonte: Fonte) -> Tuple[Optional[pa.Schema], set]:
+    """Schema unificado de todos os lotes (colunas na ordem em que aparecem) + colunas gravadas como texto."""
+    campos: Dict[str, pa.DataType] = {}
+    como_texto: set = set()
+    for lote in _lotes(fonte):
+        nomes = list(dict.fromkeys(k for r in lote for k in r))
+        for n in nomes:
+            if n in como_texto:
+                continue
+            try:
+                t = pa.array([r.get(n) for r in lote]).type
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # tipos mistos na mesma coluna: grava como texto (JSON)
+                como_texto.add(n)
+                campos[n] = pa.string()
+                continue
+            if n not in campos:
+                campos[n] = t
+            elif campos[n] != t:
+                try:
+                    campos[n] = pa.unify_schemas(
+                        [pa.schema([(n, campos[n])]), pa.schema([(n, t)])], promote_options="permissive",
+                    ).field(n).type
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    como_texto.add(n)
+                    campos[n] = pa.string()
+    if not campos:
+        return None, como_texto
+    # coluna só com nulos em todos os lotes: string (tipo null não é útil a jusante)
+    return pa.schema([(n, pa.string() if t == pa.null() else t) for n, t in campos.items()]), como_texto
+
+
+def _gravar_tabela(fonte: Fonte, out: Path, formato: str) -> int:
+    schema, como_texto = _schema(fonte)
+    if schema is None:
+        return 0
+
+    with tempfile.NamedTemporaryFile("wb", delete=False, dir=out.parent, suffix=".tmp") as tmp:
+        tmp_name = tmp.name
+    linhas = 0
+    try:
+        writer = (
+            pq.ParquetWriter(tmp_name, schema, compression="zstd")
+            if formato == "parquet" else ipc.new_file(tmp_name, schema)
+        )
+        with writer:
+            for lote in _lotes(fonte):
+                cols = []
+                for campo in schema:
+                    vals = [r.get(campo.name) for r in lote]
+                    if campo.name in como_texto:
+                        vals = [_texto(v) for v in vals]
+                    cols.append(pa.array(vals, type=campo.type))
+                writer.write_table(pa.Table.from_arrays(cols, schema=schema))
+                linhas += len(lote)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+    os.chmod(tmp_name, 0o644)
+    os.replace(tmp_name, out)
+    return linhas
+
+
+def tabelas(payload: Dict[str, Any]) -> Dict[str, Fonte]:
+    """
+    Listas de linhas do payload: 'cruzado', 'divergencias', 'precos.cruzado'
+    (completo), ...; 'por_localidade' vira uma tabela só, com a coluna 'localidade'.
+    """
+    def _eh_tabela(v: Any) -> bool:
+        # listas de dicts (ou seções em disco do modo streaming, que são iteráveis)
+        if isinstance(v, list):
+            return bool(v) and isinstance(v[0], dict)
+        return hasattr(v, "__iter__") and not isinstance(v, (dict, str, bytes))
+
+    out: Dict[str, Fonte] = {}
+    for k, v in payload.items():
+        if k == "meta":
+            continue
+        if k == "por_localidade" and isinstance(v, dict):
+            out["por_localidade.divergencias"] = lambda v=v: (
+                {"localidade": lb, **r} for lb, x in v.items() for r in x.get("divergencias") or []
+            )
+        elif isinstance(v, dict):
+            for kk, vv in v.items():
+                if _eh_tabela(vv):
+                    out[f"{k}.{kk}"] = lambda vv=vv: vv
+        elif _eh_tabela(v):
+            out[k] = lambda v=v: v
+    return out
+
+
+def export_colunar(payload: Dict[str, Any], json_path: str | Path, formato: str = "parquet") -> Dict[str, Path]:
+    """
+    Grava as tabelas do payload ao lado do artefato JSON
+    ('<artefato>.<tabela>.parquet|.arrow'); retorna {tabela: caminho}. Tabelas
+    vazias não geram arquivo.
+    """
+    formato = norm_formato(formato) or "parquet"
+    base = Path(json_path)
+    stem = base.name
+    for suf in (".gz", ".json"):
+        stem = stem[: -len(suf)] if stem.endswith(suf) else stem
+    out: Dict[str, Path] = {}
+    for nome, fonte in tabelas(payload).items():
+        destino = base.with_name(f"{stem}.{nome}{FORMATOS[formato]}")
+        if _gravar_tabela(fonte, destino, formato):
+            out[nome] = destino
+    return out
@@ -1,15 +1,36 @@
 # src/cruzar_orcamento/exporters/json_compacto.py
 from __future__ import annotations
+from contextlib import contextmanager
 from pathlib import Path
-import json, os, tempfile
+from typing import BinaryIO, Iterator, TextIO
+import gzip, io, json, os, tempfile
+
+# '.gz' no nome do artefato → gravado comprimido (a API serve os bytes como estão,
+# com Content-Encoding: gzip). Nível 6: ~10× menor em JSON, bem mais rápido que o 9.
+GZIP_NIVEL = 6
+
+@contextmanager
+def abrir_texto(raw: BinaryIO, comprimir: bool) -> Iterator[TextIO]:
+    """Texto UTF-8 sobre `raw`; com `comprimir`, gzip (mtime=0: mesmo conteúdo → mesmos bytes)."""
+    gz = gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=GZIP_NIVEL, mtime=0) if comprimir else None
+    txt = io.TextIOWrapper(gz if gz is not None else raw, encoding="utf-8")
+    try:
+        yield txt
+    finally:
+        # não fecha `raw`: quem chama ainda faz fsync/rename
+        txt.flush()
+        txt.detach()
+        if gz is not None:
+            gz.close()
 
 def export_json(payload: dict, out_path: str | Path) -> Path:
     out = Path(out_path)
     out.parent.mkdir(parents=True, exist_ok=True)
 
     # escreve em arquivo temporário (atômico)…
-    with tempfile.NamedTemporaryFile("w", delete=False, dir=out.parent, encoding="utf-8") as tmp:
-        json.dump(payload, tmp, ensure_ascii=False, indent=2)
+    with tempfile.NamedTemporaryFile("wb", delete=False, dir=out.parent) as tmp:
+        with abrir_texto(tmp, comprimir=out.suffix == ".gz") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
         tmp.flush()
         os.fsync(tmp.fileno())
         tmp_name = tmp.name
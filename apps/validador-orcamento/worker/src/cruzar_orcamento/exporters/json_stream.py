@@ -0,0 +1,118 @@
+# src/cruzar_orcamento/exporters/json_stream.py
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, TextIO
+import heapq, itertools, json, os, shutil, tempfile
+
+from .json_compacto import abrir_texto
+
+# ---------------------------------------------------------------------
+# Exportação em streaming (orçamentos muito grandes)
+# ---------------------------------------------------------------------
+# Cada lote de linhas é ordenado e gravado em disco como um "run" (JSON lines);
+# na exportação os runs são intercalados (heapq.merge, estável) e escritos linha
+# a linha. O arquivo final sai idêntico ao de export_json (indent=2) sobre as
+# listas inteiras ordenadas com sorted(..., key) — sem nunca tê-las em memória.
+
+_INDENT = "  "
+
+
+class SecaoOrdenada:
+    """Lista de saída acumulada em runs ordenados por `key` dentro de `run_dir`."""
+
+    def __init__(self, run_dir: str | Path, nome: str, key: Callable[[Dict[str, Any]], Any]) -> None:
+        self.run_dir = Path(run_dir)
+        self.nome = nome
+        self.key = key
+        self.runs: List[Path] = []
+        self.total = 0
+
+    def extend(self, linhas: Iterable[Dict[str, Any]]) -> None:
+        lote = sorted(linhas, key=self.key)
+        if not lote:
+            return
+        run = self.run_dir / f"{self.nome}.{len(self.runs):05d}.jsonl"
+        with run.open("w", encoding="utf-8") as f:
+            for r in lote:
+                f.write(json.dumps(r, ensure_ascii=False))
+                f.write("\n")
+        self.runs.append(run)
+        self.total += len(lote)
+
+    def __len__(self) -> int:
+        return self.total
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        arquivos = [r.open("r", encoding="utf-8") for r in self.runs]
+        try:
+            fontes = [(json.loads(ln) for ln in f) for f in arquivos]
+            # empates saem na ordem dos runs (= ordem de chegada), como no sorted()
+            yield from heapq.merge(*fontes, key=self.key)
+        finally:
+            for f in arquivos:
+                f.close()
+
+
+def nova_pasta_runs(out_dir: str | Path) -> Path:
+    """Pasta temporária (oculta) para os runs, no mesmo volume do artefato."""
+    return Path(tempfile.mkdtemp(prefix=".runs-", dir=out_dir))
+
+
+def remover_pasta_runs(run_dir: str | Path) -> None:
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def _tem_secao(v: Any) -> bool:
+    if isinstance(v, SecaoOrdenada):
+        return True
+    if isinstance(v, dict):
+        return any(_tem_secao(x) for x in v.values())
+    return False
+
+
+def _escrever(f: TextIO, v: Any, nivel: int) -> None:
+    pad = _INDENT * nivel
+    if isinstance(v, SecaoOrdenada):
+        it = iter(v)
+        primeiro = next(it, None)
+        if primeiro is None:
+            f.write("[]")
+            return
+        f.write("[")
+        for i, r in enumerate(itertools.chain([primeiro], it)):
+            f.write(",\n" if i else "\n")
+            f.write(pad + _INDENT)
+            _escrever(f, r, nivel + 1)
+        f.write("\n" + pad + "]")
+    elif isinstance(v, dict) and v and _tem_secao(v):
+        f.write("{")
+        for i, (k, x) in enumerate(v.items()):
+            f.write(",\n" if i else "\n")
+            f.write(pad + _INDENT + json.dumps(k, ensure_ascii=False) + ": ")
+            _escrever(f, x, nivel + 1)
+        f.write("\n" + pad + "}")
+    else:
+        txt = json.dumps(v, ensure_ascii=False, indent=2)
+        f.write(txt.replace("\n", "\n" + pad) if nivel else txt)
+
+
+def export_json_stream(payload: dict, out_path: str | Path) -> Path:
+    """Como export_json (atômico, 0644, '.gz' comprimido), com as SecaoOrdenada escritas por merge dos runs."""
+    out = Path(out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    with tempfile.NamedTemporaryFile("wb", delete=False, dir=out.parent) as tmp:
+        try:
+            with abrir_texto(tmp, comprimir=out.suffix == ".gz") as f:
+                _escrever(f, payload, 0)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+        tmp_name = tmp.name
+
+    os.chmod(tmp_name, 0o644)
+    os.replace(tmp_name, out)
+    return out
@@ -27,10 +27,15 @@ class Item(TypedDict):
 class ChildSpec(TypedDict):
     """
     Filho imediato de uma composição (pode ser Insumo ou Composição Auxiliar).
-    Para validação de ESTRUTURA só comparamos código e descrição.
+    Na validação de 1º nível só comparamos código e descrição; o coeficiente
+    (quando o adapter consegue ler) é usado na explosão profunda (core.explosao).
     """
     codigo: str
     descricao: str
+    unidade: NotRequired[str | None]
+    coeficiente: NotRequired[float | None]
+    # Preço unitário informado na linha do filho (orçamento) — consistência de preços
+    valor_unit: NotRequired[float | None]
 
 
 class CompEstrutura(TypedDict):
@@ -45,6 +50,11 @@ class CompEstrutura(TypedDict):
     filhos: List[ChildSpec]
     # Origem (ex.: "ORCAMENTO", "SUDECAP", "SINAPI")
     fonte: str
+    unidade: NotRequired[str | None]
+    # Preço unitário declarado para a composição (quando o adapter lê)
+    valor_unit: NotRequired[float | None]
+    # Banco indicado no orçamento (só para estruturas do ORÇAMENTO/SECID)
+    banco: NotRequired[str | None]
 
 
 # Dicionários de acesso rápido
@@ -0,0 +1,77 @@
+# src/cruzar_orcamento/utils/checkpoint.py
+from __future__ import annotations
+from time import perf_counter
+from typing import Callable, Optional, Tuple
+
+# ---------------------------------------------------------------------
+# Pontos de verificação cooperativos
+# ---------------------------------------------------------------------
+# Os laços longos dos loaders e consolidadores chamam checkpoint() a cada
+# linha/item. O pacote não conhece RQ nem Redis: quem executa o job (src.tasks)
+# instala um hook, que levanta exceção para interromper o trabalho num ponto
+# seguro (cancelamento pedido, prazo da etapa estourado). Sem hook, ou entre
+# duas consultas, o custo é um incremento e uma comparação.
+#
+# Os mesmos chamados contam o progresso da etapa: cada checkpoint() é uma
+# linha/item feito; laços de tamanho conhecido somam esse tamanho com total().
+# O hook lê a contagem com progresso() e a publica (src.control).
+
+CHECK_EVERY = 1024
+
+_hook: Optional[Callable[[], None]] = None
+_n = 0
+_feitos = 0
+_total: Optional[int] = None
+_t_total: Optional[float] = None  # 1º total() da etapa: início do laço, base da vazão
+
+
+def instalar(hook: Optional[Callable[[], None]]) -> None:
+    """Define (ou remove, com None) o hook consultado por checkpoint()."""
+    global _hook, _n
+    _hook = hook
+    _n = 0
+    zerar()
+
+
+def zerar() -> None:
+    """Zera a contagem de progresso (início de etapa)."""
+    global _feitos, _total, _t_total
+    _feitos = 0
+    _total = None
+    _t_total = None
+
+
+def total(n: int) -> None:
+    """Soma `n` itens ao total esperado da etapa (um laço de tamanho conhecido vai começar)."""
+    global _total, _t_total
+    if _hook is not None:
+        _total = (_total or 0) + max(0, int(n))
+        if _t_total is None:
+            _t_total = perf_counter()
+
+
+def progresso() -> Tuple[int, Optional[int], Optional[float]]:
+    """(itens feitos, total esperado ou None, instante do 1º total()) desde o último zerar()."""
+    return _feitos, _total, _t_total
+
+
+def checkpoint() -> None:
+    """Conta um item e chama o hook a cada CHECK_EVERY chamadas; o hook decide se interrompe."""
+    global _n, _feitos
+    if _hook is None:
+        return
+    _n += 1
+    _feitos += 1
+    if _n >= CHECK_EVERY:
+        _n = 0
+        _hook()
+
+
+def avancar(n: int) -> None:
+    """Conta `n` itens feitos de uma vez (p.ex. uma fatia que voltou de outro processo) e consulta o hook."""
+    global _n, _feitos
+    if _hook is None:
+        return
+    _feitos += max(0, int(n))
+    _n = 0
+    _hook()
@@ -0,0 +1,226 @@
+# src/cruzar_orcamento/utils/planilha.py
+from __future__ import annotations
+
+import math
+import re
+from pathlib import Path
+from typing import Any, Callable, Iterable, Sequence
+
+import pandas as pd
+
+# ---------------------------------------------------------------------
+# Sonda de cabeçalho
+# ---------------------------------------------------------------------
+# Os adapters acham a linha de cabeçalho olhando só as primeiras dezenas de
+# linhas da aba. Ler a aba inteira com header=None só para isso custa um
+# parse completo a mais (segundos numa planilha de 100 mil linhas); a sonda lê
+# apenas `nrows` linhas (o leitor do openpyxl para ali) e a leitura principal
+# vem depois, já com `header=` detectado, reaproveitando o mesmo ExcelFile.
+#
+# O índice achado na sonda vale direto como `header=` da leitura principal:
+# com ou sem `nrows`, o read_excel conta as linhas em branco do mesmo jeito.
+#
+# A linha de cabeçalho da sonda também diz quais colunas o adapter usa: a
+# leitura principal recebe só essas posições (`usecols`), e as demais (BDI,
+# fórmulas, colunas auxiliares) não viram colunas do DataFrame. O leitor do
+# openpyxl/xlrd ainda percorre as células da linha; o ganho está na conversão,
+# na inferência de tipos e na memória, proporcionais às colunas descartadas.
+
+HEADER_PROBE_ROWS = 50
+
+
+# ---------------------------------------------------------------------
+# Planilha aberta uma vez para vários loaders
+# ---------------------------------------------------------------------
+# Os loaders aceitam o caminho ou um `pd.ExcelFile` já aberto (`abrir`). O job
+# completo abre cada planilha uma vez e passa o mesmo ExcelFile aos loaders de
+# preço e de estrutura; com `compartilhar(xls)`, toda leitura de aba (`ler`)
+# passa por um cache no próprio ExcelFile: a mesma leitura (aba, header,
+# skiprows, dtype, nrows) é feita uma vez só, com todas as colunas, e cada
+# loader recebe as posições que pediu em `usecols` — mesmos valores e tipos da
+# leitura com usecols, porque a inferência de tipos é por coluna.
+
+
+def abrir(fonte: str | Path | pd.ExcelFile) -> pd.ExcelFile:
+    """ExcelFile do caminho (ou o próprio, se já vier aberto)."""
+    return fonte if isinstance(fonte, pd.ExcelFile) else pd.ExcelFile(fonte)
+
+
+def compartilhar(xls: pd.ExcelFile) -> pd.ExcelFile:
+    """Liga o cache de leituras no ExcelFile (vive enquanto ele viver)."""
+    if getattr(xls, "_leituras", None) is None:
+        xls._leituras = {}  # type: ignore[attr-defined]
+    return xls
+
+
+def ler(
+    xls: pd.ExcelFile,
+    sheet: str | int,
+    *,
+    header: int | None = 0,
+    skiprows: int | None = None,
+    usecols: Sequence[int] | None = None,
+    dtype: Any = None,
+    nrows: int | None = None,
+) -> pd.DataFrame:
+    """`pd.read_excel` de uma aba; no ExcelFile compartilhado, lida uma vez por parâmetros."""
+    cache = getattr(xls, "_leituras", None)
+    if cache is None:
+        df = pd.read_excel(
+            xls, sheet_name=sheet, header=header, skiprows=skiprows,
+            usecols=list(usecols) if usecols is not None else None, dtype=dtype, nrows=nrows,
+        )
+        if isinstance(df, dict):  # segurança extra caso engine retorne dict
+            df = next(iter(df.values()))
+        return df
+    chave = (sheet, header, skiprows, str(dtype), nrows)
+    df = cache.get(chave)
+    if df is None:
+        df = pd.read_excel(xls, sheet_name=sheet, header=header, skiprows=skiprows, dtype=dtype, nrows=nrows)
+        if isinstance(df, dict):
+            df = next(iter(df.values()))
+        cache[chave] = df
+    return (df if usecols is None else df.iloc[:, list(usecols)]).copy()
+
+
+def sondar(xls: pd.ExcelFile, sheet: str | int, nrows: int = HEADER_PROBE_ROWS) -> pd.DataFrame:
+    """Primeiras `nrows` linhas da aba, sem cabeçalho (header=None)."""
+    return ler(xls, sheet, header=None, nrows=nrows)
+
+
+def nomes_colunas(header: Sequence) -> list[str]:
+    """Nomes de coluna como o pandas dá ao cabeçalho ('Unnamed: N', duplicadas com '.1')."""
+    nomes: list[str] = []
+    vistos: dict[str, int] = {}
+    for i, v in enumerate(header):
+        vazio = v is None or (isinstance(v, float) and math.isnan(v))
+        nome = f"Unnamed: {i}" if vazio else str(v)
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        nomes.append(nome)
+    return nomes
+
+
+def cabecalho(topo: pd.DataFrame, header_row: int) -> tuple[list[str], pd.DataFrame] | None:
+    """
+    Nomes das colunas da aba (os mesmos da leitura com `header=header_row`) e
+    as linhas da sonda abaixo do cabeçalho, já com esses nomes, como amostra.
+    None se o cabeçalho cai fora da sonda.
+    """
+    if header_row >= len(topo):
+        return None
+    nomes = nomes_colunas(topo.iloc[header_row].tolist())
+    amostra = topo.iloc[header_row + 1:].reset_index(drop=True)
+    amostra.columns = nomes
+    return nomes, amostra
+
+
+def ler_colunas(
+    xls: pd.ExcelFile,
+    sheet: str | int,
+    header_row: int,
+    nomes: list[str],
+    cols: Iterable[str],
+) -> pd.DataFrame:
+    """
+    Leitura principal só das colunas `cols` (nomes vindos de `cabecalho`), na
+    ordem da planilha e com os mesmos nomes da leitura completa.
+    """
+    pos = sorted({nomes.index(c) for c in cols})
+    df = ler(xls, sheet, header=header_row, usecols=pos)
+    df.columns = [nomes[p] for p in pos]
+    return df
+
+
+# ---------------------------------------------------------------------
+# Coluna de tipo (Composição / Composição Auxiliar / Insumo)
+# ---------------------------------------------------------------------
+# Procurar a coluna de tipo convertendo a aba inteira com astype(str) + _norm
+# célula a célula custa segundos num orçamento largo. Aqui as colunas
+# candidatas (só texto: número/data nunca é marcador) são pontuadas em blocos
+# crescentes de linhas, normalizando cada valor distinto uma vez só; a busca
+# para quando uma coluna já tem marcadores suficientes e quase só marcadores.
+# Sem marcador nenhum nas primeiras linhas, os blocos seguem até o fim da aba
+# (o resultado é o mesmo da varredura completa). A escolha fica em cache pela
+# assinatura do cabeçalho: o mesmo modelo de planilha, no mesmo worker, só
+# confere a coluna já conhecida no primeiro bloco.
+
+TIPO_BLOCO = 200          # linhas do 1º bloco (os seguintes dobram)
+TIPO_MIN_MARCADORES = 3   # marcadores para aceitar a coluna sem ler o resto
+TIPO_CONFIANCA = 0.6      # fração mínima das células preenchidas que são marcadores
+_TIPO_RE = re.compile(r"compos|insumo")
+_TIPO_CACHE: dict[tuple[str, ...], str] = {}
+_TIPO_CACHE_MAX = 256
+
+
+def _marcadores(serie: pd.Series, norm: Callable[[Any], str], vistos: dict[str, bool]) -> tuple[int, int]:
+    """(células com marcador, células preenchidas) da série."""
+    vals = serie.dropna()
+    if vals.empty:
+        return 0, 0
+    hits = 0
+    for v, n in vals.value_counts(sort=False).items():
+        if not isinstance(v, str):
+            continue
+        ok = vistos.get(v)
+        if ok is None:
+            ok = vistos[v] = bool(_TIPO_RE.search(norm(v)))
+        if ok:
+            hits += int(n)
+    return hits, len(vals)
+
+
+def detectar_coluna_tipo(
+    df: pd.DataFrame,
+    norm: Callable[[Any], str],
+    preferida: str = "Tipo",
+) -> str | None:
+    """
+    Coluna com os marcadores de tipo, por amostragem. Entre as que têm marcador
+    vence a de maior fração de marcadores; empate → `preferida`, depois a ordem
+    da planilha. None se nenhuma coluna tem marcador.
+    """
+    if df.empty:
+        return None
+    assinatura = tuple(norm(str(c)) for c in df.columns)
+    vistos: dict[str, bool] = {}
+
+    conhecida = _TIPO_CACHE.get(assinatura)
+    if conhecida in df.columns and _marcadores(df[conhecida].iloc[:TIPO_BLOCO], norm, vistos)[0]:
+        return conhecida
+
+    candidatas = [c for c in df.columns if df[c].dtype == object]
+    if preferida in candidatas:
+        candidatas.remove(preferida)
+        candidatas.insert(0, preferida)
+    placar = {c: [0, 0] for c in candidatas}
+
+    def melhor() -> tuple[str | None, int, float]:
+        escolha, hits, frac = None, 0, 0.0
+        for c in candidatas:  # ordem de preferência decide empate
+            h, n = placar[c]
+            if h and h / n > frac:
+                escolha, hits, frac = c, h, h / n
+        return escolha, hits, frac
+
+    ini, tam = 0, TIPO_BLOCO
+    while ini < len(df):
+        fim = ini + tam
+        for c in candidatas:
+            h, n = _marcadores(df[c].iloc[ini:fim], norm, vistos)
+            placar[c][0] += h
+            placar[c][1] += n
+        escolha, hits, frac = melhor()
+        if hits >= TIPO_MIN_MARCADORES and frac >= TIPO_CONFIANCA:
+            break
+        ini, tam = fim, tam * 2
+
+    escolha = melhor()[0]
+    if escolha is not None:
+        if len(_TIPO_CACHE) >= _TIPO_CACHE_MAX:
+            _TIPO_CACHE.clear()
+        _TIPO_CACHE[assinatura] = escolha
+    return escolha
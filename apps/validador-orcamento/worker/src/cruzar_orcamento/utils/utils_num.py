@@ -0,0 +1,20 @@
+from __future__ import annotations
+from typing import Any, Optional
+
+def to_float(x: Any) -> Optional[float]:
+    """
+    Converte valores heterogêneos para float (core.aggregate, core.bank_index).
+
+    - Aceita int/float diretamente.
+    - Converte strings trocando vírgula por ponto.
+    - Retorna None em branco/None/conversão inválida.
+    """
+    if x is None or x == "":
+        return None
+    if isinstance(x, (int, float)):
+        return float(x)
+    s = str(x).strip().replace(",", ".")
+    try:
+        return float(s)
+    except ValueError:
+        return None
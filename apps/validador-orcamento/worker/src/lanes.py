@@ -0,0 +1,98 @@
+# apps/validador-orcamento/worker/src/lanes.py
+from __future__ import annotations
+
+import logging
+import os
+from typing import Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------
+# Lanes (filas RQ separadas por tipo de trabalho)
+# ---------------------------------------------------------------------
+# A API escolhe a lane de cada job pela op e pelo tamanho das entradas
+# (api: src/lanes.py — os nomes das filas são repetidos lá):
+#   - interativa: conferências rápidas de um orçamento (fila QUEUE_NAME, a de sempre);
+#   - lote: orçamentos grandes, streaming, completo/profundo;
+#   - ingestao: cargas de bancos muito grandes e manutenção (retenção).
+# Cada worker consome as lanes de RQ_LANES, em ordem estrita (a 1ª com job
+# sempre vence) ou ponderada (RQ_LANE_MODE=ponderada, pesos em RQ_LANE_WEIGHTS).
+# Capacidade reservada para a interativa = workers com RQ_LANES=interativa.
+#
+# Compatibilidade: antes das lanes, QUEUE_NAME era uma lista de filas
+# ("a,b"). O 1º nome é a base das lanes; os demais continuam consumidos como
+# filas avulsas (FILAS_EXTRAS), depois das lanes, por todo worker.
+
+_QUEUE_NAMES = list(dict.fromkeys(
+    q.strip() for q in os.getenv("QUEUE_NAME", "validador").split(",") if q.strip()
+)) or ["validador"]
+QUEUE_NAME = _QUEUE_NAMES[0]
+FILAS_EXTRAS = _QUEUE_NAMES[1:]
+LANES = ("interativa", "lote", "ingestao")
+
+
+def fila(lane: str) -> str:
+    """Nome da fila RQ da lane (a interativa mantém QUEUE_NAME, compatível com jobs antigos)."""
+    if lane not in LANES:
+        raise ValueError(f"lane desconhecida: {lane!r} (use {', '.join(LANES)})")
+    return QUEUE_NAME if lane == "interativa" else f"{QUEUE_NAME}-{lane}"
+
+
+def filas(lanes: Sequence[str] = LANES) -> List[str]:
+    return [fila(l) for l in lanes]
+
+
+def parse_lanes(raw: str) -> List[str]:
+    """'interativa,lote' → ['interativa', 'lote'] (ordem = prioridade); vazio = todas."""
+    out = [l.strip().lower() for l in (raw or "").split(",") if l.strip()]
+    for l in out:
+        fila(l)  # valida
+    return out or list(LANES)
+
+
+def parse_pesos(raw: str) -> Dict[str, float]:
+    """'interativa=6,lote=3,ingestao=1' → {'interativa': 6.0, ...}; lanes ausentes pesam 1."""
+    pesos = {l: 1.0 for l in LANES}
+    for parte in (raw or "").split(","):
+        if "=" not in parte:
+            continue
+        k, v = parte.split("=", 1)
+        k = k.strip().lower()
+        try:
+            if k not in LANES:
+                raise ValueError(k)
+            pesos[k] = max(0.0, float(v))
+        except ValueError:
+            logger.warning("[lanes] peso inválido em RQ_LANE_WEIGHTS: %r", parte)
+    return pesos
+
+
+class Ponderador:
+    """
+    Ordem de consulta das filas por smooth weighted round-robin: a cada job
+    consumido, toda lane ganha o seu peso em crédito e a que serviu o job
+    perde a soma dos pesos; a ordem seguinte é crédito decrescente (empate:
+    prioridade). Com todas as lanes cheias, cada uma recebe jobs na proporção
+    do peso. O crédito fica em ±soma dos pesos: lane vazia por muito tempo
+    não monopoliza o worker quando voltar a ter jobs, nem a que serviu sozinha
+    fica para trás indefinidamente.
+    """
+
+    def __init__(self, lanes: Sequence[str], pesos: Dict[str, float]) -> None:
+        self.lanes = list(lanes)
+        self.pesos = {l: pesos.get(l, 1.0) for l in self.lanes}
+        self.soma = sum(self.pesos.values()) or 1.0
+        self.credito = {l: 0.0 for l in self.lanes}
+
+    def servida(self, lane: str) -> None:
+        for l in self.lanes:
+            self.credito[l] = min(self.soma, self.credito[l] + self.pesos[l])
+        if lane in self.credito:
+            self.credito[lane] = max(-self.soma, self.credito[lane] - self.soma)
+
+    def ordem(self) -> List[str]:
+        prio = {l: i for i, l in enumerate(self.lanes)}
+        return sorted(
+            (l for l in self.lanes if self.pesos[l] > 0),
+            key=lambda l: (-(self.credito[l] + self.pesos[l]), prio[l]),
+        ) + [l for l in self.lanes if self.pesos[l] <= 0]
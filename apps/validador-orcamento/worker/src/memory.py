@@ -0,0 +1,173 @@
+# apps/validador-orcamento/worker/src/memory.py
+from __future__ import annotations
+
+import glob
+import logging
+import os
+import resource
+import signal
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Orçamento de memória por job (RSS do work-horse + memória privada dos filhos dele). 0 = sem limite.
+JOB_MEM_BUDGET_MB = int(os.getenv("JOB_MEM_BUDGET_MB", "0") or 0)
+# Intervalo de amostragem do RSS (segundos)
+MEM_SAMPLE_INTERVAL_S = float(os.getenv("MEM_SAMPLE_INTERVAL_S", "0.25") or 0.25)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_MB = 1024 * 1024
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """O job ultrapassou o orçamento de memória configurado."""
+
+
+def rss_bytes() -> int:
+    """RSS atual do processo (Linux: /proc/self/statm; fallback: pico via getrusage)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Linux: KiB
+
+
+def _filhos_vivos() -> List[int]:
+    pids: List[int] = []
+    for arq in glob.glob(f"/proc/{os.getpid()}/task/*/children"):
+        try:
+            with open(arq, "rb") as f:
+                pids.extend(int(x) for x in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return pids
+
+
+def _privado_bytes(pid: int) -> int:
+    """Memória privada do processo (smaps_rollup); fallback: RSS (statm)."""
+    try:
+        total = 0
+        with open(f"/proc/{pid}/smaps_rollup", "rb") as f:
+            for linha in f:
+                if linha.startswith((b"Private_Clean:", b"Private_Dirty:")):
+                    total += int(linha.split()[1]) * 1024  # kB
+        return total
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0  # filho já encerrado
+
+
+def filhos_bytes() -> int:
+    """
+    Memória dos processos filhos vivos (p.ex. o pool da consolidação em fatias,
+    core.paralelo), que o RSS do próprio processo não enxerga. Conta só a parte
+    privada de cada filho: as páginas herdadas pelo fork e não escritas já estão
+    no RSS do pai.
+    """
+    return sum(_privado_bytes(pid) for pid in _filhos_vivos())
+
+
+def filhos_maxrss_bytes() -> int:
+    """Maior pico de RSS entre os filhos já encerrados e aguardados (work-horses do RQ e seus pools)."""
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024  # Linux: KiB
+
+
+def _uso_bytes() -> int:
+    return rss_bytes() + filhos_bytes()
+
+
+def to_mb(n: int) -> float:
+    return round(n / _MB, 1)
+
+
+class MemoryWatch:
+    """
+    Amostra o RSS numa thread daemon (sem tracemalloc, que deixaria os loaders
+    bem mais lentos) e guarda o pico desde o último `reset_peak()`. O uso
+    amostrado soma a memória privada dos filhos vivos (`filhos_bytes`): os
+    processos da consolidação em fatias entram no pico e no orçamento.
+
+    Com orçamento (`budget_mb > 0`), ao detectar RSS acima do limite a thread
+    envia SIGUSR1 ao próprio processo; o handler (instalado na thread principal,
+    onde o RQ executa o job) levanta `MemoryBudgetExceeded` — mesmo mecanismo
+    que o RQ usa para o `job_timeout` via SIGALRM. Assim o job falha com erro
+    claro antes de o kernel matar o container por OOM.
+    """
+
+    def __init__(self, budget_mb: Optional[int] = None, interval_s: float = MEM_SAMPLE_INTERVAL_S) -> None:
+        budget_mb = JOB_MEM_BUDGET_MB if budget_mb is None else int(budget_mb or 0)
+        self.budget_bytes = max(0, budget_mb) * _MB
+        self.interval_s = max(0.01, float(interval_s))
+        self.stage: Optional[str] = None
+        self._peak = _uso_bytes()
+        self._job_peak = self._peak
+        self._exceeded: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._prev_handler = None
+        self._handler_installed = False
+
+    # ---- ciclo de vida
+    def start(self) -> "MemoryWatch":
+        if self.budget_bytes and threading.current_thread() is threading.main_thread():
+            self._prev_handler = signal.signal(signal.SIGUSR1, self._on_signal)
+            self._handler_installed = True
+        self._thread = threading.Thread(target=self._run, name="mem-watch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self._handler_installed:
+            signal.signal(signal.SIGUSR1, self._prev_handler or signal.SIG_DFL)
+            self._handler_installed = False
+
+    # ---- consulta
+    def reset_peak(self, stage: Optional[str] = None) -> None:
+        self.stage = stage
+        self._peak = _uso_bytes()
+
+    def peak_bytes(self) -> int:
+        self._sample()
+        return self._peak
+
+    def job_peak_bytes(self) -> int:
+        self._sample()
+        return self._job_peak
+
+    def check(self) -> None:
+        """Levanta `MemoryBudgetExceeded` se o orçamento já foi estourado."""
+        if self._exceeded:
+            raise MemoryBudgetExceeded(self._exceeded)
+
+    # ---- internos
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    def _sample(self) -> None:
+        cur = _uso_bytes()
+        if cur > self._peak:
+            self._peak = cur
+        if cur > self._job_peak:
+            self._job_peak = cur
+        if self.budget_bytes and cur > self.budget_bytes and not self._exceeded:
+            etapa = f" na etapa '{self.stage}'" if self.stage else ""
+            self._exceeded = (
+                f"Job excedeu o orçamento de memória{etapa}: "
+                f"RSS {to_mb(cur)} MB (com processos filhos) > limite {to_mb(self.budget_bytes)} MB."
+            )
+            logger.error("[mem] %s", self._exceeded)
+            if self._handler_installed:
+                os.kill(os.getpid(), signal.SIGUSR1)
+
+    def _on_signal(self, signum, frame) -> None:
+        raise MemoryBudgetExceeded(self._exceeded or "Job excedeu o orçamento de memória.")
@@ -0,0 +1,126 @@
+# apps/validador-orcamento/worker/src/metrics.py
+from __future__ import annotations
+
+import json
+import logging
+from bisect import bisect_left
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from rq import get_current_job
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------
+# Métricas operacionais gravadas no Redis
+# ---------------------------------------------------------------------
+# Cada work-horse (processo filho do RQ) grava direto no Redis com HINCRBY*,
+# então os valores já saem agregados entre forks/containers. A API lê as
+# mesmas chaves em `/metrics` (ver api/src/metrics.py) e renderiza no
+# formato texto do Prometheus.
+#
+#   metrics:counter:<nome>  → hash { <labels_json>: valor }
+#   metrics:hist:<nome>     → hash { <labels_json>|<le>: n, <labels_json>|sum: s, <labels_json>|count: c }
+#
+# O bucket gravado é o primeiro `le` >= valor (não cumulativo); a API acumula
+# na renderização.
+
+KEY_PREFIX = "metrics"
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+ROWS_PER_S_BUCKETS = (100, 500, 1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000)
+BYTES_BUCKETS = (
+    10_000, 100_000, 1_000_000, 5_000_000, 10_000_000,
+    50_000_000, 100_000_000, 500_000_000, 1_000_000_000,
+)
+
+
+# Formato das chaves/campos: idêntico em api/src/metrics.py e worker/src/metrics.py
+# (as duas imagens não compartilham código; worker/scripts/test_metrics_chaves.py
+# confere que os dois lados gravam os mesmos campos e que /metrics os lê).
+def _labels_key(labels: Dict[str, Any]) -> str:
+    return json.dumps({k: str(v) for k, v in sorted(labels.items())}, separators=(",", ":"))
+
+
+def _le(buckets: Sequence[float], value: float) -> str:
+    """Primeiro `le` >= valor (bucket não cumulativo)."""
+    i = bisect_left(buckets, value)
+    return str(buckets[i]) if i < len(buckets) else "+Inf"
+
+
+def _chave_contador(name: str) -> str:
+    return f"{KEY_PREFIX}:counter:{name}"
+
+
+def _campos_hist(name: str, value: float, buckets: Sequence[float], labels: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    """(chave, campo do bucket, campo da soma, campo da contagem) de uma observação."""
+    lk = _labels_key(labels)
+    return f"{KEY_PREFIX}:hist:{name}", f"{lk}|{_le(buckets, value)}", f"{lk}|sum", f"{lk}|count"
+
+
+def _conn():
+    job = get_current_job()
+    return job.connection if job else None
+
+
+def inc(name: str, value: float = 1.0, **labels: Any) -> None:
+    conn = _conn()
+    if conn is None:
+        return
+    try:
+        conn.hincrbyfloat(_chave_contador(name), _labels_key(labels), float(value))
+    except Exception as e:  # métricas nunca derrubam o job
+        logger.debug("[metrics] falha ao incrementar %s: %s", name, e)
+
+
+def observe(name: str, value: float, buckets: Sequence[float], **labels: Any) -> None:
+    conn = _conn()
+    if conn is None:
+        return
+    key, bucket, soma, contagem = _campos_hist(name, value, buckets, labels)
+    try:
+        pipe = conn.pipeline(transaction=False)
+        pipe.hincrby(key, bucket, 1)
+        pipe.hincrbyfloat(key, soma, float(value))
+        pipe.hincrby(key, contagem, 1)
+        pipe.execute()
+    except Exception as e:
+        logger.debug("[metrics] falha ao observar %s: %s", name, e)
+
+
+# ---------------------------------------------------------------------
+# Atalhos usados por src.tasks
+# ---------------------------------------------------------------------
+def record_job_start(op: str) -> None:
+    """Tempo de espera na fila (enqueued_at → started_at) do job corrente."""
+    job = get_current_job()
+    if not job or not job.enqueued_at or not job.started_at:
+        return
+    wait_s = max(0.0, (job.started_at - job.enqueued_at).total_seconds())
+    observe("validador_job_wait_seconds", wait_s, DURATION_BUCKETS, op=op)
+
+
+def record_job_end(
+    op: str,
+    status: str,
+    duration_s: float,
+    stages: Dict[str, Dict[str, Any]],
+    artifact_bytes: Optional[int] = None,
+) -> None:
+    """
+    Duração total e por etapa, vazão dos adapters (linhas/s nas etapas `carga_*`)
+    e tamanho do artefato.
+    """
+    inc("validador_jobs_total", op=op, status=status)
+    observe("validador_job_duration_seconds", duration_s, DURATION_BUCKETS, op=op, stage="total")
+    for stage, info in stages.items():
+        dur = float(info.get("duration_s") or 0.0)
+        observe("validador_job_duration_seconds", dur, DURATION_BUCKETS, op=op, stage=stage)
+        rows = info.get("rows")
+        if stage.startswith("carga_") and rows is not None:
+            adapter = f"{op}:{stage[len('carga_'):]}"
+            inc("validador_adapter_rows_total", rows, adapter=adapter)
+            inc("validador_adapter_seconds_total", dur, adapter=adapter)
+            if dur > 0:
+                observe("validador_adapter_rows_per_second", rows / dur, ROWS_PER_S_BUCKETS, adapter=adapter)
+    if artifact_bytes is not None:
+        observe("validador_artifact_bytes", artifact_bytes, BYTES_BUCKETS, kind=op)
@@ -0,0 +1,405 @@
+# src/retention.py
+"""
+Retenção de artefatos (OUTPUT_DIR) e de uploads (DATA_DIR).
+
+Roda como job do próprio RQ (`src.tasks.run_retencao`), agendado pelo scheduler
+do worker (`with_scheduler=True`) a cada RETENTION_INTERVAL_S. Cada execução:
+
+  1. remove artefatos além das políticas — últimos N por tipo, idade máxima e
+     teto de bytes (mais antigos primeiro); o artefato conta como grupo: JSON,
+     tabelas colunares e profile do mesmo '<tipo>_<jobid>_<ts>' saem juntos;
+  2. compacta '.json' antigos em '.json.gz' (ARTIFACT_GZIP=0 / artefatos legados);
+  3. remove uploads registrados pela API (zset UPLOADS_KEY) mais velhos que
+     RETENTION_UPLOAD_MAX_AGE_DAYS — bancos de referência copiados direto para
+     data/ nunca são tocados;
+  4. limpa temporários órfãos (runs do modo streaming, exportações interrompidas).
+
+Nada referenciado por um job vivo no Redis (na fila, em execução, agendado,
+adiado, finalizado ainda dentro do result_ttl ou falho dentro do failure_ttl,
+para poder ser reenfileirado) é removido ou renomeado.
+Devolve um relatório com o que foi recuperado.
+"""
+from __future__ import annotations
+import os, re, gzip, json, shutil, logging, tempfile
+from pathlib import Path
+from datetime import datetime, timezone, timedelta
+from time import perf_counter, time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from redis import Redis
+from rq import Queue
+from rq.job import Job
+
+from src import lanes
+from src.cruzar_orcamento.exporters.json_compacto import GZIP_NIVEL
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = Path("/app").resolve()
+OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR") or (APP_ROOT / "output"))
+DATA_DIR = Path(os.getenv("DATA_DIR") or (APP_ROOT / "data"))
+
+# ---------------------------------------------------------------------
+# Políticas (0 = desligada)
+# ---------------------------------------------------------------------
+RETENTION_INTERVAL_S = int(os.getenv("RETENTION_INTERVAL_S", "3600") or 0)     # 0 = não agenda
+RETENTION_KEEP_LAST = int(os.getenv("RETENTION_KEEP_LAST", "50") or 0)         # por tipo
+RETENTION_MAX_AGE_DAYS = float(os.getenv("RETENTION_MAX_AGE_DAYS", "30") or 0)
+RETENTION_MAX_MB = int(os.getenv("RETENTION_MAX_MB", "0") or 0)                # total de artefatos
+RETENTION_COMPACT_AFTER_H = float(os.getenv("RETENTION_COMPACT_AFTER_H", "24") or 0)
+RETENTION_UPLOAD_MAX_AGE_DAYS = float(os.getenv("RETENTION_UPLOAD_MAX_AGE_DAYS", "7") or 0)
+RETENTION_TMP_MAX_AGE_H = float(os.getenv("RETENTION_TMP_MAX_AGE_H", "6") or 0)
+RETENTION_DRY_RUN = os.getenv("RETENTION_DRY_RUN", "0").lower() in ("1", "true", "yes")
+
+# uploads gravados pela API: membro = caminho relativo a /app ("data/x.xlsx"), score = epoch do upload
+UPLOADS_KEY = "uploads:registro"
+# último relatório (GET /retencao na API)
+REPORT_KEY = "retencao:ultimo"
+
+# <tipo>_<jobid[:8]>_<YYYYMMDDHHMMSS>.<resto>  (ver tasks._artifact_path)
+_ARTEFATO = re.compile(r"^(?P<tipo>[a-z]+)_(?P<jid>[^_.]+)_(?P<ts>\d{14})\.(?P<resto>.+)$")
+
+
+def _mb(n: int) -> float:
+    return round(n / (1024 * 1024), 2)
+
+
+# ---------------------------------------------------------------------
+# Jobs vivos → caminhos e ids protegidos
+# ---------------------------------------------------------------------
+def _ids_vivos(conn: Redis) -> Set[str]:
+    ids: Set[str] = set()
+    for name in lanes.filas():
+        q = Queue(name, connection=conn)
+        ids.update(q.get_job_ids())
+        for reg in (q.started_job_registry, q.deferred_job_registry,
+                    q.scheduled_job_registry, q.finished_job_registry,
+                    q.failed_job_registry):  # falho: entradas para o requeue
+            ids.update(reg.get_job_ids())
+    return ids
+
+
+def _caminho(v: Any) -> Optional[Path]:
+    if not isinstance(v, str) or not v or "\n" in v:
+        return None
+    p = Path(v)
+    p = p if p.is_absolute() else (APP_ROOT / p)
+    return p.resolve()
+
+
+def protegidos(conn: Redis) -> Tuple[Set[Path], Set[str]]:
+    """
+    (caminhos, prefixos de job) referenciados por jobs vivos: artefato, tabelas
+    colunares e profile do meta, e os arquivos de entrada (kwargs). O prefixo
+    (jobid[:8], como no nome do artefato) cobre o job ainda em execução, que
+    grava antes de publicar o meta.
+    """
+    caminhos: Set[Path] = set()
+    jids: Set[str] = set()
+    ids = sorted(_ids_vivos(conn))
+    for job in Job.fetch_many(ids, connection=conn):
+        if job is None:
+            continue
+        jids.add(job.id[:8])
+        meta = job.meta or {}
+        refs: List[Any] = [meta.get("artifact"), meta.get("profile"), *(meta.get("colunar") or {}).values()]
+        try:
+            refs.extend((job.kwargs or {}).values())
+        except Exception:  # payload que não desserializa: só o meta conta
+            pass
+        for v in refs:
+            p = _caminho(v)
+            if p is not None:
+                caminhos.add(p)
+    return caminhos, jids
+
+
+# ---------------------------------------------------------------------
+# Artefatos
+# ---------------------------------------------------------------------
+def _grupos(out_dir: Path) -> Dict[str, Dict[str, Any]]:
+    """{'<tipo>_<jid>_<ts>': {tipo, jid, quando, arquivos, bytes}} dos arquivos de primeiro nível."""
+    grupos: Dict[str, Dict[str, Any]] = {}
+    for p in out_dir.iterdir():
+        m = _ARTEFATO.match(p.name)
+        try:
+            if not m or not p.is_file():
+                continue
+            tamanho = p.stat().st_size
+        except FileNotFoundError:  # removido no meio da varredura
+            continue
+        stem = p.name[: -len(m["resto"]) - 1]
+        g = grupos.setdefault(stem, {
+            "tipo": m["tipo"],
+            "jid": m["jid"],
+            "quando": datetime.strptime(m["ts"], "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc),
+            "arquivos": [],
+            "bytes": 0,
+        })
+        g["arquivos"].append(p)
+        g["bytes"] += tamanho
+    return grupos
+
+
+def _selecionar(
+    grupos: Dict[str, Dict[str, Any]],
+    caminhos: Set[Path],
+    jids: Set[str],
+    *,
+    keep_last: int,
+    max_age_days: float,
+    max_mb: int,
+    agora: datetime,
+) -> Tuple[Dict[str, str], int]:
+    """{stem: motivo} a remover e quantos grupos ficaram protegidos."""
+    def _protegido(g: Dict[str, Any]) -> bool:
+        return g["jid"] in jids or any(p.resolve() in caminhos for p in g["arquivos"])
+
+    remover: Dict[str, str] = {}
+    prot = {s for s, g in grupos.items() if _protegido(g)}
+    recentes = sorted(grupos, key=lambda s: grupos[s]["quando"], reverse=True)
+
+    if keep_last > 0:
+        vistos: Dict[str, int] = {}
+        for s in recentes:
+            tipo = grupos[s]["tipo"]
+            vistos[tipo] = vistos.get(tipo, 0) + 1
+            if vistos[tipo] > keep_last and s not in prot:
+                remover[s] = "keep_last"
+    if max_age_days > 0:
+        limite = agora - timedelta(days=max_age_days)
+        for s in recentes:
+            if grupos[s]["quando"] < limite and s not in prot:
+                remover.setdefault(s, "max_age")
+    if max_mb > 0:
+        total = sum(g["bytes"] for s, g in grupos.items() if s not in remover)
+        for s in reversed(recentes):  # mais antigos primeiro
+            if total <= max_mb * 1024 * 1024:
+                break
+            if s in remover or s in prot:
+                continue
+            remover[s] = "max_bytes"
+            total -= grupos[s]["bytes"]
+    return remover, len(prot)
+
+
+def _remover(p: Path, dry_run: bool) -> int:
+    try:
+        n = p.stat().st_size
+        if not dry_run:
+            p.unlink()
+        return n
+    except FileNotFoundError:
+        return 0
+
+
+def _compactar(p: Path) -> int:
+    """'<x>.json' → '<x>.json.gz' (atômico, mesmo mtime); devolve os bytes economizados."""
+    destino = p.with_name(p.name + ".gz")
+    antes = p.stat()
+    with tempfile.NamedTemporaryFile("wb", delete=False, dir=p.parent) as tmp:
+        try:
+            with p.open("rb") as src, gzip.GzipFile(
+                filename="", mode="wb", fileobj=tmp, compresslevel=GZIP_NIVEL, mtime=0,
+            ) as gz:
+                shutil.copyfileobj(src, gz, 1024 * 1024)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+        tmp_name = tmp.name
+    os.chmod(tmp_name, 0o644)
+    os.utime(tmp_name, (antes.st_atime, antes.st_mtime))
+    os.replace(tmp_name, destino)
+    p.unlink()
+    return antes.st_size - destino.stat().st_size
+
+
+# ---------------------------------------------------------------------
+# Uploads e temporários
+# ---------------------------------------------------------------------
+def _uploads(conn: Redis, caminhos: Set[Path], max_age_days: float, dry_run: bool, agora: float) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"removidos": [], "bytes": 0, "protegidos": 0}
+    if max_age_days <= 0:
+        return out
+    vencidos = conn.zrangebyscore(UPLOADS_KEY, "-inf", agora - max_age_days * 86400)
+    data = DATA_DIR.resolve()
+    for m in vencidos:
+        rel = m.decode() if isinstance(m, bytes) else str(m)
+        p = (APP_ROOT / rel).resolve()
+        try:
+            p.relative_to(data)
+        except ValueError:
+            logger.warning("[retencao] upload fora do DATA_DIR ignorado: %s", rel)
+            continue
+        if p in caminhos:
+            out["protegidos"] += 1
+            continue
+        n = _remover(p, dry_run) if p.is_file() else 0
+        if n:
+            out["removidos"].append(rel)
+            out["bytes"] += n
+        if not dry_run:
+            conn.zrem(UPLOADS_KEY, m)
+    return out
+
+
+def _temporarios(out_dir: Path, max_age_h: float, dry_run: bool, agora: float) -> Dict[str, Any]:
+    """Runs '.runs-*' do modo streaming e 'tmp*' / '*.tmp' de exportações interrompidas."""
+    out: Dict[str, Any] = {"removidos": 0, "bytes": 0}
+    if max_age_h <= 0:
+        return out
+    limite = agora - max_age_h * 3600
+    for p in out_dir.iterdir():
+        try:
+            if p.stat().st_mtime >= limite:
+                continue
+            if p.is_dir() and p.name.startswith(".runs-"):
+                n = sum(f.stat().st_size for f in p.rglob("*") if f.is_file())
+                if not dry_run:
+                    shutil.rmtree(p, ignore_errors=True)
+            elif p.is_file() and (p.name.startswith("tmp") or p.name.endswith(".tmp")):
+                n = _remover(p, dry_run)
+            else:
+                continue
+        except FileNotFoundError:
+            continue
+        out["removidos"] += 1
+        out["bytes"] += n
+    return out
+
+
+# ---------------------------------------------------------------------
+# Execução
+# ---------------------------------------------------------------------
+def executar(
+    conn: Redis,
+    out_dir: Optional[Path] = None,
+    *,
+    keep_last: int = RETENTION_KEEP_LAST,
+    max_age_days: float = RETENTION_MAX_AGE_DAYS,
+    max_mb: int = RETENTION_MAX_MB,
+    compact_after_h: float = RETENTION_COMPACT_AFTER_H,
+    upload_max_age_days: float = RETENTION_UPLOAD_MAX_AGE_DAYS,
+    tmp_max_age_h: float = RETENTION_TMP_MAX_AGE_H,
+    dry_run: bool = RETENTION_DRY_RUN,
+) -> Dict[str, Any]:
+    """Uma passada de retenção; devolve o relatório (também gravado em REPORT_KEY)."""
+    t0 = perf_counter()
+    out_dir = Path(out_dir or OUTPUT_DIR)
+    agora = datetime.now(timezone.utc)
+    erros: List[str] = []
+
+    caminhos, jids = protegidos(conn)
+
+    art: Dict[str, Any] = {"removidos": [], "bytes": 0, "arquivos": 0}
+    comp: Dict[str, Any] = {"arquivos": 0, "bytes": 0}
+    tmp: Dict[str, Any] = {"removidos": 0, "bytes": 0}
+    if out_dir.is_dir():
+        grupos = _grupos(out_dir)
+        remover, n_prot = _selecionar(
+            grupos, caminhos, jids,
+            keep_last=keep_last, max_age_days=max_age_days, max_mb=max_mb, agora=agora,
+        )
+        for stem, motivo in sorted(remover.items()):
+            n = 0
+            for p in grupos[stem]["arquivos"]:
+                try:
+                    n += _remover(p, dry_run)
+                except OSError as e:
+                    erros.append(f"{p.name}: {e}")
+            art["removidos"].append({"nome": stem, "motivo": motivo, "bytes": n})
+            art["arquivos"] += len(grupos[stem]["arquivos"])
+            art["bytes"] += n
+        art["mantidos"] = len(grupos) - len(remover)
+        art["protegidos"] = n_prot
+
+        if compact_after_h > 0:
+            limite = agora - timedelta(hours=compact_after_h)
+            for stem, g in grupos.items():
+                if stem in remover or g["jid"] in jids or g["quando"] >= limite:
+                    continue
+                for p in g["arquivos"]:
+                    if not p.name.endswith(".json") or p.resolve() in caminhos:
+                        continue
+                    if p.with_name(p.name + ".gz").exists():
+                        continue
+                    try:
+                        comp["bytes"] += 0 if dry_run else _compactar(p)
+                        comp["arquivos"] += 1
+                    except OSError as e:
+                        erros.append(f"{p.name}: {e}")
+
+        tmp = _temporarios(out_dir, tmp_max_age_h, dry_run, agora.timestamp())
+
+    try:
+        upl = _uploads(conn, caminhos, upload_max_age_days, dry_run, agora.timestamp())
+    except OSError as e:
+        upl = {"removidos": [], "bytes": 0, "protegidos": 0}
+        erros.append(f"uploads: {e}")
+
+    recuperado = art["bytes"] + comp["bytes"] + upl["bytes"] + tmp["bytes"]
+    relatorio = {
+        "executado_em": agora.isoformat(),
+        "duracao_s": round(perf_counter() - t0, 3),
+        "dry_run": dry_run,
+        "politica": {
+            "keep_last": keep_last,
+            "max_age_days": max_age_days,
+            "max_mb": max_mb,
+            "compact_after_h": compact_after_h,
+            "upload_max_age_days": upload_max_age_days,
+            "tmp_max_age_h": tmp_max_age_h,
+        },
+        "jobs_vivos": len(jids),
+        "artefatos": art,
+        "compactados": comp,
+        "uploads": upl,
+        "temporarios": tmp,
+        "bytes_recuperados": recuperado,
+        "mb_recuperados": _mb(recuperado),
+        "erros": erros,
+    }
+    try:
+        conn.set(REPORT_KEY, json.dumps(relatorio, ensure_ascii=False))
+    except Exception as e:
+        logger.debug("[retencao] falha ao gravar relatório: %s", e)
+    logger.info(
+        "[retencao] %s MB recuperados (%d artefatos, %d compactados, %d uploads, %d temporários)%s",
+        _mb(recuperado), len(art["removidos"]), comp["arquivos"], len(upl["removidos"]),
+        tmp["removidos"], " [dry-run]" if dry_run else "",
+    )
+    return relatorio
+
+
+# ---------------------------------------------------------------------
+# Agendamento (scheduler do RQ)
+# ---------------------------------------------------------------------
+def proximo_slot(agora: Optional[float] = None, intervalo: int = RETENTION_INTERVAL_S) -> int:
+    """Início do próximo intervalo (epoch, múltiplo de `intervalo`)."""
+    agora = time() if agora is None else agora
+    return (int(agora) // intervalo + 1) * intervalo
+
+
+def agendar(queue: Queue, intervalo: int = RETENTION_INTERVAL_S) -> Optional[Job]:
+    """
+    Agenda a próxima execução de `src.tasks.run_retencao`. O id do job é o do
+    slot ('retencao-<epoch>'): vários workers (ou reinícios) agendando o mesmo
+    slot não duplicam a execução.
+    """
+    if intervalo <= 0:
+        return None
+    slot = proximo_slot(intervalo=intervalo)
+    job_id = f"retencao-{slot}"
+    if Job.exists(job_id, connection=queue.connection):
+        return None
+    return queue.enqueue_at(
+        datetime.fromtimestamp(slot, tz=timezone.utc),
+        "src.tasks.run_retencao",
+        job_id=job_id,
+        job_timeout=30 * 60,
+        result_ttl=7 * 24 * 3600,
+        failure_ttl=7 * 24 * 3600,
+    )
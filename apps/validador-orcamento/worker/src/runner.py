@@ -1,15 +1,22 @@
 # src/runner.py
 from __future__ import annotations
 import os, time, sys, math, logging
-from typing import List
+from typing import Dict, List, Optional
 from redis import Redis
 from rq import Worker, Queue
 
+from src.memory import filhos_maxrss_bytes, rss_bytes, to_mb
+from src import lanes, retention
+
 REDIS_URL  = os.getenv("REDIS_URL",  "redis://redis:6379/1")
-QUEUE_ENV  = os.getenv("QUEUE_NAME", "validador")
+# lanes consumidas por este worker, em ordem de prioridade (ver src/lanes.py)
+RQ_LANES   = lanes.parse_lanes(os.getenv("RQ_LANES", ""))
+RQ_LANE_MODE = os.getenv("RQ_LANE_MODE", "estrita").strip().lower()  # estrita | ponderada
+RQ_LANE_WEIGHTS = lanes.parse_pesos(os.getenv("RQ_LANE_WEIGHTS", "interativa=6,lote=3,ingestao=1"))
 RQ_BURST   = os.getenv("RQ_BURST", "0").lower() in ("1", "true", "yes")
 LOG_LEVEL  = os.getenv("LOG_LEVEL", "INFO").upper()
 RQ_MAX_JOBS = int(os.getenv("RQ_MAX_JOBS", "0") or 0)  # 0 = ilimitado
+RQ_RECYCLE_RSS_MB = int(os.getenv("RQ_RECYCLE_RSS_MB", "0") or 0)  # 0 = nunca recicla por memória
 
 logging.basicConfig(level=getattr(logging, LOG_LEVEL, logging.INFO))
 
@@ -40,12 +47,106 @@ def wait_for_redis(timeout: int = 60) -> Redis:
     logging.error("[runner] Falha ao conectar no Redis após %ss: %s", timeout, last_err)
     sys.exit(1)
 
+class RecyclingWorker(Worker):
+    """
+    Worker que encerra (warm shutdown) depois do job corrente quando o job passou
+    de RQ_RECYCLE_RSS_MB. O job roda num work-horse (fork), então o que conta é o
+    pico dele: `mem_peak_mb` gravado pelo job no meta ou, sem ele, o aumento do
+    `ru_maxrss` dos filhos (RUSAGE_CHILDREN) neste job; o RSS do próprio worker
+    também entra. O container volta pelo `restart:` do compose, com memória
+    limpa, antes de virar candidato do OOM killer.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._filhos_maxrss = filhos_maxrss_bytes()
+
+    def _pico_job_mb(self, job) -> float:
+        maxrss = filhos_maxrss_bytes()
+        pico = to_mb(maxrss) if maxrss > self._filhos_maxrss else 0.0  # ru_maxrss só sobe: novo pico = deste job
+        self._filhos_maxrss = max(self._filhos_maxrss, maxrss)
+        try:
+            pico = max(pico, float(job.get_meta(refresh=True).get("mem_peak_mb") or 0))
+        except Exception:
+            pass  # job apagado/Redis indisponível: fica o rusage
+        return pico
+
+    def execute_job(self, job, queue):
+        super().execute_job(job, queue)
+        if RQ_RECYCLE_RSS_MB <= 0:
+            return
+        pico = self._pico_job_mb(job)
+        rss = to_mb(rss_bytes())
+        if max(pico, rss) > RQ_RECYCLE_RSS_MB:
+            logging.warning(
+                "[runner] Memória do job %s em %.1f MB (worker %.1f MB; > %d MB); reciclando.",
+                job.id, pico, rss, RQ_RECYCLE_RSS_MB,
+            )
+            self._stop_requested = True
+
+class LaneWorker(RecyclingWorker):
+    """
+    Consome as filas das lanes em ordem estrita (a ordem de RQ_LANES: o RQ
+    faz o BLPOP nas filas nessa ordem) ou ponderada: depois de cada job, a
+    ordem do próximo BLPOP vem do `lanes.Ponderador` (proporção dos pesos
+    quando várias lanes têm jobs; lane vazia é pulada sem custo).
+    """
+
+    def __init__(self, queues, *args, ponderador: Optional[lanes.Ponderador] = None, **kwargs):
+        super().__init__(queues, *args, **kwargs)
+        self._ponderador = ponderador
+        self._por_lane: Dict[str, Queue] = {lanes.fila(l): q for l, q in zip(RQ_LANES, self.queues)}
+        self._extras: List[Queue] = list(self.queues[len(RQ_LANES):])  # QUEUE_NAME antigo: sempre por último
+        self._lane_de: Dict[str, str] = {lanes.fila(l): l for l in RQ_LANES}
+        if ponderador is not None:
+            self._ordenar()
+
+    def _ordenar(self) -> None:
+        self._ordered_queues = [self._por_lane[lanes.fila(l)] for l in self._ponderador.ordem()] + self._extras
+
+    def reorder_queues(self, reference_queue):
+        if self._ponderador is None:
+            return super().reorder_queues(reference_queue)
+        self._ponderador.servida(self._lane_de.get(reference_queue.name, ""))
+        self._ordenar()
+
+def _lane_consumida(conn: Redis, lane: str) -> bool:
+    """Algum worker registrado no Redis consome a fila da lane?"""
+    fila = lanes.fila(lane)
+    return any(fila in w.queue_names() for w in Worker.all(connection=conn))
+
 def main():
     conn = wait_for_redis(timeout=60)
-    queue_names: List[str] = [q.strip() for q in QUEUE_ENV.split(",") if q.strip()]
+    queue_names: List[str] = lanes.filas(RQ_LANES)
+    extras = [q for q in lanes.FILAS_EXTRAS if q not in queue_names]
+    if extras:
+        logging.warning(
+            "[runner] QUEUE_NAME com várias filas (formato antigo): %r é a base das lanes; "
+            "%s seguem consumidas depois delas.", lanes.QUEUE_NAME, extras,
+        )
+        queue_names += extras
     queues = [Queue(name, connection=conn) for name in queue_names]
-    logging.info("[runner] Worker iniciado. Filas=%s burst=%s", queue_names, RQ_BURST)
-    w = Worker(queues, connection=conn)
+    ponderador = None
+    if RQ_LANE_MODE == "ponderada" and len(RQ_LANES) > 1:
+        ponderador = lanes.Ponderador(RQ_LANES, RQ_LANE_WEIGHTS)
+    elif RQ_LANE_MODE not in ("estrita", "ponderada"):
+        logging.warning("[runner] RQ_LANE_MODE=%r desconhecido; usando 'estrita'.", RQ_LANE_MODE)
+    logging.info(
+        "[runner] Worker iniciado. Lanes=%s filas=%s modo=%s burst=%s",
+        RQ_LANES, queue_names, "ponderada" if ponderador else "estrita", RQ_BURST,
+    )
+    # 1ª passada da retenção, na lane de ingestão; as seguintes se reagendam
+    # (id por slot: sem duplicar entre workers)
+    if not RQ_BURST and retention.RETENTION_INTERVAL_S > 0:
+        if "ingestao" in RQ_LANES:
+            if retention.agendar(queues[RQ_LANES.index("ingestao")]) is not None:
+                logging.info("[runner] Retenção agendada a cada %ss.", retention.RETENTION_INTERVAL_S)
+        elif not _lane_consumida(conn, "ingestao"):
+            logging.warning(
+                "[runner] Nenhum worker ativo consome a lane 'ingestao': a retenção não é agendada "
+                "até um worker com 'ingestao' em RQ_LANES subir.",
+            )
+    w = LaneWorker(queues, connection=conn, ponderador=ponderador)
     # max_jobs só é usado se > 0
     kwargs = {"with_scheduler": True, "burst": RQ_BURST, "logging_level": getattr(logging, LOG_LEVEL, logging.INFO)}
     if RQ_MAX_JOBS > 0:
@@ -0,0 +1,107 @@
+# apps/validador-orcamento/worker/src/stages.py
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Dict, Iterator, Optional
+
+from src.control import JobControl
+from src.memory import MemoryWatch, to_mb
+
+# Ativa o profiler para todos os jobs (útil em staging); o payload pode ativar por job.
+JOB_PROFILE = os.getenv("JOB_PROFILE", "0").lower() in ("1", "true", "yes")
+
+
+# ---------------------------------------------------------------------
+# Cronometragem por etapa
+# ---------------------------------------------------------------------
+class StageRecorder:
+    """
+    Registra duração (e contagens) de cada etapa de um job, na ordem em que ocorrem.
+
+    Uso:
+        stages = StageRecorder()
+        with stages.stage("carga_orcamento") as st:
+            a = load_orcamento(...)
+            st["rows"] = len(a)
+
+    `as_meta()` devolve {etapa: {"duration_s": ..., "rows": ...}} pronto para `job.meta`.
+    Com um `MemoryWatch`, cada etapa ganha também `peak_rss_mb` (pico de RSS na etapa)
+    e o orçamento de memória é verificado ao final dela. Com um `JobControl`, o
+    cancelamento é verificado na entrada e na saída de cada etapa e o prazo do
+    grupo da etapa passa a valer enquanto ela roda.
+    """
+
+    def __init__(self, memory: Optional[MemoryWatch] = None, control: Optional[JobControl] = None) -> None:
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self.memory = memory
+        self.control = control
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        info: Dict[str, Any] = {}
+        t0 = perf_counter()
+        if self.control is not None:
+            self.control.begin_stage(name)
+        if self.memory is not None:
+            self.memory.reset_peak(name)
+        ok = False
+        try:
+            yield info
+            ok = True
+        finally:
+            rec = {"duration_s": round(perf_counter() - t0, 3), **info}
+            if self.memory is not None:
+                rec["peak_rss_mb"] = to_mb(self.memory.peak_bytes())
+            self._stages[name] = rec
+        if ok and self.memory is not None:
+            self.memory.check()
+        if ok and self.control is not None:
+            self.control.end_stage()
+
+    def as_meta(self) -> Dict[str, Dict[str, Any]]:
+        return {k: dict(v) for k, v in self._stages.items()}
+
+
+# ---------------------------------------------------------------------
+# Profiler opcional (cProfile)
+# ---------------------------------------------------------------------
+def profiling_enabled(flag: Any = None) -> bool:
+    """Flag do payload (`profile: true`) ou variável de ambiente JOB_PROFILE."""
+    if isinstance(flag, str):
+        flag = flag.strip().lower() in ("1", "true", "yes")
+    return bool(flag) or JOB_PROFILE
+
+
+def start_profiler(enabled: bool) -> Optional[cProfile.Profile]:
+    if not enabled:
+        return None
+    prof = cProfile.Profile()
+    prof.enable()
+    return prof
+
+
+def dump_profile(prof: Optional[cProfile.Profile], artifact: Path, top: int = 60) -> Optional[Path]:
+    """
+    Encerra o profiler e grava, ao lado do artefato (nome sem '.json'/'.json.gz'):
+      - <tipo>_<job>_<ts>.prof      → dump binário (snakeviz, `python -m pstats`)
+      - <tipo>_<job>_<ts>.prof.txt  → top `top` funções por tempo cumulativo
+    Retorna o caminho do `.prof` (ou None se o profiler não estava ativo).
+    """
+    if prof is None:
+        return None
+    prof.disable()
+    stem = artifact.name[: len(artifact.name) - len("".join(artifact.suffixes))] or artifact.name
+    out = artifact.with_name(stem + ".prof")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    prof.dump_stats(str(out))
+
+    buf = io.StringIO()
+    pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(top)
+    artifact.with_name(stem + ".prof.txt").write_text(buf.getvalue(), encoding="utf-8")
+    return out
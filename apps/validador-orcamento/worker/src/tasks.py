@@ -1,15 +1,17 @@
 # apps/validador-orcamento/worker/src/tasks.py
 from __future__ import annotations
 
+import logging
+import os
 from pathlib import Path
-from typing import Union, Optional, Dict, Any
+from typing import Union, Optional, Dict, Any, List
 from datetime import datetime, timezone
 from time import perf_counter
-from rq import get_current_job
+from rq import Queue, get_current_job
 
 # loaders (preços)
-from src.cruzar_orcamento.adapters.orcamento import load_orcamento as load_orc_precos
-from src.cruzar_orcamento.adapters.sinapi import load_sinapi_ccd_pr as load_sinapi_precos
+from src.cruzar_orcamento.adapters.orcamento import load_orcamento as load_orc_precos, detectar_data_base, iter_orcamento
+from src.cruzar_orcamento.adapters.sinapi import load_sinapi_matriz, parse_localidade
 from src.cruzar_orcamento.adapters.sudecap import load_sudecap as load_sudecap_precos
 from src.cruzar_orcamento.adapters.secid import load_secid_precos
 
@@ -21,10 +23,41 @@ from src.cruzar_orcamento.adapters.estrutura_secid import load_estrutura_secid
 
 # core + export (sempre usar as versões multi)
 from src.cruzar_orcamento.core.aggregate import (
+    ComparadorPrecos,
+    chave_cruzado,
+    chave_divergencia,
     consolidar_precos_multi,
     consolidar_estrutura_multi,
+    norm_detalhe,
 )
+from src.cruzar_orcamento.core.bank_index import BankIndex
+from src.cruzar_orcamento.core.consistencia import verificar_consistencia_multi
+from src.cruzar_orcamento.core.historico import (
+    anotar_releases_provaveis,
+    carregar_release,
+    meses as historico_meses,
+    mes_do_arquivo,
+    norm_mes,
+    registrar_canon,
+    registrar_sinapi,
+    release_vigente,
+)
+from src.cruzar_orcamento.core.similarity import clamp_sim_min
+from src.cruzar_orcamento.exporters.colunar import export_colunar, norm_formato
+from src.cruzar_orcamento.utils.planilha import abrir, compartilhar
 from src.cruzar_orcamento.exporters.json_compacto import export_json
+from src.cruzar_orcamento.exporters.json_stream import (
+    SecaoOrdenada,
+    export_json_stream,
+    nova_pasta_runs,
+    remover_pasta_runs,
+)
+from src.stages import StageRecorder, profiling_enabled, start_profiler, dump_profile
+from src.memory import MemoryWatch, to_mb
+from src.control import JobControl, status_falha
+from src import metrics, retention
+
+logger = logging.getLogger(__name__)
 
 
 # ---------------------------------------------------------------------
@@ -32,6 +65,28 @@ from src.cruzar_orcamento.exporters.json_compacto import export_json
 # ---------------------------------------------------------------------
 APP_ROOT = Path("/app").resolve()
 
+# Histórico de preços (core.historico): toda release carregada é gravada aqui
+# (Parquet por banco/mês). Vazio desliga.
+HISTORY_DIR = os.getenv("HISTORY_DIR", str(APP_ROOT / "output" / "historico"))
+
+# Artefatos gravados com gzip ('.json.gz'); a API serve os bytes comprimidos direto.
+ARTIFACT_GZIP = os.getenv("ARTIFACT_GZIP", "1").lower() in ("1", "true", "yes")
+
+# Consolidação em fatias por processo (core.paralelo): processos por job (0/1 = em série;
+# "auto" = núcleos da máquina) e tamanho mínimo do orçamento (itens/pais) para usar.
+def _processos_env(raw: str) -> int:
+    raw = (raw or "").strip().lower()
+    if raw == "auto":
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(raw or 1))
+    except ValueError:
+        return 1
+
+CONSOLIDACAO_PROCESSOS = _processos_env(os.getenv("CONSOLIDACAO_PROCESSOS", "1"))
+CONSOLIDACAO_MIN_ITENS = int(os.getenv("CONSOLIDACAO_MIN_ITENS", "20000") or 20000)
+_PARALELO = dict(processos=CONSOLIDACAO_PROCESSOS, min_itens=CONSOLIDACAO_MIN_ITENS)
+
 def _norm_in(p: Union[str, Path]) -> Path:
     """Normaliza caminho de entrada. Se relativo, resolve a partir de /app."""
     p = Path(p)
@@ -67,17 +122,238 @@ def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 def _artifact_path(out_dir: Path, kind: str) -> Path:
-    """Gera nome único para o artefato: <kind>_<jobid>_<YYYYMMDDHHMMSS>.json"""
+    """Gera nome único para o artefato: <kind>_<jobid>_<YYYYMMDDHHMMSS>.json[.gz] (ARTIFACT_GZIP)"""
     job = get_current_job()
     ts = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S")
     jid = (job.id if job else "nojid")[:8]
-    fname = f"{kind}_{jid}_{ts}.json"
+    fname = f"{kind}_{jid}_{ts}.json" + (".gz" if ARTIFACT_GZIP else "")
     return (out_dir / fname).resolve()
 
+def _registrar_historico(stages: StageRecorder, releases: List[tuple]) -> None:
+    """
+    Grava as releases carregadas no histórico de preços: [(banco, arquivo, CanonDict|SinapiMatriz)].
+    O mês vem do nome do arquivo (ex.: SINAPI_2025_06.xlsx); sem mês, a release é ignorada.
+    Falha aqui não derruba o job — fica registrada na etapa `historico`.
+    """
+    if not HISTORY_DIR or not releases:
+        return
+    with stages.stage("historico") as st:
+        raiz = Path(HISTORY_DIR)
+        for banco, arquivo, dados in releases:
+            mes = mes_do_arquivo(arquivo)
+            if mes is None:
+                st.setdefault("ignorados", []).append(banco)
+                continue
+            try:
+                if banco == "SINAPI":
+                    res = registrar_sinapi(raiz, mes, dados, fonte=arquivo)
+                else:
+                    res = [registrar_canon(raiz, banco, mes, dados, fonte=arquivo)]
+            except Exception as e:
+                st.setdefault("erros", {})[banco] = str(e)
+                continue
+            st[banco.lower()] = {
+                "mes": mes,
+                "rows": sum(r["linhas"] for r in res),
+                "gravado": any(r["gravado"] for r in res),
+            }
+
+def _profile_meta(prof, artifact: Optional[Path]) -> Dict[str, Any]:
+    """Grava o profile (se ativo) ao lado do artefato e devolve {'profile': caminho} para o meta."""
+    if prof is None or artifact is None:
+        return {}
+    out = dump_profile(prof, artifact)
+    return {"profile": str(out)} if out else {}
+
 
 # ---------------------------------------------------------------------
 # Jobs
 # ---------------------------------------------------------------------
+def _export_colunar(stages: StageRecorder, payload: Dict[str, Any], artifact: Path, formato: Optional[str]) -> Dict[str, str]:
+    """Tabelas do payload em Parquet/Arrow ao lado do JSON (exporters.colunar); {} se desligado."""
+    if not formato:
+        return {}
+    with stages.stage("export_colunar") as st:
+        arquivos = export_colunar(payload, artifact, formato)
+        st["tabelas"] = len(arquivos)
+        st["bytes"] = sum(p.stat().st_size for p in arquivos.values())
+    return {k: str(p) for k, p in arquivos.items()}
+
+
+def _sinapi_localidade(uf: Optional[str], cidade: Optional[str], regime: Optional[str]) -> tuple:
+    """(regime, UF, cidade) da localidade SINAPI principal; default CCD:PR/CURITIBA."""
+    return parse_localidade({"uf": uf or "PR", "cidade": cidade or ("CURITIBA" if not uf else None), "regime": regime})
+
+
+def _sinapi_localidades(
+    extras: List[tuple],
+    matriz: Any,
+    release: Optional[Dict[str, Any]],
+) -> Dict[str, Dict[str, Any]]:
+    """{rótulo: base SINAPI} das localidades extras (da matriz ou, com data_base, da release do histórico)."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for reg, uf_x, cidade_x in extras:
+        if release is not None:
+            base_x, label_x = carregar_release(
+                Path(HISTORY_DIR), "SINAPI", release["mes"],
+                localidade=f"{reg}:{uf_x}" + (f"/{cidade_x}" if cidade_x else ""),
+            )
+        else:
+            label_x = matriz.label(matriz.localidade(uf_x, cidade_x, reg))
+            base_x = matriz.to_canon(uf_x, cidade_x, reg)
+        out[label_x] = base_x
+    return out
+
+
+
+# loaders por banco; preços SINAPI vêm da matriz (localidade), ver _carregar_bancos
+_LOADERS_PRECOS = {"SUDECAP": load_sudecap_precos, "SECID": load_secid_precos}
+_LOADERS_ESTR = {"SINAPI": load_sinapi_estr, "SUDECAP": load_sud_estr, "SECID": load_estrutura_secid}
+
+
+def _planilha(p: Path, planilhas: List[Any]) -> Any:
+    """Abre a planilha uma vez (ExcelFile compartilhado, utils.planilha) e a guarda para fechar no fim."""
+    xls = compartilhar(abrir(p))
+    planilhas.append(xls)
+    return xls
+
+
+def _carregar_bancos(
+    stages: StageRecorder,
+    arquivos: Dict[str, Optional[str]],
+    *,
+    precos: bool = False,
+    estrutura: bool = False,
+    sin_loc: Optional[tuple] = None,
+    sin_regimes: Optional[List[str]] = None,
+    planilhas: Optional[List[Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Carrega os bancos informados ({"SINAPI": arquivo, "SUDECAP": ..., "SECID": ...}):
+    preços e/ou estrutura, cada um na etapa `carga_<banco>` (a estrutura vai para
+    `carga_<banco>_estrutura` quando o job carrega os dois).
+    Preços SINAPI: matriz dos `sin_regimes` (default: o de `sin_loc`), base de `sin_loc`.
+    Com `planilhas`, SUDECAP/SECID são abertos uma vez e o mesmo ExcelFile alimenta os
+    dois loaders (ver _planilha).
+    Devolve {"precos", "estrutura", "inputs", "releases", "sinapi_matriz"}; as releases
+    (só com preços) vão para _registrar_historico.
+    """
+    out: Dict[str, Any] = {"precos": {}, "estrutura": {}, "inputs": {}, "releases": [], "sinapi_matriz": None}
+    sufixo = "" if precos and estrutura else " (preços)" if precos else " (estrutura)"
+    for banco in ("SINAPI", "SUDECAP", "SECID"):
+        if not arquivos.get(banco):
+            continue
+        p = _norm_in(arquivos[banco])
+        _ensure_exists(p, banco + sufixo)
+        etapa = f"carga_{banco.lower()}"
+        fonte: Any = p
+        if planilhas is not None and banco != "SINAPI" and precos and estrutura:
+            fonte = _planilha(p, planilhas)
+        if precos:
+            with stages.stage(etapa) as st:
+                if banco == "SINAPI":
+                    # uma leitura só: todas as UFs/cidades dos regimes pedidos
+                    matriz = load_sinapi_matriz(p, regimes=sin_regimes or [sin_loc[0]])
+                    out["precos"][banco] = matriz.to_canon(sin_loc[1], sin_loc[2], sin_loc[0])
+                    out["sinapi_matriz"] = matriz
+                    st["localidades"] = len(matriz.localidades)
+                else:
+                    out["precos"][banco] = _LOADERS_PRECOS[banco](fonte)
+                st["rows"] = len(out["precos"][banco])
+            out["releases"].append((banco, p, out["sinapi_matriz"] if banco == "SINAPI" else out["precos"][banco]))
+        if estrutura:
+            with stages.stage(etapa + "_estrutura" if precos else etapa) as st:
+                out["estrutura"][banco] = _LOADERS_ESTR[banco](fonte)
+                st["rows"] = len(out["estrutura"][banco])
+        out["inputs"][banco.lower()] = str(p)
+    return out
+
+
+class _Execucao:
+    """
+    Estado comum dos jobs de cruzamento: relógio, memória (src.memory), prazos e
+    cancelamento (src.control), etapas (src.stages) e profile. `concluir` e `falhar`
+    fazem o fechamento padrão (artefato, meta do job, métricas); `encerrar` vai no finally.
+    """
+
+    def __init__(self, kind: str, *, profile: bool, mem_budget_mb: Optional[int], prazos: Optional[Dict[str, float]]):
+        self.kind = kind
+        self.started_at = _now_iso()
+        self.t0 = perf_counter()
+        self.mem = MemoryWatch(mem_budget_mb).start()
+        self.ctl = JobControl(prazos).start()
+        self.stages = StageRecorder(memory=self.mem, control=self.ctl)
+        self.prof = start_profiler(profiling_enabled(profile))
+        self.out_dir: Optional[Path] = None
+        self.planilhas: List[Any] = []  # ExcelFile compartilhados (_planilha), fechados em encerrar
+        metrics.record_job_start(kind)
+
+    def saida(self, out_dir: Optional[Union[str, Path]]) -> Path:
+        """Normaliza e cria a pasta de saída do artefato."""
+        self.out_dir = _norm_out_dir(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        return self.out_dir
+
+    def _meta(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "finished_at": _now_iso(),
+            "duration_s": round(perf_counter() - self.t0, 3),
+            "stages": self.stages.as_meta(),
+            "mem_peak_mb": to_mb(self.mem.job_peak_bytes()),
+        }
+
+    def concluir(self, payload: Dict[str, Any], *, colunar: Optional[str] = None, streaming: bool = False) -> Dict[str, Any]:
+        """Exporta o payload (JSON + colunar), grava o meta do job e as métricas de sucesso."""
+        # o artefato leva as etapas até aqui (o meta é escrito antes do resto do JSON);
+        # export_json/export_colunar ficam só no meta do job e nas métricas
+        payload["meta"]["stages"] = self.stages.as_meta()
+
+        artifact = _artifact_path(self.out_dir, self.kind)
+        with self.stages.stage("export_json") as st:
+            artifact = (export_json_stream if streaming else export_json)(payload, artifact)
+            st["bytes"] = artifact.stat().st_size
+        arquivos_colunar = _export_colunar(self.stages, payload, artifact, colunar)
+
+        _save_meta(
+            artifact=artifact,
+            extra={
+                **self._meta(),
+                **({"colunar": arquivos_colunar} if arquivos_colunar else {}),
+                **_profile_meta(self.prof, artifact),
+            },
+        )
+        metrics.record_job_end(
+            self.kind, "finished", perf_counter() - self.t0, self.stages.as_meta(),
+            artifact_bytes=artifact.stat().st_size,
+        )
+        return {"ok": True, "artifact": str(artifact)}
+
+    def falhar(self, e: Exception) -> None:
+        """Meta e métricas do job que falhou (o chamador relança a exceção)."""
+        # o profile é só diagnóstico: uma falha ao gravá-lo não pode esconder a exceção do job
+        try:
+            perfil = _profile_meta(self.prof, _artifact_path(self.out_dir, self.kind) if self.out_dir else None)
+        except Exception:
+            logger.exception("Job %s: falha ao gravar o profile.", self.kind)
+            perfil = {}
+        _save_meta(
+            error=str(e),
+            extra={
+                **self._meta(),
+                "encerramento": status_falha(e),
+                **perfil,
+            },
+        )
+        metrics.record_job_end(self.kind, status_falha(e), perf_counter() - self.t0, self.stages.as_meta())
+
+    def encerrar(self) -> None:
+        self.ctl.stop()
+        self.mem.stop()
+        for xls in self.planilhas:
+            xls.close()
+
+
 def run_precos_auto(
     orc: str,
     sudecap: Optional[str] = None,
@@ -86,92 +362,249 @@ def run_precos_auto(
     tol_rel: float = 0.0,
     out_dir: str = "output",
     comparar_desc: bool = True,
+    desc_sim_min: float = 1.0,
+    sugestoes_k: int = 5,
+    detalhe: str = "completo",
+    uf: Optional[str] = None,
+    cidade: Optional[str] = None,
+    regime: Optional[str] = None,
+    localidades: Optional[List[Any]] = None,
+    data_base: Optional[str] = None,
+    bancos: Optional[List[str]] = None,
+    streaming: bool = False,
+    chunk_rows: int = 20_000,
+    colunar: Optional[str] = None,
+    profile: bool = False,
+    mem_budget_mb: Optional[int] = None,
+    prazos: Optional[Dict[str, float]] = None,
 ):
     """
     Cruza preços do orçamento com quaisquer bancos informados (SINAPI/SUDECAP/SECID).
     Requer: 'orc' + ao menos 1 banco. Gera '<precos>_<job>_<ts>.json' em out_dir.
+    Com `profile=True` (ou JOB_PROFILE=1) grava também '<tipo>_<job>_<ts>.prof' ao lado do JSON.
+    `mem_budget_mb` (default: JOB_MEM_BUDGET_MB) falha o job se o RSS passar do limite.
+    `prazos` ({"carga": s, "consolidacao": s, ...}; default JOB_STAGE_DEADLINES) falha a
+    etapa que passar do prazo do seu grupo; DELETE /jobs/{id} cancela o job (src.control).
+    `desc_sim_min` < 1.0 aceita descrições parecidas (ver core.similarity).
+    `sugestoes_k` códigos candidatos por CODIGO_NAO_ENCONTRADO (0 desativa).
+    SINAPI: `uf`/`cidade`/`regime` (CCD|CSD; default PR/CURITIBA/CCD) escolhem a
+    localidade principal; `localidades` (ex.: ["SP", "CSD:PR/CURITIBA"]) gera
+    comparações extras em `por_localidade`, todas da mesma leitura da planilha.
+    `data_base` ("AAAA-MM" ou "auto" = lida do cabeçalho do orçamento) compara cada
+    banco (arquivos informados + `bancos`) com a release vigente naquela data no
+    histórico de preços e aponta, em cada VALOR_DIVERGENTE, a release que melhor
+    explica o valor orçado (`release_provavel`).
+    `streaming=True` lê o orçamento em lotes de `chunk_rows` linhas, compara cada
+    lote e grava runs ordenados em disco, intercalados na exportação: a memória
+    fica limitada pelas bases + um lote, não pelo tamanho do orçamento.
+    `colunar` ("parquet" | "arrow") grava também as tabelas (cruzado, divergencias, ...)
+    em arquivos colunares ao lado do JSON (ver exporters.colunar).
+    `detalhe="divergencias"` deixa em `cruzado` só os itens divergentes (resumo exato).
     """
-    started_at = _now_iso()
-    t0 = perf_counter()
+    ex = _Execucao("precos", profile=profile, mem_budget_mb=mem_budget_mb, prazos=prazos)
+    stages = ex.stages
+    run_dir: Optional[Path] = None
     try:
         tol_rel = float(tol_rel)
     except Exception:
         tol_rel = 0.0
     tol_rel = max(0.0, min(1.0, tol_rel))
+    desc_sim_min = clamp_sim_min(desc_sim_min)
+    try:
+        sugestoes_k = max(0, int(sugestoes_k))
+    except Exception:
+        sugestoes_k = 0
+    try:
+        chunk_rows = max(1, int(chunk_rows))
+    except Exception:
+        chunk_rows = 20_000
 
     try:
         orc_p     = _norm_in(orc)
-        out_dir_p = _norm_out_dir(out_dir)
-        out_dir_p.mkdir(parents=True, exist_ok=True)
+        detalhe = norm_detalhe(detalhe)
+        colunar = norm_formato(colunar)
+        out_dir_p = ex.saida(out_dir)
 
         _ensure_exists(orc_p, "Orçamento")
-        a = load_orc_precos(orc_p)
-
-        banks: Dict[str, Dict[str, Any]] = {}
-        meta_inputs: Dict[str, Any] = {"orc": str(orc_p)}
-
-        if sinapi:
-            sinapi_p = _norm_in(sinapi)
-            _ensure_exists(sinapi_p, "SINAPI (preços)")
-            banks["SINAPI"] = load_sinapi_precos(sinapi_p)
-            meta_inputs["sinapi"] = str(sinapi_p)
-
-        if sudecap:
-            sudecap_p = _norm_in(sudecap)
-            _ensure_exists(sudecap_p, "SUDECAP (preços)")
-            banks["SUDECAP"] = load_sudecap_precos(sudecap_p)
-            meta_inputs["sudecap"] = str(sudecap_p)
-
-        if secid:
-            secid_p = _norm_in(secid)
-            _ensure_exists(secid_p, "SECID (preços)")
-            banks["SECID"] = load_secid_precos(secid_p)
-            meta_inputs["secid"] = str(secid_p)
+        a: Dict[str, Any] = {}
+        if not streaming:
+            with stages.stage("carga_orcamento") as st:
+                a = load_orc_precos(orc_p)
+                st["rows"] = len(a)
+
+        # localidade SINAPI só importa com a planilha ou com o SINAPI do histórico (data_base)
+        sin_loc: Optional[tuple] = None
+        sin_extras: List[tuple] = []
+        if sinapi or (data_base and "SINAPI" in {str(b).strip().upper() for b in (bancos or [])}):
+            sin_loc = _sinapi_localidade(uf, cidade, regime)
+            sin_extras = [parse_localidade(x) for x in (localidades or [])]
+        carga = _carregar_bancos(
+            stages, {"SINAPI": sinapi, "SUDECAP": sudecap, "SECID": secid}, precos=True,
+            sin_loc=sin_loc, sin_regimes=sorted({sin_loc[0], *(loc[0] for loc in sin_extras)}) if sin_loc else None,
+        )
+        banks: Dict[str, Dict[str, Any]] = carga["precos"]
+        meta_inputs: Dict[str, Any] = {"orc": str(orc_p), **carga["inputs"]}
+        sin_matriz = carga["sinapi_matriz"]
+        _registrar_historico(stages, carga["releases"])
+
+        # data-base: cada banco vem da release vigente no histórico (não do arquivo)
+        db_mes: Optional[str] = None
+        db_origem: Optional[str] = None
+        db_releases: Dict[str, Dict[str, Any]] = {}
+        if data_base:
+            if not HISTORY_DIR:
+                raise ValueError("data_base requer o histórico de preços (HISTORY_DIR).")
+            raiz = Path(HISTORY_DIR)
+            if str(data_base).strip().lower() == "auto":
+                with stages.stage("data_base") as st:
+                    db_mes = detectar_data_base(orc_p)
+                    st["data_base"] = db_mes
+                if db_mes is None:
+                    raise ValueError("Data-base não encontrada no cabeçalho do orçamento; informe data_base=AAAA-MM.")
+                db_origem = "orcamento"
+            else:
+                db_mes = norm_mes(data_base)
+                db_origem = "payload"
+            alvo = sorted(set(banks) | {str(b).strip().upper() for b in (bancos or [])})
+            with stages.stage("carga_historico") as st:
+                for banco in alvo:
+                    mes = release_vigente(raiz, banco, db_mes)
+                    if mes is None:
+                        registradas = ", ".join(historico_meses(raiz, banco).get(banco, [])) or "nenhuma"
+                        raise ValueError(f"{banco}: nenhuma release até {db_mes} no histórico (registradas: {registradas}).")
+                    loc = None
+                    if banco == "SINAPI":
+                        loc = f"{sin_loc[0]}:{sin_loc[1]}" + (f"/{sin_loc[2]}" if sin_loc[2] else "")
+                    banks[banco], label = carregar_release(raiz, banco, mes, localidade=loc)
+                    db_releases[banco] = {"mes": mes, **({"localidade": label} if label else {})}
+                st["rows"] = sum(len(banks[b]) for b in alvo)
+                st["releases"] = {b: r["mes"] for b, r in db_releases.items()}
 
         if not banks:
             raise ValueError("Informe ao menos um banco: SINAPI, SUDECAP ou SECID.")
 
-        # Consolidação via 'multi'
-        payload = consolidar_precos_multi(a, banks, tol_rel=tol_rel, comparar_descricao=comparar_desc)
+        # localidades SINAPI adicionais: reaproveitam a matriz já carregada
+        # (com data_base, a mesma release do histórico, outra localidade)
+        tem_localidades = "SINAPI" in banks and sin_extras and (sin_matriz is not None or "SINAPI" in db_releases)
+
+        por_localidade: Dict[str, Any] = {}
+        locs_releases = {b: r.get("localidade") for b, r in db_releases.items()}
+        if streaming:
+            run_dir = nova_pasta_runs(out_dir_p)
+            opts = dict(tol_rel=tol_rel, comparar_descricao=comparar_desc, desc_sim_min=desc_sim_min)
+            cruzado = SecaoOrdenada(run_dir, "cruzado", chave_cruzado)
+            divergencias = SecaoOrdenada(run_dir, "divergencias", chave_divergencia)
+            provaveis: Dict[str, Dict[str, int]] = {}
+
+            with stages.stage("consolidacao_stream") as st:
+                comp = ComparadorPrecos(banks, sugestoes_k=sugestoes_k, detalhe=detalhe, **opts)
+                # localidades extras só usam resumo + divergências
+                comps_x = {
+                    lb: ComparadorPrecos({"SINAPI": bx}, sugestoes_k=0, detalhe="divergencias", **opts)
+                    for lb, bx in (
+                        _sinapi_localidades(sin_extras, sin_matriz, db_releases.get("SINAPI")) if tem_localidades else {}
+                    ).items()
+                }
+                divs_x = {lb: SecaoOrdenada(run_dir, f"localidade{i}", chave_divergencia) for i, lb in enumerate(comps_x)}
+                lotes = linhas = 0
+                for lote in iter_orcamento(orc_p, chunk_rows=chunk_rows):
+                    # total do orçamento só se conhece no fim: progresso por lote
+                    ex.ctl.subetapa(lote=lotes + 1, linhas=linhas)
+                    itens, divs = comp.comparar(lote)
+                    if db_releases:
+                        for b, por_mes in anotar_releases_provaveis(Path(HISTORY_DIR), divs, locs_releases).items():
+                            for mes, n in por_mes.items():
+                                provaveis.setdefault(b, {})
+                                provaveis[b][mes] = provaveis[b].get(mes, 0) + n
+                    cruzado.extend(itens)
+                    divergencias.extend(divs)
+                    for lb, c in comps_x.items():
+                        divs_x[lb].extend(c.comparar(lote)[1])
+                    lotes += 1
+                    linhas += len(lote)
+                st["rows"] = len(cruzado)
+                st["divergencias"] = len(divergencias)
+                st["lotes"] = lotes
+
+            payload = {"meta": comp.meta(), "resumo": comp.resumo(), "cruzado": cruzado, "divergencias": divergencias}
+            if db_releases:
+                payload["resumo"]["releases_provaveis"] = {
+                    b: dict(sorted(provaveis[b].items())) for b in sorted(provaveis)
+                }
+            por_localidade = {lb: {"resumo": c.resumo(), "divergencias": divs_x[lb]} for lb, c in comps_x.items()}
+        else:
+            # Consolidação via 'multi'
+            with stages.stage("consolidacao") as st:
+                payload = consolidar_precos_multi(
+                    a, banks, tol_rel=tol_rel, comparar_descricao=comparar_desc,
+                    desc_sim_min=desc_sim_min, sugestoes_k=sugestoes_k, detalhe=detalhe, **_PARALELO,
+                )
+                st["rows"] = len(payload.get("cruzado") or [])
+                st["divergencias"] = len(payload.get("divergencias") or [])
+
+            if db_releases:
+                with stages.stage("releases_provaveis") as st:
+                    provaveis = anotar_releases_provaveis(Path(HISTORY_DIR), payload["divergencias"], locs_releases)
+                    payload["resumo"]["releases_provaveis"] = provaveis
+                    st["rows"] = sum(sum(v.values()) for v in provaveis.values())
+
+            if tem_localidades:
+                with stages.stage("consolidacao_localidades") as st:
+                    for label_x, base_x in _sinapi_localidades(sin_extras, sin_matriz, db_releases.get("SINAPI")).items():
+                        extra = consolidar_precos_multi(
+                            a, {"SINAPI": base_x},
+                            tol_rel=tol_rel, comparar_descricao=comparar_desc,
+                            desc_sim_min=desc_sim_min, sugestoes_k=0, detalhe="divergencias", **_PARALELO,
+                        )
+                        por_localidade[label_x] = {
+                            "resumo": extra["resumo"],
+                            "divergencias": extra["divergencias"],
+                        }
+                    st["rows"] = len(por_localidade)
 
         meta = {
             "kind": "precos",
             "generated_at": _now_iso(),
-            "started_at": started_at,
+            "started_at": ex.started_at,
             "inputs": meta_inputs,
             "params": {
                 "tol_rel": tol_rel,
                 "comparar_descricao": comparar_desc,
+                "desc_sim_min": desc_sim_min,
+                "sugestoes_k": sugestoes_k,
+                "detalhe": detalhe,
+                "sinapi_localidade": (
+                    db_releases["SINAPI"].get("localidade") if "SINAPI" in db_releases
+                    else sin_matriz.label(sin_matriz.localidade(sin_loc[1], sin_loc[2], sin_loc[0]))
+                    if sin_matriz is not None else None
+                ),
+                "localidades": sorted(por_localidade),
                 "bancos": sorted(banks.keys()),
+                "data_base": db_mes,
+                "data_base_origem": db_origem,
+                "releases": db_releases,
+                "streaming": bool(streaming),
             },
         }
         if isinstance(payload, dict):
             payload.setdefault("meta", meta)
         else:
             payload = {"meta": meta, "data": payload}
-
-        artifact = _artifact_path(out_dir_p, "precos")
-        artifact = export_json(payload, artifact)
-
-        _save_meta(
-            artifact=artifact,
-            extra={
-                "kind": "precos",
-                "finished_at": _now_iso(),
-                "duration_s": round(perf_counter() - t0, 3),
-            },
-        )
-        return {"ok": True, "artifact": str(artifact)}
+        if meta["params"]["sinapi_localidade"]:
+            payload["meta"]["sinapi_localidade"] = meta["params"]["sinapi_localidade"]
+        if db_mes:
+            payload["meta"]["data_base"] = db_mes
+            payload["meta"]["releases"] = db_releases
+        if por_localidade:
+            payload["por_localidade"] = por_localidade
+        return ex.concluir(payload, colunar=colunar, streaming=bool(streaming))
     except Exception as e:
-        _save_meta(
-            error=str(e),
-            extra={
-                "kind": "precos",
-                "finished_at": _now_iso(),
-                "duration_s": round(perf_counter() - t0, 3),
-            },
-        )
+        ex.falhar(e)
         raise
+    finally:
+        ex.encerrar()
+        if run_dir is not None:
+            remover_pasta_runs(run_dir)
 
 
 def run_estrutura_auto(
@@ -180,80 +613,241 @@ def run_estrutura_auto(
     sinapi: Optional[str] = None,
     secid: Optional[str] = None,
     out_dir: str = "output",
+    desc_sim_min: float = 1.0,
+    profundo: bool = False,
+    colunar: Optional[str] = None,
+    profile: bool = False,
+    mem_budget_mb: Optional[int] = None,
+    prazos: Optional[Dict[str, float]] = None,
 ):
     """
     Compara estrutura (pai + filhos 1º nível) do orçamento com quaisquer bancos (SINAPI/SUDECAP/SECID).
     Requer: 'orc' + ao menos 1 banco. Gera '<estrutura>_<job>_<ts>.json' em out_dir.
+    Com `profile=True` (ou JOB_PROFILE=1) grava também '<tipo>_<job>_<ts>.prof' ao lado do JSON.
+    `mem_budget_mb` (default: JOB_MEM_BUDGET_MB) falha o job se o RSS passar do limite.
+    `prazos` ({"carga": s, "consolidacao": s, ...}; default JOB_STAGE_DEADLINES) falha a
+    etapa que passar do prazo do seu grupo; DELETE /jobs/{id} cancela o job (src.control).
+    `desc_sim_min` < 1.0 aceita descrições de filhos parecidas (ver core.similarity).
+    `profundo=True` explode as composições até os insumos e compara folhas/coeficientes.
+    `colunar` ("parquet" | "arrow"): divergências também em arquivo colunar.
     """
-    started_at = _now_iso()
-    t0 = perf_counter()
+    ex = _Execucao("estrutura", profile=profile, mem_budget_mb=mem_budget_mb, prazos=prazos)
+    stages = ex.stages
+    desc_sim_min = clamp_sim_min(desc_sim_min)
 
     try:
         orc_p     = _norm_in(orc)
-        out_dir_p = _norm_out_dir(out_dir)
-        out_dir_p.mkdir(parents=True, exist_ok=True)
+        colunar = norm_formato(colunar)
+        ex.saida(out_dir)
 
         _ensure_exists(orc_p, "Estrutura do Orçamento")
-        a = load_orc_estr(orc_p)
-
-        banks: Dict[str, Dict[str, Any]] = {}
-        meta_inputs: Dict[str, Any] = {"orc": str(orc_p)}
-
-        if sinapi:
-            sinapi_p = _norm_in(sinapi)
-            _ensure_exists(sinapi_p, "SINAPI (estrutura)")
-            banks["SINAPI"] = load_sinapi_estr(sinapi_p)
-            meta_inputs["sinapi"] = str(sinapi_p)
+        with stages.stage("carga_orcamento") as st:
+            a = load_orc_estr(orc_p)
+            st["rows"] = len(a)
 
-        if sudecap:
-            sudecap_p = _norm_in(sudecap)
-            _ensure_exists(sudecap_p, "SUDECAP (estrutura)")
-            banks["SUDECAP"] = load_sud_estr(sudecap_p)
-            meta_inputs["sudecap"] = str(sudecap_p)
-
-        if secid:
-            secid_p = _norm_in(secid)
-            _ensure_exists(secid_p, "SECID (estrutura)")
-            banks["SECID"] = load_estrutura_secid(secid_p)
-            meta_inputs["secid"] = str(secid_p)
+        carga = _carregar_bancos(stages, {"SINAPI": sinapi, "SUDECAP": sudecap, "SECID": secid}, estrutura=True)
+        banks: Dict[str, Dict[str, Any]] = carga["estrutura"]
+        meta_inputs: Dict[str, Any] = {"orc": str(orc_p), **carga["inputs"]}
 
         if not banks:
             raise ValueError("Informe ao menos um banco: SINAPI, SUDECAP ou SECID.")
 
         # Consolidação via 'multi'
-        payload = consolidar_estrutura_multi(a, banks)
+        with stages.stage("consolidacao") as st:
+            payload = consolidar_estrutura_multi(
+                a, banks, desc_sim_min=desc_sim_min, profundo=bool(profundo), **_PARALELO,
+            )
+            st["rows"] = len(a)
+            st["divergencias"] = len(payload.get("divergencias") or [])
 
         meta = {
             "kind": "estrutura",
             "generated_at": _now_iso(),
-            "started_at": started_at,
+            "started_at": ex.started_at,
             "inputs": meta_inputs,
-            "params": {"bancos": sorted(banks.keys())},
+            "params": {"bancos": sorted(banks.keys()), "desc_sim_min": desc_sim_min, "profundo": bool(profundo)},
         }
         if isinstance(payload, dict):
             payload.setdefault("meta", meta)
         else:
             payload = {"meta": meta, "data": payload}
+        return ex.concluir(payload, colunar=colunar)
+    except Exception as e:
+        ex.falhar(e)
+        raise
+    finally:
+        ex.encerrar()
 
-        artifact = _artifact_path(out_dir_p, "estrutura")
-        artifact = export_json(payload, artifact)
 
-        _save_meta(
-            artifact=artifact,
-            extra={
-                "kind": "estrutura",
-                "finished_at": _now_iso(),
-                "duration_s": round(perf_counter() - t0, 3),
-            },
+def run_completo_auto(
+    orc: str,
+    sudecap: Optional[str] = None,
+    sinapi: Optional[str] = None,
+    secid: Optional[str] = None,
+    tol_rel: float = 0.0,
+    out_dir: str = "output",
+    comparar_desc: bool = True,
+    desc_sim_min: float = 1.0,
+    sugestoes_k: int = 5,
+    detalhe: str = "completo",
+    profundo: bool = False,
+    uf: Optional[str] = None,
+    cidade: Optional[str] = None,
+    regime: Optional[str] = None,
+    colunar: Optional[str] = None,
+    profile: bool = False,
+    mem_budget_mb: Optional[int] = None,
+    prazos: Optional[Dict[str, float]] = None,
+):
+    """
+    Job combinado: carrega as entradas num só job e gera, num só artefato
+    '<completo>_<job>_<ts>.json':
+      - `precos`       → mesmo conteúdo de run_precos_auto
+      - `estrutura`    → mesmo conteúdo de run_estrutura_auto
+      - `consistencia` → preço declarado das composições x Σ coeficiente × preço dos
+                         filhos (core.consistencia), com `tol_rel`: do orçamento (filho
+                         sem preço → preço da base) e de cada base com estrutura e preços
+    `colunar` ("parquet" | "arrow") grava as tabelas de cada seção em arquivos
+    colunares ('<artefato>.precos.cruzado.parquet', ...).
+    `detalhe="divergencias"` vale para `precos.cruzado` (ver run_precos_auto).
+    `prazos` e cancelamento: como em run_precos_auto.
+    Cada planilha é aberta uma vez e o mesmo ExcelFile alimenta os loaders de
+    preço e de estrutura (utils.planilha.compartilhar: leituras iguais de aba,
+    como a sonda e a leitura principal do orçamento, são feitas uma vez). SINAPI:
+    preços vêm das abas CCD/CSD (fórmulas, openpyxl) e a estrutura da aba
+    Analítico — abas distintas, cada uma lida uma vez.
+    """
+    ex = _Execucao("completo", profile=profile, mem_budget_mb=mem_budget_mb, prazos=prazos)
+    stages = ex.stages
+    try:
+        tol_rel = float(tol_rel)
+    except Exception:
+        tol_rel = 0.0
+    tol_rel = max(0.0, min(1.0, tol_rel))
+    desc_sim_min = clamp_sim_min(desc_sim_min)
+    try:
+        sugestoes_k = max(0, int(sugestoes_k))
+    except Exception:
+        sugestoes_k = 0
+
+    try:
+        orc_p     = _norm_in(orc)
+        detalhe = norm_detalhe(detalhe)
+        colunar = norm_formato(colunar)
+        ex.saida(out_dir)
+
+        _ensure_exists(orc_p, "Orçamento")
+        orc_x = _planilha(orc_p, ex.planilhas)
+        with stages.stage("carga_orcamento") as st:
+            a_precos = load_orc_precos(orc_x)
+            st["rows"] = len(a_precos)
+        with stages.stage("carga_orcamento_estrutura") as st:
+            a_estr = load_orc_estr(orc_x)
+            st["rows"] = len(a_estr)
+
+        sin_loc = _sinapi_localidade(uf, cidade, regime) if sinapi else None
+        carga = _carregar_bancos(
+            stages, {"SINAPI": sinapi, "SUDECAP": sudecap, "SECID": secid}, precos=True, estrutura=True,
+            sin_loc=sin_loc, planilhas=ex.planilhas,
         )
-        return {"ok": True, "artifact": str(artifact)}
-    except Exception as e:
-        _save_meta(
-            error=str(e),
-            extra={
-                "kind": "estrutura",
-                "finished_at": _now_iso(),
-                "duration_s": round(perf_counter() - t0, 3),
+        banks_precos: Dict[str, Dict[str, Any]] = carga["precos"]
+        banks_estr: Dict[str, Dict[str, Any]] = carga["estrutura"]
+        meta_inputs: Dict[str, Any] = {"orc": str(orc_p), **carga["inputs"]}
+
+        if not banks_precos:
+            raise ValueError("Informe ao menos um banco: SINAPI, SUDECAP ou SECID.")
+        _registrar_historico(stages, carga["releases"])
+
+        # índices das bases montados uma vez: consolidação de preços e consistência
+        with stages.stage("indice_bancos") as st:
+            banks_idx = {tag: BankIndex(base) for tag, base in banks_precos.items()}
+            st["rows"] = sum(len(i) for i in banks_idx.values())
+
+        with stages.stage("consolidacao_precos") as st:
+            p_precos = consolidar_precos_multi(
+                a_precos, banks_idx, tol_rel=tol_rel, comparar_descricao=comparar_desc,
+                desc_sim_min=desc_sim_min, sugestoes_k=sugestoes_k, detalhe=detalhe, **_PARALELO,
+            )
+            st["rows"] = len(p_precos.get("cruzado") or [])
+            st["divergencias"] = len(p_precos.get("divergencias") or [])
+
+        with stages.stage("consolidacao_estrutura") as st:
+            p_estr = consolidar_estrutura_multi(
+                a_estr, banks_estr, desc_sim_min=desc_sim_min, profundo=bool(profundo), **_PARALELO,
+            )
+            st["rows"] = len(a_estr)
+            st["divergencias"] = len(p_estr.get("divergencias") or [])
+
+        with stages.stage("consistencia") as st:
+            p_cons = verificar_consistencia_multi(
+                a_estr, a_precos, banks_estr, banks_precos, bancos_idx=banks_idx, tol_rel=tol_rel,
+            )
+            st["rows"] = p_cons["resumo"]["composicoes"]
+            st["divergencias"] = p_cons["resumo"]["divergentes"]
+
+        payload: Dict[str, Any] = {
+            "meta": {
+                "kind": "completo",
+                "generated_at": _now_iso(),
+                "started_at": ex.started_at,
+                "inputs": meta_inputs,
+                "params": {
+                    "tol_rel": tol_rel,
+                    "comparar_descricao": comparar_desc,
+                    "desc_sim_min": desc_sim_min,
+                    "sugestoes_k": sugestoes_k,
+                    "detalhe": detalhe,
+                    "profundo": bool(profundo),
+                    "sinapi_localidade": f"{sin_loc[0]}:{sin_loc[1]}/{sin_loc[2] or ''}" if sinapi else None,
+                    "bancos": sorted(banks_precos.keys()),
+                },
             },
-        )
+            "precos": p_precos,
+            "estrutura": p_estr,
+            "consistencia": p_cons,
+        }
+        return ex.concluir(payload, colunar=colunar)
+    except Exception as e:
+        ex.falhar(e)
+        raise
+    finally:
+        ex.encerrar()
+
+# ---------------------------------------------------------------------
+# Manutenção
+# ---------------------------------------------------------------------
+def run_retencao():
+    """
+    Retenção de OUTPUT_DIR/DATA_DIR (ver src.retention). Agendado pelo scheduler
+    do RQ a cada RETENTION_INTERVAL_S; a próxima passada é agendada antes desta
+    rodar, então uma falha aqui não interrompe o ciclo. Devolve o relatório.
+    """
+    started_at = _now_iso()
+    t0 = perf_counter()
+    job = get_current_job()
+    if job is None:
+        raise RuntimeError("run_retencao precisa rodar como job do RQ (usa a conexão Redis do job).")
+    metrics.record_job_start("retencao")
+    retention.agendar(Queue(job.origin, connection=job.connection))
+
+    try:
+        relatorio = retention.executar(job.connection)
+    except Exception as e:
+        _save_meta(error=str(e), extra={"kind": "retencao", "started_at": started_at, "finished_at": _now_iso()})
+        metrics.record_job_end("retencao", "failed", perf_counter() - t0, {})
         raise
+
+    for alvo in ("artefatos", "compactados", "uploads", "temporarios"):
+        if relatorio[alvo]["bytes"]:
+            metrics.inc("validador_retencao_bytes_total", relatorio[alvo]["bytes"], alvo=alvo)
+    _save_meta(
+        extra={
+            "kind": "retencao",
+            "started_at": started_at,
+            "finished_at": _now_iso(),
+            "duration_s": round(perf_counter() - t0, 3),
+            "bytes_recuperados": relatorio["bytes_recuperados"],
+        },
+    )
+    metrics.record_job_end("retencao", "finished", perf_counter() - t0, {})
+    return relatorio